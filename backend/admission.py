@@ -0,0 +1,204 @@
+"""
+Admission Control Module
+Bounded concurrency, request queueing with priorities, and per-client rate limits
+"""
+
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Union
+import math
+import threading
+import time
+
+
+class Rejected(Exception):
+    """Request refused by admission control"""
+
+    def __init__(self, status: int, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.status = status
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class TokenBucketLimiter:
+    """
+    Per-client token buckets.
+
+    Each client may make `burst` requests at once and `rate` requests per
+    second on average. Buckets of the least recently seen clients are
+    dropped beyond `max_clients`, which only ever makes a limit more lenient.
+    """
+
+    def __init__(self, rate: float, burst: float, max_clients: int = 10000):
+        self.rate = rate
+        self.burst = max(burst, 1.0)
+        self.max_clients = max_clients
+        self._buckets: 'OrderedDict[str, List[float]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._limited = 0
+
+    def acquire(self, client: str) -> float:
+        """
+        Take one token for client
+
+        Returns:
+            0.0 if the request is allowed, otherwise seconds until a token is available
+        """
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(client)
+            if bucket is None:
+                bucket = [self.burst, now]
+                self._buckets[client] = bucket
+                if len(self._buckets) > self.max_clients:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(client)
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+
+            if bucket[0] >= 1.0:
+                bucket[0] -= 1.0
+                return 0.0
+            self._limited += 1
+            return (1.0 - bucket[0]) / self.rate
+
+    def stats(self) -> Dict[str, object]:
+        """Tracked clients and requests refused so far"""
+        with self._lock:
+            return {'clients': len(self._buckets), 'limited': self._limited}
+
+
+class _Waiter:
+    __slots__ = ('high_priority', 'sequence', 'event', 'granted', 'displaced')
+
+    def __init__(self, high_priority: bool, sequence: int):
+        self.high_priority = high_priority
+        self.sequence = sequence
+        self.event = threading.Event()
+        self.granted = False
+        self.displaced = False
+
+    def rank(self):
+        return (not self.high_priority, self.sequence)
+
+
+class AdmissionController:
+    """
+    Limits how many requests run at once and how many wait for a slot.
+
+    Requests beyond `max_concurrent` wait in a queue of at most `max_queue`
+    entries for up to `queue_timeout` seconds, after which they are shed.
+    High-priority requests are granted slots before normal ones, and when
+    the queue is full a high-priority request takes the place of the most
+    recently queued normal request.
+    """
+
+    def __init__(self, max_concurrent: int, max_queue: int = 64, queue_timeout: float = 2.0,
+                 retry_after: int = 1):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self._active = 0
+        self._waiters: List[_Waiter] = []
+        self._sequence = 0
+        self._lock = threading.Lock()
+        self._admitted = 0
+        self._queued = 0
+        self._shed: Dict[str, int] = {'queue_full': 0, 'deadline': 0, 'displaced': 0}
+
+    def try_acquire(self) -> bool:
+        """Take a free slot without waiting; False if the request would have to queue"""
+        with self._lock:
+            if self._active < self.max_concurrent and not self._waiters:
+                self._active += 1
+                self._admitted += 1
+                return True
+            return False
+
+    def acquire(self, high_priority: Union[bool, Callable[[], bool]] = False,
+                timeout: Optional[float] = None) -> None:
+        """
+        Wait for a slot
+
+        Args:
+            high_priority: Flag, or a callable evaluated only if the request has to queue
+            timeout: Longest wait in seconds; defaults to queue_timeout
+
+        Raises:
+            Rejected: If the queue is full or no slot became free in time
+        """
+        if self.try_acquire():
+            return
+
+        if callable(high_priority):
+            high_priority = high_priority()
+
+        with self._lock:
+            # A slot may have been released while the priority was evaluated
+            if self._active < self.max_concurrent and not self._waiters:
+                self._active += 1
+                self._admitted += 1
+                return
+
+            if len(self._waiters) >= self.max_queue:
+                victim = None
+                if high_priority:
+                    normal = [waiter for waiter in self._waiters if not waiter.high_priority]
+                    victim = max(normal, key=_Waiter.rank, default=None)
+                if victim is None:
+                    self._shed['queue_full'] += 1
+                    raise Rejected(503, 'queue_full', self.retry_after)
+
+                self._waiters.remove(victim)
+                victim.displaced = True
+                victim.event.set()
+
+            self._sequence += 1
+            waiter = _Waiter(bool(high_priority), self._sequence)
+            self._waiters.append(waiter)
+            self._queued += 1
+
+        waiter.event.wait(self.queue_timeout if timeout is None else timeout)
+
+        with self._lock:
+            if waiter.granted:
+                self._admitted += 1
+                return
+            if waiter.displaced:
+                self._shed['displaced'] += 1
+                raise Rejected(503, 'displaced', self.retry_after)
+
+            self._waiters.remove(waiter)
+            self._shed['deadline'] += 1
+            raise Rejected(503, 'deadline', self.retry_after)
+
+    def release(self) -> None:
+        """Give up a slot, handing it straight to the next waiter if there is one"""
+        with self._lock:
+            if self._waiters:
+                waiter = min(self._waiters, key=_Waiter.rank)
+                self._waiters.remove(waiter)
+                waiter.granted = True
+                waiter.event.set()
+            else:
+                self._active -= 1
+
+    def stats(self) -> Dict[str, object]:
+        """Current load and running totals"""
+        with self._lock:
+            return {
+                'active': self._active,
+                'queued': len(self._waiters),
+                'max_concurrent': self.max_concurrent,
+                'max_queue': self.max_queue,
+                'admitted': self._admitted,
+                'queued_total': self._queued,
+                'shed': dict(self._shed)
+            }
+
+
+def retry_after_seconds(delay: float) -> int:
+    """Round a delay up to the whole seconds used by the Retry-After header"""
+    return max(1, math.ceil(delay))
@@ -3,172 +3,134 @@ AI Health Analysis Module
 Provides symptom analysis and health recommendations for MedBlocAI
 """
 
-from typing import Dict, List, Any
-import re
+from typing import Dict, List, Any, Optional, Sequence
+import copy
+import os
+import threading
+import time
+from analysis_cache import AnalysisCache, CacheEntry, serialize_response
+from knowledge_base import DEFAULT_KNOWLEDGE_BASE_PATH, KnowledgeBase, load_knowledge_base
+from symptom_matcher import SymptomMatch, SymptomMatcher
 
 
 class HealthAnalyzer:
     """Rule-based health analyzer for symptom assessment and recommendations"""
 
-    def __init__(self):
-        # Symptom database with severity levels and recommendations
-        self.symptom_database = {
-            # Respiratory symptoms
-            'cough': {
-                'category': 'respiratory',
-                'severity': 'mild',
-                'common_causes': ['Common cold', 'Allergies', 'Bronchitis', 'Post-nasal drip'],
-                'recommendations': [
-                    'Stay hydrated with warm fluids',
-                    'Get adequate rest (7-9 hours)',
-                    'Use honey to soothe throat',
-                    'Avoid irritants like smoke',
-                    'Consult doctor if persists over 2 weeks or worsens'
-                ],
-                'red_flags': ['Blood in cough', 'High fever', 'Chest pain', 'Difficulty breathing']
-            },
-            'fever': {
-                'category': 'general',
-                'severity': 'moderate',
-                'common_causes': ['Viral infection', 'Bacterial infection', 'Flu', 'COVID-19'],
-                'recommendations': [
-                    'Monitor temperature every 4-6 hours',
-                    'Stay well hydrated with water and electrolytes',
-                    'Rest in a cool environment',
-                    'Take fever reducers as directed',
-                    'Seek medical care if fever exceeds 39°C (102.2°F) or persists'
-                ],
-                'red_flags': ['Fever above 40°C', 'Confusion', 'Severe headache', 'Stiff neck', 'Difficulty breathing']
-            },
-            'headache': {
-                'category': 'neurological',
-                'severity': 'mild',
-                'common_causes': ['Tension', 'Dehydration', 'Migraine', 'Eye strain', 'Stress'],
-                'recommendations': [
-                    'Rest in a quiet, dark room',
-                    'Stay hydrated',
-                    'Apply cold or warm compress',
-                    'Practice relaxation techniques',
-                    'Limit screen time and bright lights'
-                ],
-                'red_flags': ['Sudden severe headache', 'Visual disturbances', 'Fever with stiff neck', 'Head injury']
-            },
-            'chest pain': {
-                'category': 'cardiovascular',
-                'severity': 'high',
-                'common_causes': ['Heart attack', 'Angina', 'Anxiety', 'Muscle strain', 'Acid reflux'],
-                'recommendations': [
-                    '⚠️ SEEK IMMEDIATE MEDICAL ATTENTION',
-                    'Call emergency services (911/112)',
-                    'Do not drive yourself to hospital',
-                    'Sit down and stay calm',
-                    'Chew aspirin if available and not allergic'
-                ],
-                'red_flags': ['Pressure/squeezing sensation', 'Pain radiating to arm/jaw', 'Shortness of breath', 'Nausea/sweating']
-            },
-            'fatigue': {
-                'category': 'general',
-                'severity': 'mild',
-                'common_causes': ['Lack of sleep', 'Stress', 'Anemia', 'Thyroid issues', 'Depression', 'Poor nutrition'],
-                'recommendations': [
-                    'Ensure 7-9 hours of quality sleep',
-                    'Maintain balanced diet rich in iron and vitamins',
-                    'Regular moderate exercise',
-                    'Manage stress levels',
-                    'Consult doctor if persistent despite lifestyle changes'
-                ],
-                'red_flags': ['Extreme exhaustion', 'Unexplained weight loss', 'Shortness of breath', 'Persistent despite rest']
-            },
-            'nausea': {
-                'category': 'digestive',
-                'severity': 'mild',
-                'common_causes': ['Food poisoning', 'Pregnancy', 'Gastritis', 'Anxiety', 'Medications'],
-                'recommendations': [
-                    'Sip clear fluids slowly (water, ginger tea)',
-                    'Eat bland foods (BRAT diet: bananas, rice, applesauce, toast)',
-                    'Avoid strong odors and greasy foods',
-                    'Rest in upright position',
-                    'Seek care if unable to keep fluids down for 24 hours'
-                ],
-                'red_flags': ['Severe abdominal pain', 'Blood in vomit', 'Signs of dehydration', 'High fever']
-            },
-            'shortness of breath': {
-                'category': 'respiratory',
-                'severity': 'high',
-                'common_causes': ['Asthma', 'Anxiety', 'Heart failure', 'COVID-19', 'Pneumonia', 'Pulmonary embolism'],
-                'recommendations': [
-                    'Sit upright and stay calm',
-                    'Seek medical attention if severe or sudden',
-                    'Use prescribed inhaler if available',
-                    'Loosen tight clothing',
-                    'Call emergency if lips/skin turn blue'
-                ],
-                'red_flags': ['Blue lips/fingernails', 'Chest pain', 'Confusion', 'Rapid breathing', 'Sudden onset']
-            },
-            'dizziness': {
-                'category': 'neurological',
-                'severity': 'moderate',
-                'common_causes': ['Dehydration', 'Low blood pressure', 'Inner ear problems', 'Medications', 'Anemia'],
-                'recommendations': [
-                    'Sit or lie down immediately',
-                    'Stay hydrated with water and electrolytes',
-                    'Avoid sudden movements',
-                    'Rise slowly from sitting/lying',
-                    'Consult doctor if recurring or severe'
-                ],
-                'red_flags': ['Chest pain', 'Confusion', 'Double vision', 'Slurred speech', 'Severe headache']
-            },
-            'stomach pain': {
-                'category': 'digestive',
-                'severity': 'moderate',
-                'common_causes': ['Indigestion', 'Gas', 'Gastritis', 'Appendicitis', 'Kidney stones', 'Ulcer'],
-                'recommendations': [
-                    'Note pain location, intensity, and duration',
-                    'Avoid solid foods if pain is severe',
-                    'Stay hydrated',
-                    'Apply heating pad for mild cramping',
-                    'Seek immediate care if severe or worsening'
-                ],
-                'red_flags': ['Severe sharp pain', 'Blood in stool/vomit', 'Fever', 'Pain in lower right abdomen']
-            },
-            'sore throat': {
-                'category': 'respiratory',
-                'severity': 'mild',
-                'common_causes': ['Viral infection', 'Strep throat', 'Allergies', 'Dry air', 'Acid reflux'],
-                'recommendations': [
-                    'Gargle with warm salt water',
-                    'Stay hydrated with warm liquids',
-                    'Use throat lozenges or honey',
-                    'Rest your voice',
-                    'Consult doctor if persists over 5 days or severe'
-                ],
-                'red_flags': ['Difficulty swallowing', 'Difficulty breathing', 'High fever', 'Swollen glands', 'White patches']
-            }
-        }
+    def __init__(self, knowledge_base_path: Optional[str] = None, cache_size: int = 1024, stage_latency=None,
+                 shared_cache=None):
+        # Symptom database, tips and severity levels live in an external data
+        # file, compiled into an immutable snapshot that reloads swap atomically
+        self.knowledge_base_path = knowledge_base_path or DEFAULT_KNOWLEDGE_BASE_PATH
+        self.knowledge_base: KnowledgeBase = load_knowledge_base(self.knowledge_base_path)
+        self._knowledge_base_mtime = _get_mtime(self.knowledge_base_path)
+        self._reload_lock = threading.Lock()
 
-        # Severity priority mapping
-        self.severity_priority = {
-            'high': 3,
-            'moderate': 2,
-            'mild': 1
-        }
+        # Analyses depend only on the detected symptom set, so cache them by it.
+        # The knowledge base version is part of the key so entries built against
+        # a replaced snapshot can never be served. The version is a content hash,
+        # so the key also means the same thing in every worker of a shared tier.
+        self.cache = AnalysisCache(max_size=cache_size, shared=shared_cache)
+
+        # Vectorized batch scorer, built on first use for the current snapshot
+        self._batch_scorer = None
+
+        # Optional per-stage latency histogram (metrics.Histogram labelled by stage)
+        self._extract_latency = stage_latency.labels('extract') if stage_latency else None
+        self._aggregate_latency = stage_latency.labels('aggregate') if stage_latency else None
+        self._serialize_latency = stage_latency.labels('serialize') if stage_latency else None
+
+    @property
+    def symptom_database(self):
+        """Read-only view of the current symptom entries"""
+        return self.knowledge_base.symptom_database
+
+    @property
+    def severity_priority(self) -> Dict[str, int]:
+        """Severity name to priority mapping"""
+        return {name: level.priority for name, level in self.knowledge_base.severity_levels.items()}
+
+    @property
+    def matcher(self) -> SymptomMatcher:
+        """Whole-word matcher over the current symptom vocabulary"""
+        return self.knowledge_base.matcher
+
+    def set_knowledge_base(self, knowledge_base: KnowledgeBase) -> bool:
+        """
+        Atomically swap in a compiled knowledge base snapshot
+
+        Returns:
+            True if the content changed, False if it was already current
+        """
+        if knowledge_base.version == self.knowledge_base.version:
+            return False
+
+        # A single reference assignment; in-flight requests keep the snapshot they hold
+        self.knowledge_base = knowledge_base
+        self.cache.clear()
+        return True
+
+    def reload(self, path: Optional[str] = None) -> bool:
+        """
+        Reload the knowledge base data file without blocking readers
+
+        Args:
+            path: Data file to load; defaults to the current path
+
+        Returns:
+            True if new content was swapped in
+
+        Raises:
+            ValueError: If the file is invalid; the current snapshot stays active
+        """
+        with self._reload_lock:
+            path = path or self.knowledge_base_path
+            mtime = _get_mtime(path)
+            knowledge_base = load_knowledge_base(path)
+
+            self.knowledge_base_path = path
+            self._knowledge_base_mtime = mtime
+            return self.set_knowledge_base(knowledge_base)
+
+    def reload_if_modified(self) -> bool:
+        """Reload the data file if it changed on disk; never waits on another reload"""
+        if _get_mtime(self.knowledge_base_path) == self._knowledge_base_mtime:
+            return False
+
+        if not self._reload_lock.acquire(blocking=False):
+            return False
+        try:
+            mtime = _get_mtime(self.knowledge_base_path)
+            knowledge_base = load_knowledge_base(self.knowledge_base_path)
+            self._knowledge_base_mtime = mtime
+            return self.set_knowledge_base(knowledge_base)
+        finally:
+            self._reload_lock.release()
 
     def extract_symptoms(self, text: str) -> List[str]:
         """Extract symptoms from user input text"""
         if not text or not isinstance(text, str):
             return []
 
-        text_lower = text.lower()
-        found_symptoms = []
+        # Single scan of the text; results keep symptom database order
+        return self.knowledge_base.matcher.extract(text)
 
-        # Check for each symptom in the database
-        for symptom in self.symptom_database.keys():
-            # Match whole words to avoid partial matches
-            pattern = r'\b' + re.escape(symptom) + r'\b'
-            if re.search(pattern, text_lower):
-                found_symptoms.append(symptom)
+    def find_symptom_matches(self, text: str) -> List[SymptomMatch]:
+        """Locate every symptom mention in user input text, with positions"""
+        if not text or not isinstance(text, str):
+            return []
+
+        return self.knowledge_base.matcher.find_matches(text)
 
-        return found_symptoms
+    def get_severity_priority(self, text: str) -> int:
+        """Highest severity priority among the symptoms in text, 0 if none are found"""
+        if not text or not isinstance(text, str):
+            return 0
+
+        knowledge_base = self.knowledge_base
+        return max(
+            (knowledge_base.symptoms[symptom].severity_priority for symptom in knowledge_base.matcher.extract(text)),
+            default=0
+        )
 
     def analyze_symptoms(self, symptoms_input: str) -> Dict[str, Any]:
         """
@@ -186,9 +148,67 @@ class HealthAnalyzer:
                 'error': 'Invalid input. Please provide a symptom description.'
             }
 
-        # Extract symptoms from text
-        detected_symptoms = self.extract_symptoms(symptoms_input)
+        # Deep copy: the cached result is shared with every other request for the same symptoms
+        return copy.deepcopy(self._get_analysis_entry(symptoms_input).result)
+
+    def analyze_symptoms_entry(self, symptoms_input: str) -> CacheEntry:
+        """Cached analysis of a non-empty description, with both its result and serialized body"""
+        return self._get_analysis_entry(symptoms_input)
+
+    def analyze_symptoms_json(self, symptoms_input: str) -> bytes:
+        """Analyze symptoms and return the response body as serialized JSON"""
+        if not symptoms_input or not isinstance(symptoms_input, str):
+            return serialize_response(self.analyze_symptoms(symptoms_input))
+
+        entry = self._get_analysis_entry(symptoms_input)
+        if self._serialize_latency is None:
+            return entry.body
+
+        # Serialization only happens on the first request for a cache entry
+        started = time.perf_counter()
+        body = entry.body
+        self._serialize_latency.observe(time.perf_counter() - started)
+        return body
+
+    def analyze_detected(self, knowledge_base: KnowledgeBase, detected_symptoms: tuple) -> Dict[str, Any]:
+        """Analysis for symptoms already extracted against a knowledge base snapshot"""
+        return copy.deepcopy(self._get_detected_entry(knowledge_base, detected_symptoms).result)
+
+    def analyze_detected_json(self, knowledge_base: KnowledgeBase, detected_symptoms: tuple) -> bytes:
+        """Serialized analysis for symptoms already extracted against a knowledge base snapshot"""
+        return self._get_detected_entry(knowledge_base, detected_symptoms).body
+
+    def _get_detected_entry(self, knowledge_base: KnowledgeBase, detected_symptoms: tuple) -> CacheEntry:
+        return self.cache.get_or_build(
+            (knowledge_base.version, detected_symptoms),
+            lambda: self._timed_build_analysis(knowledge_base, detected_symptoms)
+        )
+
+    def _get_analysis_entry(self, symptoms_input: str) -> CacheEntry:
+        """Look up or assemble the cached analysis for the symptoms in the input"""
+        # Hold one snapshot for the whole request so a reload cannot mix versions
+        knowledge_base = self.knowledge_base
+
+        # Extract symptoms from text; the list is already in canonical database order
+        started = time.perf_counter()
+        detected_symptoms = tuple(knowledge_base.matcher.extract(symptoms_input))
+        if self._extract_latency is not None:
+            self._extract_latency.observe(time.perf_counter() - started)
+
+        return self._get_detected_entry(knowledge_base, detected_symptoms)
+
+    def _timed_build_analysis(self, knowledge_base: KnowledgeBase, detected_symptoms: tuple) -> Dict[str, Any]:
+        """Build an analysis on a cache miss, recording its latency if enabled"""
+        if self._aggregate_latency is None:
+            return self._build_analysis(knowledge_base, detected_symptoms)
+
+        started = time.perf_counter()
+        result = self._build_analysis(knowledge_base, detected_symptoms)
+        self._aggregate_latency.observe(time.perf_counter() - started)
+        return result
 
+    def _build_analysis(self, knowledge_base: KnowledgeBase, detected_symptoms: tuple) -> Dict[str, Any]:
+        """Assemble the full analysis for a set of detected symptoms"""
         if not detected_symptoms:
             return {
                 'success': True,
@@ -208,49 +228,42 @@ class HealthAnalyzer:
             }
 
         # Analyze detected symptoms
-        max_severity = 'mild'
+        max_severity = None
         max_severity_priority = 0
-        all_categories = set()
+        all_categories = {}
         all_causes = []
         all_recommendations = []
         all_red_flags = []
         symptom_details = []
 
         for symptom in detected_symptoms:
-            info = self.symptom_database[symptom]
-            severity_priority = self.severity_priority[info['severity']]
+            info = knowledge_base.symptoms[symptom]
 
-            if severity_priority > max_severity_priority:
-                max_severity_priority = severity_priority
-                max_severity = info['severity']
+            if info.severity_priority > max_severity_priority:
+                max_severity_priority = info.severity_priority
+                max_severity = info.severity
 
-            all_categories.add(info['category'])
-            all_causes.extend(info['common_causes'])
-            all_recommendations.extend(info['recommendations'])
-            all_red_flags.extend(info.get('red_flags', []))
+            all_categories[info.category] = None
+            all_causes.extend(info.common_causes)
+            all_recommendations.extend(info.recommendations)
+            all_red_flags.extend(info.red_flags)
 
             symptom_details.append({
                 'symptom': symptom,
-                'category': info['category'],
-                'severity': info['severity'],
-                'common_causes': info['common_causes'][:3]  # Top 3 causes per symptom
+                'category': info.category,
+                'severity': info.severity,
+                'common_causes': list(info.common_causes[:3])  # Top 3 causes per symptom
             })
 
-        # Remove duplicates while preserving order
+        # Remove duplicates while preserving order, so output is identical in every process
         unique_recommendations = list(dict.fromkeys(all_recommendations))
         unique_causes = list(dict.fromkeys(all_causes))
         unique_red_flags = list(dict.fromkeys(all_red_flags))
 
-        # Determine urgency message
-        if max_severity == 'high':
-            urgency_message = '🚨 HIGH PRIORITY: These symptoms may require immediate medical attention. Please seek emergency care.'
-            urgency_level = 'high'
-        elif max_severity == 'moderate':
-            urgency_message = '⚠️ MODERATE: Monitor symptoms closely and consult a healthcare provider if they worsen or persist.'
-            urgency_level = 'moderate'
-        else:
-            urgency_message = 'ℹ️ MILD: Generally manageable with self-care, but consult a doctor if symptoms persist or worsen.'
-            urgency_level = 'low'
+        # Urgency level and message are precomputed per severity in the knowledge base
+        severity_level = knowledge_base.severity_levels[max_severity]
+        urgency_message = severity_level.message
+        urgency_level = severity_level.urgency
 
         # Generate summary
         symptom_count = len(detected_symptoms)
@@ -273,71 +286,31 @@ class HealthAnalyzer:
             'disclaimer': '⚕️ IMPORTANT: This is an AI-powered analysis and NOT a substitute for professional medical advice, diagnosis, or treatment. Always consult a qualified healthcare provider for medical concerns.'
         }
 
+    def score_batch(self, texts: Sequence[str]):
+        """
+        Score many texts at once with vectorized aggregation
+
+        Args:
+            texts: Symptom descriptions
+
+        Returns:
+            batch_scoring.BatchScores with a sparse text x symptom incidence
+            matrix, per-text max severity, urgency and affected-category masks
+        """
+        # Imported here so the web API does not load NumPy unless batch mode is used
+        from batch_scoring import BatchScorer
+
+        knowledge_base = self.knowledge_base
+        scorer = self._batch_scorer
+        if scorer is None or scorer.knowledge_base is not knowledge_base:
+            scorer = BatchScorer(knowledge_base)
+            self._batch_scorer = scorer
+
+        return scorer.score(texts)
+
     def get_health_tips(self, category: str = 'general') -> Dict[str, Any]:
         """Get general health tips by category"""
-        tips_database = {
-            'general': {
-                'title': 'General Health & Wellness',
-                'tips': [
-                    'Drink 8 glasses (2 liters) of water daily',
-                    'Get 7-9 hours of quality sleep each night',
-                    'Exercise at least 30 minutes daily, 5 days a week',
-                    'Eat a balanced diet with plenty of fruits and vegetables',
-                    'Schedule regular health check-ups and screenings',
-                    'Manage stress through meditation or relaxation techniques',
-                    'Limit alcohol consumption and avoid smoking',
-                    'Maintain healthy weight through diet and exercise'
-                ]
-            },
-            'respiratory': {
-                'title': 'Respiratory Health',
-                'tips': [
-                    'Avoid smoking and secondhand smoke exposure',
-                    'Practice deep breathing exercises daily',
-                    'Maintain good indoor air quality',
-                    'Stay up to date with vaccinations (flu, pneumonia)',
-                    'Exercise regularly to improve lung capacity',
-                    'Use proper ventilation in enclosed spaces',
-                    'Wear masks in polluted or dusty environments'
-                ]
-            },
-            'cardiovascular': {
-                'title': 'Heart Health',
-                'tips': [
-                    'Monitor blood pressure regularly',
-                    'Limit salt and saturated fat intake',
-                    'Manage stress through relaxation techniques',
-                    'Stay physically active with aerobic exercise',
-                    'Maintain healthy cholesterol levels',
-                    'Avoid smoking and limit alcohol',
-                    'Get regular heart health screenings'
-                ]
-            },
-            'digestive': {
-                'title': 'Digestive Health',
-                'tips': [
-                    'Eat fiber-rich foods (whole grains, vegetables)',
-                    'Practice portion control at meals',
-                    'Stay hydrated throughout the day',
-                    'Avoid late-night heavy meals',
-                    'Include probiotics in your diet',
-                    'Chew food thoroughly and eat slowly',
-                    'Limit processed and fatty foods'
-                ]
-            },
-            'neurological': {
-                'title': 'Brain & Nervous System Health',
-                'tips': [
-                    'Get quality sleep for brain recovery',
-                    'Engage in mental exercises and learning',
-                    'Manage stress and practice mindfulness',
-                    'Stay socially connected',
-                    'Protect your head during activities',
-                    'Limit alcohol and avoid drugs',
-                    'Eat brain-healthy foods (omega-3, antioxidants)'
-                ]
-            }
-        }
+        tips_database = self.knowledge_base.tips
 
         category = category.lower()
         tips_data = tips_database.get(category, tips_database['general'])
@@ -345,6 +318,14 @@ class HealthAnalyzer:
         return {
             'success': True,
             'category': category,
-            'title': tips_data['title'],
-            'tips': tips_data['tips']
+            'title': tips_data.title,
+            'tips': list(tips_data.tips)
         }
+
+
+def _get_mtime(path: str) -> Optional[float]:
+    """Modification time of a file, or None if it cannot be read"""
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
@@ -0,0 +1,123 @@
+"""
+Analysis Cache Module
+Size-bounded LRU cache for assembled symptom analyses, optionally backed by a shared tier
+"""
+
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+import json
+import threading
+
+
+def serialize_response(payload: Dict[str, Any]) -> bytes:
+    """Serialize a response body exactly as Flask's jsonify does in production"""
+    return (json.dumps(payload, ensure_ascii=True, sort_keys=True, separators=(',', ':')) + '\n').encode('utf-8')
+
+
+class CacheEntry:
+    """Cached analysis with its lazily serialized JSON body"""
+
+    __slots__ = ('_result', '_body')
+
+    def __init__(self, result: Dict[str, Any]):
+        self._result: Optional[Dict[str, Any]] = result
+        self._body: Optional[bytes] = None
+
+    @classmethod
+    def from_body(cls, body: bytes) -> 'CacheEntry':
+        """Entry for a body serialized elsewhere, decoded only if the result is needed"""
+        entry = cls.__new__(cls)
+        entry._result = None
+        entry._body = body
+        return entry
+
+    @property
+    def result(self) -> Dict[str, Any]:
+        if self._result is None:
+            self._result = json.loads(self._body)
+        return self._result
+
+    @property
+    def body(self) -> bytes:
+        if self._body is None:
+            self._body = serialize_response(self.result)
+        return self._body
+
+
+class AnalysisCache:
+    """
+    Thread-safe LRU cache keyed on the canonical detected-symptom set.
+
+    With a shared tier (shared_cache.SharedTier), local misses look for the
+    serialized body there before building, and bodies built here are stored
+    there for the other workers.
+    """
+
+    def __init__(self, max_size: int = 1024, shared=None):
+        self.max_size = max_size
+        self.shared = shared
+        self._entries: 'OrderedDict[Hashable, CacheEntry]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_or_build(self, key: Hashable, build: Callable[[], Dict[str, Any]]) -> CacheEntry:
+        """Return the cached entry for key, building and storing it on a miss"""
+        if self.max_size <= 0:
+            with self._lock:
+                self.misses += 1
+            return self._load(key, build)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            self.misses += 1
+
+        # Build outside the lock; a concurrent miss on the same key only wastes work
+        entry = self._load(key, build)
+
+        with self._lock:
+            existing = self._entries.get(key)
+            if existing is not None:
+                return existing
+
+            self._entries[key] = entry
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+        return entry
+
+    def _load(self, key: Hashable, build: Callable[[], Dict[str, Any]]) -> CacheEntry:
+        """Fetch the entry from the shared tier, or build it"""
+        if self.shared is None:
+            return CacheEntry(build())
+
+        built = []
+
+        def build_body() -> bytes:
+            entry = CacheEntry(build())
+            built.append(entry)
+            return entry.body
+
+        body = self.shared.get_or_build(key, build_body)
+        return built[0] if built else CacheEntry.from_body(body)
+
+    def clear(self) -> None:
+        """Drop all entries, e.g. after the symptom database changes"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """Return hit/miss/eviction counters and current size"""
+        return {
+            'size': len(self._entries),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions
+        }
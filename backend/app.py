@@ -3,11 +3,36 @@ MedBlocAI Backend API
 Flask REST API for AI-powered health analysis
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, send_file, stream_with_context
 from flask_cors import CORS
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.formparser import FormDataParser
+from werkzeug.wsgi import LimitedStream
 from dotenv import load_dotenv
+import hmac
+import json
 import os
+import re
+import secrets
+import signal
+import sqlite3
+import threading
+import time
 from ai_model import HealthAnalyzer
+from analysis_cache import serialize_response
+import metrics
+from admission import AdmissionController, Rejected, TokenBucketLimiter, retry_after_seconds
+from patient_timeline import PatientTimelineStore
+from record_store import RecordStore
+from shared_cache import SharedTier, open_backend
+from http_pool import UpstreamError
+from ipfs_proxy import CID_PATTERN, IMMUTABLE_CACHE_CONTROL, IpfsDiskCache, IpfsGateway, content_headers
+from ipfs_upload import IpfsUploader, PinningClient, PinRegistry, UploadSpool
+from live_analysis import CLOSED_EVENT, KEEPALIVE, EditConflict, LiveSessionStore
+from profiling import RequestProfiler
+from static_responses import StaticResponse, build_static_responses
+from stream_analysis import StreamAnalysis
+from traffic_capture import TrafficAnonymizer, TrafficCapture
 
 # Load environment variables
 load_dotenv()
@@ -19,29 +44,565 @@ app = Flask(__name__)
 allowed_origins = os.getenv('ALLOWED_ORIGINS', 'http://localhost:5173').split(',')
 CORS(app, resources={r"/api/*": {"origins": allowed_origins}})
 
+# Built-in instrumentation, exposed in Prometheus format on /metrics
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'True').lower() == 'true'
+registry = metrics.Registry()
+REQUEST_COUNT = registry.counter(
+    'medblocai_http_requests', 'HTTP requests by endpoint, method and status', ['endpoint', 'method', 'status']
+)
+REQUEST_LATENCY = registry.histogram(
+    'medblocai_http_request_duration_seconds', 'Time to produce a response, by endpoint', ['endpoint']
+)
+REQUEST_BODY_SIZE = registry.histogram(
+    'medblocai_http_request_body_bytes', 'Request body sizes, by endpoint', ['endpoint'], buckets=metrics.SIZE_BUCKETS
+)
+STAGE_LATENCY = registry.histogram(
+    'medblocai_analysis_stage_duration_seconds', 'Time spent in each symptom analysis stage', ['stage']
+)
+ANALYSIS_INPUT_SIZE = registry.histogram(
+    'medblocai_analysis_input_chars', 'Length of analyzed symptom descriptions', buckets=metrics.SIZE_BUCKETS
+)
+PARSE_LATENCY = STAGE_LATENCY.labels('parse')
+
+# Analysis cache tier shared by all workers, behind each worker's own LRU;
+# shm:///dev/shm/<name> for one host, redis://host:port/db across hosts
+SHARED_CACHE_URL = os.getenv('SHARED_CACHE_URL', '')
+SHARED_CACHE_MAX_VALUE_BYTES = int(os.getenv('SHARED_CACHE_MAX_VALUE_BYTES', 16384))
+
+shared_cache = None
+if SHARED_CACHE_URL:
+    try:
+        shared_cache = SharedTier(
+            open_backend(
+                SHARED_CACHE_URL,
+                max_bytes=int(os.getenv('SHARED_CACHE_MAX_BYTES', 64 * 1024 ** 2)),
+                max_value_bytes=SHARED_CACHE_MAX_VALUE_BYTES,
+                timeout=float(os.getenv('SHARED_CACHE_TIMEOUT', 0.05))
+            ),
+            ttl=float(os.getenv('SHARED_CACHE_TTL', 300)),
+            max_value_bytes=SHARED_CACHE_MAX_VALUE_BYTES,
+            stampede_wait=float(os.getenv('SHARED_CACHE_STAMPEDE_WAIT', 0.05)),
+            retry_interval=float(os.getenv('SHARED_CACHE_RETRY_INTERVAL', 5))
+        )
+    except (OSError, ValueError) as e:
+        app.logger.warning(f"Shared analysis cache disabled: {str(e)}")
+
 # Initialize AI analyzer
-analyzer = HealthAnalyzer()
+analyzer = HealthAnalyzer(
+    knowledge_base_path=os.getenv('KNOWLEDGE_BASE_PATH') or None,
+    cache_size=int(os.getenv('ANALYSIS_CACHE_SIZE', 1024)),
+    stage_latency=STAGE_LATENCY if METRICS_ENABLED else None,
+    shared_cache=shared_cache
+)
+
+
+def collect_cache_metrics():
+    """Report analysis cache statistics at scrape time"""
+    stats = analyzer.cache.stats()
+    lines = metrics.gauge_lines(
+        'medblocai_analysis_cache_entries', 'Entries in the analysis cache', {(): stats['size']}
+    )
+    for name in ('hits', 'misses', 'evictions'):
+        lines.extend(metrics.gauge_lines(
+            f'medblocai_analysis_cache_{name}_total', f'Analysis cache {name}', {(): stats[name]}, 'counter'
+        ))
+    return lines
+
+
+registry.add_collector(collect_cache_metrics)
+
+
+def collect_shared_cache_metrics():
+    """Report shared analysis cache statistics at scrape time"""
+    if shared_cache is None:
+        return []
+    stats = shared_cache.stats()
+    lines = metrics.gauge_lines(
+        'medblocai_shared_cache_available', 'Whether the shared analysis cache is in use', {(): stats['available']}
+    )
+    for name in ('hits', 'misses', 'waits', 'stores', 'oversized', 'errors', 'bypasses'):
+        lines.extend(metrics.gauge_lines(
+            f'medblocai_shared_cache_{name}_total', f'Shared analysis cache {name}', {(): stats[name]}, 'counter'
+        ))
+    return lines
+
+
+registry.add_collector(collect_shared_cache_metrics)
+
+# Knowledge base hot reload settings
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN', '')
+KNOWLEDGE_BASE_CHECK_INTERVAL = float(os.getenv('KNOWLEDGE_BASE_CHECK_INTERVAL', 0))
+_next_knowledge_base_check = 0.0
+
+# Request profiling is opt-in; once on, requests are profiled when sampled or
+# when they send X-Profile: 1 with a valid X-Admin-Token
+PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', 'False').lower() == 'true'
+request_profiler = None
+if PROFILING_ENABLED:
+    request_profiler = RequestProfiler(
+        os.getenv('PROFILE_DIR', 'profiles'),
+        sample_rate=float(os.getenv('PROFILE_SAMPLE_RATE', 0)),
+        max_profiles=int(os.getenv('PROFILE_BUFFER_SIZE', 50)),
+        token=ADMIN_TOKEN
+    )
+    app.wsgi_app = request_profiler.wrap(app.wsgi_app)
+
+# Traffic capture is opt-in; once on, anonymized analyze, tips and symptoms
+# requests are written to CAPTURE_DIR for replay.py
+TRAFFIC_CAPTURE_ENABLED = os.getenv('TRAFFIC_CAPTURE_ENABLED', 'False').lower() == 'true'
+traffic_capture = None
+if TRAFFIC_CAPTURE_ENABLED:
+    # Without a fixed key, patient pseudonyms change whenever the app restarts
+    CAPTURE_KEY = os.getenv('CAPTURE_KEY', '').encode('utf-8') or secrets.token_bytes(32)
+    traffic_capture = TrafficCapture(
+        os.getenv('CAPTURE_DIR', 'captures'),
+        TrafficAnonymizer(lambda: analyzer.knowledge_base, CAPTURE_KEY),
+        sample_rate=float(os.getenv('CAPTURE_SAMPLE_RATE', 1)),
+        max_bytes=int(os.getenv('CAPTURE_MAX_BYTES', 100 * 1024 ** 2))
+    )
+
+
+def collect_capture_metrics():
+    """Report traffic capture statistics at scrape time"""
+    if traffic_capture is None:
+        return []
+    stats = traffic_capture.stats()
+    return (
+        metrics.gauge_lines(
+            'medblocai_capture_requests_total', 'Requests written to the traffic capture', {(): stats['recorded']},
+            'counter'
+        )
+        + metrics.gauge_lines(
+            'medblocai_capture_dropped_total', 'Requests not captured because the queue or file was full',
+            {(): stats['dropped']}, 'counter'
+        )
+        + metrics.gauge_lines(
+            'medblocai_capture_bytes', 'Size of this worker\'s capture file', {(): stats['bytes']}
+        )
+    )
+
+
+registry.add_collector(collect_capture_metrics)
+
+# Admission control for /api/* routes; a limit of 0 turns that check off
+ADMISSION_MAX_CONCURRENT = int(os.getenv('ADMISSION_MAX_CONCURRENT', 0))
+ADMISSION_PRIORITY_SEVERITY = os.getenv('ADMISSION_PRIORITY_SEVERITY', 'high')
+RATE_LIMIT_PER_SECOND = float(os.getenv('RATE_LIMIT_PER_SECOND', 0))
+RATE_LIMIT_TRUST_FORWARDED = os.getenv('RATE_LIMIT_TRUST_FORWARDED', 'False').lower() == 'true'
+# Set in the WSGI environ by the ASGI entry point when it already took the request's rate limit token
+RATE_LIMIT_CHARGED_KEY = 'medblocai.rate_limit_charged'
+# Exempt by endpoint, so a path that merely starts like one of these is still admitted
+ADMISSION_EXEMPT_ENDPOINTS = frozenset(('health_check', 'reload_knowledge_base', 'list_profiles', 'get_profile'))
+REJECTION_ERRORS = {
+    429: 'Too many requests. Please slow down and retry later.',
+    503: 'The service is busy. Please retry shortly.'
+}
+
+admission_controller = None
+if ADMISSION_MAX_CONCURRENT > 0:
+    admission_controller = AdmissionController(
+        max_concurrent=ADMISSION_MAX_CONCURRENT,
+        max_queue=int(os.getenv('ADMISSION_QUEUE_DEPTH', 64)),
+        queue_timeout=float(os.getenv('ADMISSION_QUEUE_TIMEOUT', 2.0)),
+        retry_after=int(os.getenv('ADMISSION_RETRY_AFTER', 1))
+    )
+
+rate_limiter = None
+if RATE_LIMIT_PER_SECOND > 0:
+    rate_limiter = TokenBucketLimiter(
+        rate=RATE_LIMIT_PER_SECOND,
+        burst=float(os.getenv('RATE_LIMIT_BURST', 20))
+    )
+
+
+def collect_admission_metrics():
+    """Report admission control and rate limit statistics at scrape time"""
+    lines = []
+    if admission_controller is not None:
+        stats = admission_controller.stats()
+        lines.extend(metrics.gauge_lines(
+            'medblocai_admission_active_requests', 'Requests holding an admission slot', {(): stats['active']}
+        ))
+        lines.extend(metrics.gauge_lines(
+            'medblocai_admission_queue_length', 'Requests waiting for an admission slot', {(): stats['queued']}
+        ))
+        lines.extend(metrics.gauge_lines(
+            'medblocai_admission_queued_requests_total', 'Requests that had to wait for a slot',
+            {(): stats['queued_total']}, 'counter'
+        ))
+        lines.extend(metrics.gauge_lines(
+            'medblocai_admission_shed_requests_total', 'Requests rejected with 503, by reason',
+            {(('reason', reason),): count for reason, count in stats['shed'].items()}, 'counter'
+        ))
+    if rate_limiter is not None:
+        lines.extend(metrics.gauge_lines(
+            'medblocai_rate_limited_requests_total', 'Requests rejected with 429 by per-client rate limits',
+            {(): rate_limiter.stats()['limited']}, 'counter'
+        ))
+    return lines
+
+
+registry.add_collector(collect_admission_metrics)
+
+
+# Chain record index written by chain_indexer.py; the routes are off without it
+RECORD_INDEX_PATH = os.getenv('RECORD_INDEX_PATH', '')
+record_store = RecordStore(RECORD_INDEX_PATH) if RECORD_INDEX_PATH else None
+MAX_PAGE_SIZE = 100
+ADDRESS_PATTERN = re.compile(r'^0x[0-9a-fA-F]{40}$')
+
+# Per-patient analysis timelines, fed by analyze requests that name the patient's wallet.
+# Only callers holding TIMELINE_WRITE_TOKEN may name one; without it, nothing is recorded.
+# Reading a timeline takes TIMELINE_READ_TOKEN or the write token; without either, nobody can
+PATIENT_TIMELINE_PATH = os.getenv('PATIENT_TIMELINE_PATH', '')
+TIMELINE_WRITE_TOKEN = os.getenv('TIMELINE_WRITE_TOKEN', '')
+TIMELINE_READ_TOKEN = os.getenv('TIMELINE_READ_TOKEN', '')
+patient_timeline = PatientTimelineStore(
+    PATIENT_TIMELINE_PATH,
+    window_days=int(os.getenv('TIMELINE_WINDOW_DAYS', 30)),
+    recent_size=int(os.getenv('TIMELINE_RECENT_SIZE', 10))
+) if PATIENT_TIMELINE_PATH else None
+
+# IPFS gateway proxy; an empty IPFS_CACHE_DIR disables the disk cache
+IPFS_CACHE_DIR = os.getenv('IPFS_CACHE_DIR', 'ipfs_cache')
+ipfs_gateway = IpfsGateway(
+    os.getenv('IPFS_GATEWAY_URL', 'https://gateway.pinata.cloud'),
+    cache=IpfsDiskCache(
+        IPFS_CACHE_DIR,
+        max_bytes=int(os.getenv('IPFS_CACHE_MAX_BYTES', 1024 ** 3)),
+        max_entry_bytes=int(os.getenv('IPFS_CACHE_MAX_ENTRY_BYTES', 100 * 1024 ** 2))
+    ) if IPFS_CACHE_DIR else None,
+    pool_size=int(os.getenv('IPFS_POOL_SIZE', 8)),
+    timeout=float(os.getenv('IPFS_TIMEOUT', 30))
+)
+
+
+def collect_ipfs_cache_metrics():
+    """Report IPFS disk cache statistics at scrape time"""
+    if ipfs_gateway.cache is None:
+        return []
+    stats = ipfs_gateway.cache.stats()
+    lines = metrics.gauge_lines('medblocai_ipfs_cache_bytes', 'Bytes in the IPFS disk cache', {(): stats['bytes']})
+    for name in ('hits', 'misses', 'evictions', 'unverified'):
+        lines.extend(metrics.gauge_lines(
+            f'medblocai_ipfs_cache_{name}_total', f'IPFS disk cache {name}', {(): stats[name]}, 'counter'
+        ))
+    return lines
+
+
+registry.add_collector(collect_ipfs_cache_metrics)
+
+# Record uploads pinned through Pinata, or a local service with the same API;
+# the upload route is off until pinning credentials are set
+PINATA_JWT = os.getenv('PINATA_JWT', '')
+PINATA_API_KEY = os.getenv('PINATA_API_KEY', '')
+PINATA_SECRET_KEY = os.getenv('PINATA_SECRET_KEY', '')
+PIN_CONCURRENCY = int(os.getenv('PIN_CONCURRENCY', 4))
+UPLOAD_MAX_BYTES = int(os.getenv('UPLOAD_MAX_BYTES', 100 * 1024 ** 2))
+UPLOAD_MAX_FILES = int(os.getenv('UPLOAD_MAX_FILES', 20))
+UPLOAD_SPOOL_DIR = os.getenv('UPLOAD_SPOOL_DIR') or None
+
+ipfs_uploader = None
+if PINATA_JWT or (PINATA_API_KEY and PINATA_SECRET_KEY):
+    ipfs_uploader = IpfsUploader(
+        PinningClient(
+            os.getenv('PINNING_API_URL', 'https://api.pinata.cloud'),
+            jwt=PINATA_JWT,
+            api_key=PINATA_API_KEY,
+            secret_key=PINATA_SECRET_KEY,
+            pool_size=PIN_CONCURRENCY,
+            timeout=float(os.getenv('PIN_TIMEOUT', 120)),
+            max_attempts=int(os.getenv('PIN_MAX_ATTEMPTS', 4))
+        ),
+        PinRegistry(os.getenv('PIN_REGISTRY_PATH', 'pin_registry.db')),
+        concurrency=PIN_CONCURRENCY,
+        check_remote=os.getenv('PIN_CHECK_REMOTE', 'True').lower() == 'true'
+    )
+
+
+def collect_upload_metrics():
+    """Report record upload outcomes at scrape time"""
+    if ipfs_uploader is None:
+        return []
+    stats = ipfs_uploader.stats()
+    lines = metrics.gauge_lines(
+        'medblocai_ipfs_upload_files_total', 'Uploaded files, by outcome',
+        {(('status', status),): stats[status] for status in ('pinned', 'already_pinned', 'duplicate', 'failed')},
+        'counter'
+    )
+    lines.extend(metrics.gauge_lines(
+        'medblocai_ipfs_pin_retries_total', 'Pinning requests retried after a failure', {(): stats['retries']}, 'counter'
+    ))
+    return lines
+
+
+registry.add_collector(collect_upload_metrics)
 
 # API version and info
 API_VERSION = "1.0.0"
 API_TITLE = "MedBlocAI Health Analysis API"
 
+# Batch analysis limits
+MAX_BATCH_SIZE = int(os.getenv('MAX_BATCH_SIZE', 10000))
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+# Streamed plain-text analysis: bodies are read in pieces and never held whole
+STREAM_MAX_BYTES = int(os.getenv('STREAM_MAX_BYTES', 64 * 1024 ** 2))
+STREAM_MAX_POSITIONS = int(os.getenv('STREAM_MAX_POSITIONS', 1000))
+STREAM_READ_SIZE = 65536
+STREAM_UNSUPPORTED_TYPE = {
+    'success': False,
+    'error': 'Invalid request. Send the text as a text/plain body.'
+}
+STREAM_TOO_LARGE = {
+    'success': False,
+    'error': f'Text exceeds the limit of {STREAM_MAX_BYTES} bytes.'
+}
+STREAM_EMPTY = {
+    'success': False,
+    'error': 'No text provided. Please send the clinical note as the request body.'
+}
+
+# Live (as-you-type) analysis sessions, held by the process that created them
+LIVE_HEARTBEAT_INTERVAL = float(os.getenv('LIVE_HEARTBEAT_INTERVAL', 15))
+LIVE_EVENTS_PATH = re.compile(r'^/api/analyze/live/[0-9a-f]{32}/events$')
+live_sessions = LiveSessionStore(
+    analyzer.analyze_detected_json,
+    max_sessions=int(os.getenv('LIVE_MAX_SESSIONS', 1000)),
+    idle_timeout=float(os.getenv('LIVE_SESSION_TTL', 600)),
+    max_chars=int(os.getenv('LIVE_MAX_CHARS', 20000))
+)
+
+
+def collect_live_metrics():
+    """Report live analysis session statistics at scrape time"""
+    stats = live_sessions.stats()
+    lines = metrics.gauge_lines('medblocai_live_sessions', 'Open live analysis sessions', {(): stats['sessions']})
+    lines.extend(metrics.gauge_lines(
+        'medblocai_live_edits_total', 'Edits applied to live analysis sessions', {(): stats['edits']}, 'counter'
+    ))
+    lines.extend(metrics.gauge_lines(
+        'medblocai_live_updates_total', 'Edits that changed the detected symptoms', {(): stats['updates']}, 'counter'
+    ))
+    lines.extend(metrics.gauge_lines(
+        'medblocai_live_scanned_chars_total', 'Characters rescanned for live analysis edits',
+        {(): stats['scanned_chars']}, 'counter'
+    ))
+    return lines
+
+
+registry.add_collector(collect_live_metrics)
+
+
+def _reload_knowledge_base_in_background(signum=None, frame=None):
+    """Signal handler: reload off the signal path so no lock is taken in the handler"""
+    def reload():
+        try:
+            if analyzer.reload():
+                app.logger.info(f"Knowledge base reloaded (version {analyzer.knowledge_base.version})")
+        except (OSError, ValueError) as e:
+            app.logger.error(f"Knowledge base reload failed: {str(e)}")
+
+    threading.Thread(target=reload, name='knowledge-base-reload', daemon=True).start()
+
+
+# SIGHUP reloads the knowledge base; signal gunicorn workers, not the master
+if hasattr(signal, 'SIGHUP') and threading.current_thread() is threading.main_thread():
+    signal.signal(signal.SIGHUP, _reload_knowledge_base_in_background)
+
+
+@app.before_request
+def start_request_timer():
+    """Remember when the request started for the latency histogram"""
+    if METRICS_ENABLED:
+        g.request_started = time.perf_counter()
+
+
+@app.after_request
+def record_request_metrics(response):
+    """Count the request and record its latency and body size"""
+    started = g.get('request_started') if METRICS_ENABLED else None
+    if started is not None:
+        endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        REQUEST_LATENCY.labels(endpoint).observe(time.perf_counter() - started)
+        REQUEST_COUNT.labels(endpoint, request.method, response.status_code).inc()
+        if request.content_length:
+            REQUEST_BODY_SIZE.labels(endpoint).observe(request.content_length)
+    return response
+
+
+@app.after_request
+def capture_request(response):
+    """Queue the request for traffic capture, if it is on"""
+    if traffic_capture is not None and request.url_rule is not None:
+        traffic_capture.record(
+            request.method,
+            request.url_rule.rule,
+            request.path,
+            request.get_json(silent=True) if request.method == 'POST' else None,
+            response.status_code,
+            conditional='If-None-Match' in request.headers
+        )
+    return response
+
+
+@app.before_request
+def check_knowledge_base():
+    """Pick up data file changes at most once per check interval"""
+    global _next_knowledge_base_check
+
+    if KNOWLEDGE_BASE_CHECK_INTERVAL <= 0:
+        return
+
+    now = time.monotonic()
+    if now < _next_knowledge_base_check:
+        return
+    _next_knowledge_base_check = now + KNOWLEDGE_BASE_CHECK_INTERVAL
+
+    try:
+        analyzer.reload_if_modified()
+    except (OSError, ValueError) as e:
+        app.logger.error(f"Knowledge base reload failed: {str(e)}")
+
+
+def knowledge_base_check_due():
+    """True when check_knowledge_base would look at the data files"""
+    return KNOWLEDGE_BASE_CHECK_INTERVAL > 0 and time.monotonic() >= _next_knowledge_base_check
+
+
+def get_client_id():
+    """Rate limit key: the client address, or the first forwarded address behind a trusted proxy"""
+    if RATE_LIMIT_TRUST_FORWARDED and request.access_route:
+        return request.access_route[0]
+    return request.remote_addr or ''
+
+
+def is_high_severity_request():
+    """True for analyze requests describing symptoms at or above ADMISSION_PRIORITY_SEVERITY"""
+    if request.path != '/api/analyze' or not ADMISSION_PRIORITY_SEVERITY:
+        return False
+
+    level = analyzer.knowledge_base.severity_levels.get(ADMISSION_PRIORITY_SEVERITY)
+    payload = request.get_json(silent=True)
+    if level is None or not isinstance(payload, dict):
+        return False
+
+    return analyzer.get_severity_priority(payload.get('symptoms')) >= level.priority
+
+
+def rejection_response(status, retry_after):
+    """Fast 429/503 response telling the client when to retry"""
+    response = jsonify({
+        'success': False,
+        'error': REJECTION_ERRORS[status]
+    })
+    response.status_code = status
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+
+@app.before_request
+def admit_request():
+    """Apply per-client rate limits, then wait for a concurrency slot"""
+    if request.method == 'OPTIONS' or not request.path.startswith('/api/'):
+        return None
+    if request.endpoint in ADMISSION_EXEMPT_ENDPOINTS:
+        return None
+
+    if rate_limiter is not None and not request.environ.get(RATE_LIMIT_CHARGED_KEY):
+        delay = rate_limiter.acquire(get_client_id())
+        if delay:
+            return rejection_response(429, retry_after_seconds(delay))
+
+    # Event streams stay open for minutes; the edits that feed them are admitted instead
+    if admission_controller is not None and not LIVE_EVENTS_PATH.match(request.path):
+        try:
+            # Severity is only checked for requests that have to queue
+            admission_controller.acquire(high_priority=is_high_severity_request)
+        except Rejected as e:
+            return rejection_response(e.status, e.retry_after)
+        g.admitted = True
+
+    return None
+
+
+@app.teardown_request
+def release_admission(exception=None):
+    """Free the concurrency slot once the response, including any stream, is finished"""
+    if g.pop('admitted', False):
+        admission_controller.release()
+
+
+HOME_PAYLOAD = {
+    'success': True,
+    'message': 'Welcome to MedBlocAI Health Analysis API',
+    'version': API_VERSION,
+    'endpoints': {
+        'health_check': '/api/health',
+        'analyze_symptoms': '/api/analyze',
+        'analyze_batch': '/api/analyze/batch',
+        'analyze_live': '/api/analyze/live',
+        'analyze_stream': '/api/analyze/stream',
+        'get_health_tips': '/api/tips',
+        'get_tips_by_category': '/api/tips/<category>',
+        'patient_records': '/api/patients/<address>/records',
+        'patient_timeline': '/api/patients/<address>/timeline',
+        'upload_records': '/api/records/upload'
+    },
+    'documentation': 'https://github.com/jayteemoney/medblocai'
+}
+
+_static_responses = None
+
+
+def get_static_responses():
+    """Return precomputed responses for the current knowledge base, rebuilding after a reload"""
+    global _static_responses
+
+    knowledge_base = analyzer.knowledge_base
+    static_responses = _static_responses
+
+    if static_responses is None or static_responses.version != knowledge_base.version:
+        static_responses = build_static_responses(
+            knowledge_base,
+            HOME_PAYLOAD,
+            {category: analyzer.get_health_tips(category) for category in knowledge_base.tips}
+        )
+        _static_responses = static_responses
+
+    return static_responses
+
+
+# Serialize and compress the static bodies once at startup
+get_static_responses()
+
+
+def send_static_response(static_response: StaticResponse):
+    """Send a precomputed body, honouring If-None-Match and Accept-Encoding"""
+    use_gzip = bool(static_response.gzip_body) and request.accept_encodings['gzip'] > 0
+    etag = static_response.gzip_etag if use_gzip else static_response.etag
+
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = Response(
+            static_response.gzip_body if use_gzip else static_response.body,
+            status=200,
+            mimetype='application/json'
+        )
+        if use_gzip:
+            response.headers['Content-Encoding'] = 'gzip'
+
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.vary.add('Accept-Encoding')
+    return response
+
 
 @app.route('/', methods=['GET'])
 def home():
     """API home endpoint"""
-    return jsonify({
-        'success': True,
-        'message': 'Welcome to MedBlocAI Health Analysis API',
-        'version': API_VERSION,
-        'endpoints': {
-            'health_check': '/api/health',
-            'analyze_symptoms': '/api/analyze',
-            'get_health_tips': '/api/tips',
-            'get_tips_by_category': '/api/tips/<category>'
-        },
-        'documentation': 'https://github.com/jayteemoney/medblocai'
-    })
+    return send_static_response(get_static_responses().home)
 
 
 @app.route('/api/health', methods=['GET'])
@@ -51,7 +612,8 @@ def health_check():
         'success': True,
         'status': 'healthy',
         'api': API_TITLE,
-        'version': API_VERSION
+        'version': API_VERSION,
+        'analysis_cache': analyzer.cache.stats()
     })
 
 
@@ -62,7 +624,9 @@ def analyze_symptoms():
 
     Request body:
     {
-        "symptoms": "I have a headache and fever"
+        "symptoms": "I have a headache and fever",
+        "patient": "0x..."  (optional wallet address; adds the analysis to the patient's timeline,
+                             requires X-Timeline-Token when timelines are enabled)
     }
 
     Response:
@@ -75,14 +639,19 @@ def analyze_symptoms():
     """
     try:
         # Validate request
-        if not request.json:
+        started = time.perf_counter()
+        payload = request.json
+        if METRICS_ENABLED:
+            PARSE_LATENCY.observe(time.perf_counter() - started)
+
+        if not payload:
             return jsonify({
                 'success': False,
                 'error': 'Invalid request. JSON body required.'
             }), 400
 
         # Get symptoms from request
-        symptoms_text = request.json.get('symptoms', '').strip()
+        symptoms_text = payload.get('symptoms', '').strip()
 
         if not symptoms_text:
             return jsonify({
@@ -90,11 +659,29 @@ def analyze_symptoms():
                 'error': 'No symptoms provided. Please describe your symptoms.'
             }), 400
 
-        # Analyze symptoms using AI model
-        analysis_result = analyzer.analyze_symptoms(symptoms_text)
+        patient = payload.get('patient')
+        if patient is not None and (not isinstance(patient, str) or not ADDRESS_PATTERN.match(patient)):
+            return _invalid_address()
+
+        if METRICS_ENABLED:
+            ANALYSIS_INPUT_SIZE.observe(len(symptoms_text))
+
+        if patient and patient_timeline is not None and not is_timeline_writer():
+            return jsonify({
+                'success': False,
+                'error': 'Recording to a patient timeline requires a valid X-Timeline-Token header.'
+            }), 401
+
+        if patient and patient_timeline is not None:
+            entry = analyzer.analyze_symptoms_entry(symptoms_text)
+            record_patient_analysis(patient.lower(), entry.result)
+            analysis_body = entry.body
+        else:
+            # Analyze symptoms using AI model; the body is served pre-serialized from cache
+            analysis_body = analyzer.analyze_symptoms_json(symptoms_text)
 
         # Return analysis
-        return jsonify(analysis_result), 200
+        return Response(analysis_body, status=200, mimetype='application/json')
 
     except Exception as e:
         app.logger.error(f"Error in analyze_symptoms: {str(e)}")
@@ -105,6 +692,384 @@ def analyze_symptoms():
         }), 500
 
 
+def is_timeline_writer():
+    """True if the X-Timeline-Token header matches TIMELINE_WRITE_TOKEN"""
+    return bool(TIMELINE_WRITE_TOKEN) and hmac.compare_digest(
+        request.headers.get('X-Timeline-Token', ''), TIMELINE_WRITE_TOKEN
+    )
+
+
+def is_timeline_reader():
+    """True if the X-Timeline-Token header matches TIMELINE_READ_TOKEN or TIMELINE_WRITE_TOKEN"""
+    token = request.headers.get('X-Timeline-Token', '')
+    return is_timeline_writer() or (bool(TIMELINE_READ_TOKEN) and hmac.compare_digest(token, TIMELINE_READ_TOKEN))
+
+
+def record_patient_analysis(patient, result):
+    """Add an analysis to the patient's timeline; a failure is logged, not returned to the client"""
+    severity = result['analysis']['severity']
+    try:
+        patient_timeline.record(
+            patient,
+            [detail['symptom'] for detail in result['detected_symptoms']],
+            severity,
+            analyzer.severity_priority.get(severity, 0)
+        )
+    except sqlite3.Error as e:
+        app.logger.error(f"Error recording timeline for {patient}: {str(e)}")
+
+
+def _iter_batch_inputs():
+    """
+    Yield batch items from the request body without buffering NDJSON input.
+
+    Items are either symptom strings or objects with a `symptoms` field and
+    an optional `id` that is echoed back in the result line.
+    """
+    if request.mimetype == NDJSON_MIMETYPE:
+        for line_number, line in enumerate(request.stream, 1):
+            line = line.strip()
+            if line:
+                try:
+                    item = json.loads(line)
+                except ValueError as e:
+                    raise ValueError(f'line {line_number}: {e}') from e
+                yield item
+        return
+
+    yield from _get_batch_array()
+
+
+def _get_batch_array():
+    """Return the input list of a JSON batch request, or None if malformed"""
+    body = request.get_json(silent=True)
+    if isinstance(body, dict):
+        body = body.get('inputs')
+    return body if isinstance(body, list) else None
+
+
+def _analyze_batch_item(index, item):
+    """Analyze one batch item and return its result line"""
+    item_id = None
+    symptoms_text = item
+
+    if isinstance(item, dict):
+        item_id = item.get('id')
+        symptoms_text = item.get('symptoms', '')
+
+    if not isinstance(symptoms_text, str) or not symptoms_text.strip():
+        result = {
+            'success': False,
+            'error': 'No symptoms provided. Please describe your symptoms.'
+        }
+    else:
+        result = analyzer.analyze_symptoms(symptoms_text.strip())
+
+    line = {'index': index}
+    if item_id is not None:
+        line['id'] = item_id
+    line.update(result)
+    return line
+
+
+@app.route('/api/analyze/batch', methods=['POST'])
+def analyze_symptoms_batch():
+    """
+    Analyze many symptom descriptions in one request
+
+    Request body (application/json):
+    {
+        "inputs": ["I have a headache", {"id": "a1", "symptoms": "fever and cough"}]
+    }
+
+    or application/x-ndjson, one input per line.
+
+    Response (application/x-ndjson), one line per input as it completes:
+    {"index": 0, "success": true, "detected_symptoms": [...], ...}
+    """
+    if request.mimetype != NDJSON_MIMETYPE and _get_batch_array() is None:
+        return jsonify({
+            'success': False,
+            'error': 'Invalid request. JSON array or NDJSON body required.'
+        }), 400
+
+    def generate():
+        # Index of the next input, so a malformed line reports the position it would have had
+        index = 0
+        try:
+            for item in _iter_batch_inputs():
+                if index >= MAX_BATCH_SIZE:
+                    yield json.dumps({
+                        'index': index,
+                        'success': False,
+                        'error': f'Batch size limit of {MAX_BATCH_SIZE} inputs exceeded.'
+                    }) + '\n'
+                    return
+
+                yield json.dumps(_analyze_batch_item(index, item)) + '\n'
+                index += 1
+
+        except ValueError as e:
+            # Malformed NDJSON line; the stream has already started
+            yield json.dumps({'index': index, 'success': False, 'error': f'Invalid batch input: {e}'}) + '\n'
+
+        except Exception as e:
+            app.logger.error(f"Error in analyze_symptoms_batch: {str(e)}")
+            yield json.dumps({
+                'success': False,
+                'error': 'An error occurred while analyzing symptoms.',
+                'details': str(e) if app.debug else None
+            }) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype=NDJSON_MIMETYPE)
+
+
+def finish_stream_analysis(analysis):
+    """Complete a streamed analysis and return the serialized response body"""
+    detected_symptoms, occurrences = analysis.finish()
+    if METRICS_ENABLED:
+        ANALYSIS_INPUT_SIZE.observe(analysis.characters)
+
+    result = analyzer.analyze_detected(analysis.knowledge_base, detected_symptoms)
+    result['occurrences'] = occurrences
+    result['characters'] = analysis.characters
+    return serialize_response(result)
+
+
+@app.route('/api/analyze/stream', methods=['POST'])
+def analyze_stream():
+    """
+    Analyze a long clinical note streamed as plain text
+
+    The body (text/plain, UTF-8, with a Content-Length or chunked) is
+    matched as it is read, so memory use does not grow with its size.
+
+    Response:
+    {
+        "success": true,
+        "detected_symptoms": [...],
+        "analysis": {...},
+        "occurrences": {"fever": {"count": 3, "positions": [[120, 125], ...]}},
+        "characters": 48213
+    }
+    """
+    try:
+        if request.mimetype != 'text/plain':
+            return jsonify(STREAM_UNSUPPORTED_TYPE), 415
+
+        if request.content_length is not None and request.content_length > STREAM_MAX_BYTES:
+            return jsonify(STREAM_TOO_LARGE), 413
+
+        # Hold one snapshot for the whole stream so a reload cannot mix versions
+        analysis = StreamAnalysis(analyzer.knowledge_base, max_positions=STREAM_MAX_POSITIONS)
+        while True:
+            data = request.stream.read(STREAM_READ_SIZE)
+            if not data:
+                break
+            if analysis.bytes_read + len(data) > STREAM_MAX_BYTES:
+                return jsonify(STREAM_TOO_LARGE), 413
+            analysis.feed(data)
+
+        if not analysis.bytes_read:
+            return jsonify(STREAM_EMPTY), 400
+
+        return Response(finish_stream_analysis(analysis), status=200, mimetype='application/json')
+
+    except Exception as e:
+        app.logger.error(f"Error in analyze_stream: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': 'An error occurred while analyzing the text.',
+            'details': str(e) if app.debug else None
+        }), 500
+
+
+def _live_session_not_found():
+    return jsonify({
+        'success': False,
+        'error': 'Live analysis session not found. It may have expired; start a new one.'
+    }), 404
+
+
+@app.route('/api/analyze/live', methods=['POST'])
+def create_live_session():
+    """
+    Start a live analysis session for as-you-type symptom entry
+
+    Request body (optional):
+    {
+        "symptoms": "initial text"
+    }
+
+    Response (201):
+    {
+        "success": true,
+        "session_id": "9f8c...",
+        "events": "/api/analyze/live/9f8c.../events",
+        "version": 1
+    }
+    """
+    try:
+        payload = request.get_json(silent=True) or {}
+        symptoms_text = payload.get('symptoms', '') if isinstance(payload, dict) else None
+        if not isinstance(symptoms_text, str) or len(symptoms_text) > live_sessions.max_chars:
+            return jsonify({
+                'success': False,
+                'error': f'Invalid request. "symptoms" must be a string of at most {live_sessions.max_chars} characters.'
+            }), 400
+
+        session = live_sessions.create(analyzer.knowledge_base)
+        if symptoms_text:
+            session.set_text(symptoms_text, analyzer.knowledge_base)
+
+        return jsonify({
+            'success': True,
+            'session_id': session.session_id,
+            'events': f'/api/analyze/live/{session.session_id}/events',
+            'version': session.text_version
+        }), 201
+
+    except Exception as e:
+        app.logger.error(f"Error in create_live_session: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': 'An error occurred while starting the session.',
+            'details': str(e) if app.debug else None
+        }), 500
+
+
+@app.route('/api/analyze/live/<session_id>', methods=['POST'])
+def edit_live_session(session_id):
+    """
+    Apply an edit to a live analysis session
+
+    Request body, either a splice of the current text:
+    {
+        "start": 42, "end": 42, "text": " and a cough", "version": 7
+    }
+
+    or the whole text, of which only the changed part is rescanned:
+    {
+        "symptoms": "I have a headache and a cough", "version": 7
+    }
+
+    "version" is optional; when given, an edit made against another
+    version is rejected with 409 so the client can resend the whole text.
+    An updated analysis is pushed on the event stream only if the detected
+    symptoms changed.
+
+    Response:
+    {
+        "success": true,
+        "version": 8,
+        "changed": true
+    }
+    """
+    session = live_sessions.get(session_id)
+    if session is None:
+        return _live_session_not_found()
+
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        return jsonify({
+            'success': False,
+            'error': 'Invalid request. JSON body required.'
+        }), 400
+
+    try:
+        expected_version = payload.get('version')
+        if expected_version is not None and not isinstance(expected_version, int):
+            raise ValueError('"version" must be an integer')
+
+        if 'symptoms' in payload:
+            if not isinstance(payload['symptoms'], str):
+                raise ValueError('"symptoms" must be a string')
+            changed = session.set_text(payload['symptoms'], analyzer.knowledge_base, expected_version)
+        else:
+            start, end, text = payload.get('start'), payload.get('end', payload.get('start')), payload.get('text', '')
+            if not isinstance(start, int) or not isinstance(end, int) or not isinstance(text, str):
+                raise ValueError('Provide "symptoms", or integer "start" and "end" with a "text" string')
+            changed = session.replace(start, end, text, analyzer.knowledge_base, expected_version)
+
+        live_sessions.touch(session, changed)
+        return jsonify({
+            'success': True,
+            'version': session.text_version,
+            'changed': changed
+        }), 200
+
+    except EditConflict as e:
+        return jsonify({
+            'success': False,
+            'error': 'Edit was made against an outdated version of the text. Resend the whole text.',
+            'version': e.version,
+            'length': e.length
+        }), 409
+
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+
+    except Exception as e:
+        app.logger.error(f"Error in edit_live_session: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': 'An error occurred while analyzing symptoms.',
+            'details': str(e) if app.debug else None
+        }), 500
+
+
+@app.route('/api/analyze/live/<session_id>/events', methods=['GET'])
+def stream_live_session(session_id):
+    """
+    Server-Sent Events stream of a live analysis session
+
+    Sends the current analysis on connect, unless Last-Event-ID shows the
+    client already has it, then an "analysis" event (the /api/analyze
+    response body) each time the detected symptoms change. A "closed"
+    event ends the stream when the session expires or is deleted.
+    """
+    session = live_sessions.get(session_id)
+    if session is None:
+        return _live_session_not_found()
+
+    last_event_id = request.headers.get('Last-Event-ID', '')
+    sent_version = int(last_event_id) if last_event_id.isdigit() else None
+
+    def generate(sent_version):
+        woke = threading.Event()
+        unsubscribe = session.subscribe(woke.set)
+        try:
+            while True:
+                woke.clear()
+                message, sent_version = session.next_event(sent_version)
+                if message is CLOSED_EVENT:
+                    yield message
+                    return
+                if message is not None:
+                    yield message
+                elif not woke.wait(LIVE_HEARTBEAT_INTERVAL):
+                    yield KEEPALIVE
+        finally:
+            unsubscribe()
+
+    response = Response(generate(sent_version), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # Stop nginx from buffering the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@app.route('/api/analyze/live/<session_id>', methods=['DELETE'])
+def close_live_session(session_id):
+    """End a live analysis session and its event streams"""
+    if not live_sessions.close(session_id):
+        return _live_session_not_found()
+    return jsonify({'success': True}), 200
+
+
 @app.route('/api/tips', methods=['GET'])
 @app.route('/api/tips/<category>', methods=['GET'])
 def get_health_tips(category='general'):
@@ -127,6 +1092,11 @@ def get_health_tips(category='general'):
     }
     """
     try:
+        # Known categories are served pre-serialized
+        static_response = get_static_responses().tips.get(category.lower())
+        if static_response is not None:
+            return send_static_response(static_response)
+
         # Get health tips from AI model
         tips_result = analyzer.get_health_tips(category)
 
@@ -154,20 +1124,521 @@ def get_supported_symptoms():
     }
     """
     try:
-        symptoms = list(analyzer.symptom_database.keys())
+        return send_static_response(get_static_responses().symptoms)
 
+    except Exception as e:
+        app.logger.error(f"Error in get_supported_symptoms: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': 'An error occurred while fetching supported symptoms.'
+        }), 500
+
+
+def _record_index_unavailable():
+    return jsonify({
+        'success': False,
+        'error': 'Record index is not configured.'
+    }), 503
+
+
+def _get_page_args(default_limit=20):
+    """Parse offset and limit query parameters; returns (offset, limit, error response)"""
+    try:
+        offset = int(request.args.get('offset', 0))
+        limit = int(request.args.get('limit', default_limit))
+    except ValueError:
+        offset = limit = -1
+
+    if offset < 0 or not 0 < limit <= MAX_PAGE_SIZE:
+        return None, None, (jsonify({
+            'success': False,
+            'error': f'offset must be >= 0 and limit between 1 and {MAX_PAGE_SIZE}.'
+        }), 400)
+    return offset, limit, None
+
+
+def _invalid_address():
+    return jsonify({
+        'success': False,
+        'error': 'Invalid patient address.'
+    }), 400
+
+
+@app.route('/api/patients/<address>/records', methods=['GET'])
+def get_patient_records(address):
+    """
+    Get one page of a patient's on-chain health records from the local index
+
+    Query parameters: offset (default 0), limit (default 20, max 100),
+    order ("asc" by record index, or "desc" for newest first)
+
+    Response:
+    {
+        "success": true,
+        "patient": "0x...",
+        "records": [{"record_index": 0, "ipfs_hash": "Qm...", ...}],
+        "total": 42,
+        "offset": 0,
+        "limit": 20,
+        "indexed_block": 123456
+    }
+    """
+    if record_store is None:
+        return _record_index_unavailable()
+    if not ADDRESS_PATTERN.match(address):
+        return _invalid_address()
+
+    offset, limit, error = _get_page_args()
+    if error is not None:
+        return error
+
+    try:
+        patient = address.lower()
         return jsonify({
             'success': True,
-            'symptoms': symptoms,
-            'count': len(symptoms),
-            'categories': list(set(s['category'] for s in analyzer.symptom_database.values()))
+            'patient': patient,
+            'records': record_store.get_records(
+                patient, offset, limit, newest_first=request.args.get('order') == 'desc'
+            ),
+            'total': record_store.count_records(patient),
+            'offset': offset,
+            'limit': limit,
+            'indexed_block': record_store.last_block
         }), 200
 
     except Exception as e:
-        app.logger.error(f"Error in get_supported_symptoms: {str(e)}")
+        app.logger.error(f"Error in get_patient_records: {str(e)}")
         return jsonify({
             'success': False,
-            'error': 'An error occurred while fetching supported symptoms.'
+            'error': 'An error occurred while fetching records.',
+            'details': str(e) if app.debug else None
+        }), 500
+
+
+@app.route('/api/patients/<address>/records/count', methods=['GET'])
+def get_patient_record_count(address):
+    """Get the number of indexed records for a patient"""
+    if record_store is None:
+        return _record_index_unavailable()
+    if not ADDRESS_PATTERN.match(address):
+        return _invalid_address()
+
+    try:
+        patient = address.lower()
+        return jsonify({
+            'success': True,
+            'patient': patient,
+            'total': record_store.count_records(patient),
+            'indexed_block': record_store.last_block
+        }), 200
+
+    except Exception as e:
+        app.logger.error(f"Error in get_patient_record_count: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': 'An error occurred while counting records.',
+            'details': str(e) if app.debug else None
+        }), 500
+
+
+@app.route('/api/patients/<address>/accesses', methods=['GET'])
+def get_patient_accesses(address):
+    """Get one page of RecordAccessed events for a patient, newest first"""
+    if record_store is None:
+        return _record_index_unavailable()
+    if not ADDRESS_PATTERN.match(address):
+        return _invalid_address()
+
+    offset, limit, error = _get_page_args()
+    if error is not None:
+        return error
+
+    try:
+        patient = address.lower()
+        return jsonify({
+            'success': True,
+            'patient': patient,
+            'accesses': record_store.get_accesses(patient, offset, limit),
+            'total': record_store.count_accesses(patient),
+            'offset': offset,
+            'limit': limit,
+            'indexed_block': record_store.last_block
+        }), 200
+
+    except Exception as e:
+        app.logger.error(f"Error in get_patient_accesses: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': 'An error occurred while fetching record accesses.',
+            'details': str(e) if app.debug else None
+        }), 500
+
+
+@app.route('/api/patients/<address>/timeline', methods=['GET'])
+def get_patient_timeline(address):
+    """
+    Get running aggregates of a patient's symptom analyses
+
+    Served from totals updated with each analysis, so the cost does not
+    depend on how many analyses the patient has had. Requires an
+    X-Timeline-Token header holding TIMELINE_READ_TOKEN or TIMELINE_WRITE_TOKEN.
+
+    Response:
+    {
+        "success": true,
+        "patient": "0x...",
+        "analyses": 42,
+        "first_seen": 1760000000,
+        "last_seen": 1760600000,
+        "symptoms": [{"symptom": "fever", "count": 12, "first_seen": ..., "last_seen": ...}],
+        "severities": {"high": {"count": 3, "first_seen": ..., "last_seen": ...}},
+        "recent": [{"timestamp": 1760600000, "severity": "high"}],
+        "daily": [{"date": "2026-10-16", "analyses": 2, "max_severity": "high", "mean_priority": 2.5}],
+        "window_days": 30,
+        "trend": "escalating"
+    }
+    """
+    if patient_timeline is None:
+        return jsonify({
+            'success': False,
+            'error': 'Patient timelines are not configured.'
+        }), 503
+    if not is_timeline_reader():
+        return unauthorized()
+    if not ADDRESS_PATTERN.match(address):
+        return _invalid_address()
+
+    try:
+        return jsonify({'success': True, **patient_timeline.get_timeline(address.lower())}), 200
+
+    except Exception as e:
+        app.logger.error(f"Error in get_patient_timeline: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': 'An error occurred while fetching the timeline.',
+            'details': str(e) if app.debug else None
+        }), 500
+
+
+@app.route('/api/index/status', methods=['GET'])
+def get_record_index_status():
+    """Get totals and the last indexed block of the chain record index"""
+    if record_store is None:
+        return _record_index_unavailable()
+
+    try:
+        return jsonify({'success': True, **record_store.stats()}), 200
+
+    except Exception as e:
+        app.logger.error(f"Error in get_record_index_status: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': 'An error occurred while reading the record index.',
+            'details': str(e) if app.debug else None
+        }), 500
+
+
+@app.route('/api/ipfs/<cid>', methods=['GET'])
+def get_ipfs_content(cid):
+    """
+    Fetch IPFS content through the configured gateway
+
+    Cache hits are served from disk with Range and conditional request
+    support. Misses stream from the gateway while the body is written to
+    the cache. Responses are marked immutable, since a CID's content never
+    changes.
+    """
+    if not CID_PATTERN.match(cid):
+        return jsonify({
+            'success': False,
+            'error': 'Invalid CID.'
+        }), 400
+
+    # The ETag is the CID itself, so revalidation never needs the gateway
+    if request.if_none_match.contains(cid):
+        response = Response(status=304)
+    else:
+        cached = ipfs_gateway.cache.get(cid) if ipfs_gateway.cache is not None else None
+        if cached is not None:
+            response = send_file(cached.path, mimetype=cached.content_type, conditional=True, etag=cid)
+            response.headers.update(content_headers(cached.content_type))
+        else:
+            try:
+                status, headers, body = ipfs_gateway.fetch(cid, request.headers.get('Range'))
+            except UpstreamError as e:
+                app.logger.error(f"Error in get_ipfs_content: {str(e)}")
+                return jsonify({
+                    'success': False,
+                    'error': 'IPFS gateway is unavailable.'
+                }), 502
+
+            if status == 404:
+                return not_found(None)
+            if status not in (200, 206):
+                return jsonify({
+                    'success': False,
+                    'error': f'IPFS gateway returned status {status}.'
+                }), 416 if status == 416 else 502
+
+            # Keep the request context, and with it the admission slot, until the body is sent.
+            # The wrapper only closes its own iterator, so the gateway body is closed with the response
+            response = Response(stream_with_context(body), status=status, headers=headers)
+            response.call_on_close(body.close)
+            response.headers.update(content_headers(headers.get('Content-Type')))
+            response.set_etag(cid)
+
+    response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    response.headers['Accept-Ranges'] = 'bytes'
+    return response
+
+
+def _upload_too_large():
+    return jsonify({
+        'success': False,
+        'error': f'Upload exceeds the limit of {UPLOAD_MAX_BYTES} bytes.'
+    }), 413
+
+
+@app.route('/api/records/upload', methods=['POST'])
+def upload_records():
+    """
+    Pin record files to IPFS and return their CIDs for addRecord
+
+    Request: multipart/form-data with one or more "file" parts. Files are
+    written to disk in chunks and their CIDs computed while they arrive;
+    content that is already pinned is not uploaded again.
+
+    Response:
+    {
+        "success": true,
+        "files": [{"filename": "lab.pdf", "size": 52311, "cid": "Qm...",
+                   "ipfs_hash": "Qm...", "status": "pinned"}],
+        "ipfs_hashes": ["Qm..."]
+    }
+    """
+    if ipfs_uploader is None:
+        return jsonify({
+            'success': False,
+            'error': 'IPFS pinning is not configured.'
+        }), 503
+
+    if request.mimetype != 'multipart/form-data':
+        return jsonify({
+            'success': False,
+            'error': 'Invalid request. multipart/form-data body required.'
+        }), 400
+
+    if request.content_length is not None and request.content_length > UPLOAD_MAX_BYTES:
+        return _upload_too_large()
+
+    spools = []
+
+    def spool_file_part(total_content_length, content_type, filename, content_length=None):
+        spool = UploadSpool(UPLOAD_SPOOL_DIR)
+        spools.append(spool)
+        return spool
+
+    try:
+        _, _, files = FormDataParser(spool_file_part).parse(
+            LimitedStream(request.stream, UPLOAD_MAX_BYTES, is_max=True),
+            request.mimetype,
+            request.content_length,
+            request.mimetype_params
+        )
+        uploads = [(storage.filename or 'upload', storage.stream) for storage in files.getlist('file')]
+
+        if not uploads:
+            return jsonify({
+                'success': False,
+                'error': 'No files provided. Send one or more "file" parts.'
+            }), 400
+
+        if len(uploads) > UPLOAD_MAX_FILES:
+            return jsonify({
+                'success': False,
+                'error': f'Too many files. Maximum is {UPLOAD_MAX_FILES} per upload.'
+            }), 400
+
+        results = ipfs_uploader.upload(uploads)
+        failed = sum(1 for result in results if result['status'] == 'failed')
+        if failed:
+            app.logger.error(f"Error in upload_records: pinning failed for {failed} file(s)")
+            return jsonify({
+                'success': False,
+                'error': f'Pinning failed for {failed} file(s). Retrying only uploads what is missing.',
+                'files': results
+            }), 502
+
+        return jsonify({
+            'success': True,
+            'files': results,
+            'ipfs_hashes': [result['ipfs_hash'] for result in results]
+        }), 200
+
+    except RequestEntityTooLarge:
+        return _upload_too_large()
+
+    except Exception as e:
+        app.logger.error(f"Error in upload_records: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': 'An error occurred while uploading files.',
+            'details': str(e) if app.debug else None
+        }), 500
+
+    finally:
+        for spool in spools:
+            spool.discard()
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus scrape endpoint; each worker process reports its own series"""
+    if not METRICS_ENABLED:
+        return not_found(None)
+
+    return Response(registry.render(), status=200, content_type=metrics.CONTENT_TYPE)
+
+
+def is_admin_request():
+    """True if the X-Admin-Token header matches ADMIN_TOKEN"""
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(request.headers.get('X-Admin-Token', ''), ADMIN_TOKEN)
+
+
+def unauthorized():
+    return jsonify({
+        'success': False,
+        'error': 'Unauthorized'
+    }), 401
+
+
+def profiling_disabled():
+    return jsonify({
+        'success': False,
+        'error': 'Request profiling is not enabled'
+    }), 404
+
+
+@app.route('/api/admin/profiles', methods=['GET'])
+def list_profiles():
+    """
+    List stored request profiles, newest first
+
+    Requires the X-Admin-Token header. With ?format=collapsed, returns the
+    collapsed stacks of every stored profile merged, optionally only those
+    for ?path=/api/analyze, ready for flamegraph.pl or speedscope.
+
+    Response:
+    {
+        "success": true,
+        "profiles": [{"id": "9c1e...", "method": "POST", "path": "/api/analyze",
+                      "status": 200, "duration_ms": 4.2, "trigger": "sampled", ...}]
+    }
+    """
+    if request_profiler is None:
+        return profiling_disabled()
+    if not is_admin_request():
+        return unauthorized()
+
+    try:
+        profiles = request_profiler.list()
+        path = request.args.get('path')
+        if path:
+            profiles = [profile for profile in profiles if profile.get('path') == path]
+
+        if request.args.get('format') == 'collapsed':
+            return Response(
+                request_profiler.collapsed(profile['id'] for profile in profiles),
+                status=200,
+                mimetype='text/plain'
+            )
+
+        return jsonify({
+            'success': True,
+            'profiles': profiles
+        }), 200
+
+    except Exception as e:
+        app.logger.error(f"Error in list_profiles: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': 'Failed to list profiles',
+            'details': str(e) if app.debug else None
+        }), 500
+
+
+@app.route('/api/admin/profiles/<profile_id>', methods=['GET'])
+def get_profile(profile_id):
+    """
+    Download one request profile
+
+    Requires the X-Admin-Token header. Returns collapsed stacks in
+    microseconds by default, or the raw cProfile statistics with
+    ?format=pstats for pstats, snakeviz and similar tools.
+    """
+    if request_profiler is None:
+        return profiling_disabled()
+    if not is_admin_request():
+        return unauthorized()
+
+    try:
+        path = request_profiler.pstats_path(profile_id)
+        if path is None:
+            return jsonify({
+                'success': False,
+                'error': 'Profile not found'
+            }), 404
+
+        if request.args.get('format') == 'pstats':
+            return send_file(path, mimetype='application/octet-stream', as_attachment=True,
+                             download_name=f'{profile_id}.prof')
+
+        return Response(request_profiler.collapsed([profile_id]), status=200, mimetype='text/plain')
+
+    except Exception as e:
+        app.logger.error(f"Error in get_profile: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': 'Failed to read profile',
+            'details': str(e) if app.debug else None
+        }), 500
+
+
+@app.route('/api/admin/reload', methods=['POST'])
+def reload_knowledge_base():
+    """
+    Reload the symptom knowledge base from its data file
+
+    Requires the X-Admin-Token header to match ADMIN_TOKEN. Only the worker
+    that receives the request reloads; use SIGHUP or
+    KNOWLEDGE_BASE_CHECK_INTERVAL to update every worker.
+
+    Response:
+    {
+        "success": true,
+        "reloaded": true,
+        "version": "3f2a..."
+    }
+    """
+    if not is_admin_request():
+        return unauthorized()
+
+    try:
+        reloaded = analyzer.reload()
+
+        return jsonify({
+            'success': True,
+            'reloaded': reloaded,
+            'version': analyzer.knowledge_base.version,
+            'symptom_count': len(analyzer.knowledge_base.symptoms)
+        }), 200
+
+    except (OSError, ValueError) as e:
+        app.logger.error(f"Error in reload_knowledge_base: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': 'Knowledge base reload failed; the previous version is still active.',
+            'details': str(e)
         }), 500
 
 
@@ -0,0 +1,645 @@
+"""
+MedBlocAI ASGI Entry Point
+Asyncio serving mode with request coalescing for symptom analysis
+
+Run with:
+    uvicorn asgi:application --host 0.0.0.0 --port 5000
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+import asyncio
+import io
+import json
+import os
+import sys
+import time
+
+from werkzeug.exceptions import RequestEntityTooLarge
+
+import app as flask_module
+from admission import Rejected, retry_after_seconds
+from analysis_cache import serialize_response
+from live_analysis import CLOSED_EVENT, KEEPALIVE
+from stream_analysis import StreamAnalysis
+from profiling import ENVIRON_KEY
+
+
+# Worker threads for analysis of long inputs and for routes served by Flask
+ASGI_THREADS = int(os.getenv('ASGI_THREADS', 16))
+
+# Inputs up to this length are analyzed on the event loop: they take tens of
+# microseconds, less than a hand-off to a worker thread would cost
+ASGI_INLINE_MAX_CHARS = int(os.getenv('ASGI_INLINE_MAX_CHARS', 2048))
+
+# Buffer size of the request body stream Flask reads from
+REQUEST_READ_SIZE = 65536
+
+# Larger request bodies are refused with 413; others reach Flask as they arrive
+ASGI_MAX_BODY_BYTES = int(os.getenv(
+    'ASGI_MAX_BODY_BYTES', max(flask_module.UPLOAD_MAX_BYTES, flask_module.STREAM_MAX_BYTES)
+))
+
+# Analyze bodies up to this size are read on the loop to be answered there; larger ones go to Flask
+ASGI_BUFFER_MAX_BYTES = 1024 ** 2
+BODY_TOO_LARGE = {
+    'success': False,
+    'error': 'Request body too large.'
+}
+
+COALESCED_REQUESTS = flask_module.registry.counter(
+    'medblocai_analysis_coalesced_requests',
+    'Analyze requests answered by an identical analysis already in flight'
+)
+
+Send = Callable[[Dict[str, Any]], Awaitable[None]]
+Receive = Callable[[], Awaitable[Dict[str, Any]]]
+
+
+class RequestBody(io.RawIOBase):
+    """
+    wsgi.input that receives the ASGI request body as the app reads it.
+
+    Reads happen in the worker thread running Flask, which waits for each
+    message from the event loop, so no more than one message is held in
+    memory however large the body is.
+    """
+
+    def __init__(self, receive: Receive, loop: asyncio.AbstractEventLoop, received: bytes = b'',
+                 more_body: bool = True, limit: int = ASGI_MAX_BODY_BYTES):
+        super().__init__()
+        self._receive = receive
+        self._loop = loop
+        self._buffer = memoryview(received)
+        self._more_body = more_body
+        self._received = len(received)
+        self._limit = limit
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while not self._buffer and self._more_body:
+            message = asyncio.run_coroutine_threadsafe(self._receive(), self._loop).result()
+            if message['type'] == 'http.disconnect':
+                self._more_body = False
+                break
+            self._buffer = memoryview(message.get('body', b''))
+            self._more_body = message.get('more_body', False)
+            self._received += len(self._buffer)
+            if self._received > self._limit:
+                self._buffer = memoryview(b'')
+                self._more_body = False
+                raise RequestEntityTooLarge()
+
+        size = min(len(buffer), len(self._buffer))
+        buffer[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return size
+
+
+class RequestCoalescer:
+    """
+    Shares one computation between identical concurrent requests.
+
+    The first caller for a key starts the work on the executor; callers that
+    arrive with the same key while it is running await the same future
+    instead of computing the result again.
+    """
+
+    def __init__(self, executor: ThreadPoolExecutor):
+        self.executor = executor
+        self._in_flight: Dict[Hashable, asyncio.Future] = {}
+
+    async def run(self, key: Hashable, func: Callable[..., Any], *args) -> Tuple[Any, bool]:
+        """
+        Run func(*args) once per in-flight key
+
+        Returns:
+            (result, coalesced) where coalesced is True if another request computed it
+        """
+        future = self._in_flight.get(key)
+        if future is not None:
+            return await asyncio.shield(future), True
+
+        future = asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+        # Retrieve the exception even if every waiter has gone away
+        future.add_done_callback(lambda done: done.cancelled() or done.exception())
+        self._in_flight[key] = future
+        try:
+            # Shielded so a disconnecting client does not cancel work others wait on
+            return await asyncio.shield(future), False
+        finally:
+            if self._in_flight.get(key) is future:
+                del self._in_flight[key]
+
+    def __len__(self) -> int:
+        return len(self._in_flight)
+
+
+executor = ThreadPoolExecutor(max_workers=ASGI_THREADS, thread_name_prefix='asgi')
+coalescer = RequestCoalescer(executor)
+
+
+async def application(scope: Dict[str, Any], receive: Receive, send: Send) -> None:
+    """ASGI application exposing the same routes as the Flask app"""
+    if scope['type'] == 'lifespan':
+        await _lifespan(receive, send)
+        return
+
+    if scope['type'] != 'http':
+        return
+
+    # Profiled requests go through Flask, where the profiler wraps the app
+    profile_trigger = None
+    if flask_module.request_profiler is not None:
+        profile_trigger = flask_module.request_profiler.select(
+            scope['path'], _get_header(scope, b'x-profile'), _get_header(scope, b'x-admin-token')
+        )
+
+    content_length = _get_header(scope, b'content-length')
+    if content_length and content_length.isdigit() and int(content_length) > ASGI_MAX_BODY_BYTES:
+        await _send_json(scope, send, 413, serialize_response(BODY_TOO_LARGE))
+        return
+
+    if profile_trigger:
+        await _call_flask(scope, receive, send, profile_trigger)
+        return
+
+    # Streamed notes are analyzed as they arrive rather than read whole first
+    if scope['method'] == 'POST' and scope['path'] == '/api/analyze/stream':
+        if await _analyze_stream(scope, receive, send):
+            return
+
+    if scope['method'] == 'POST' and scope['path'] == '/api/analyze':
+        body, more_body = await _read_body(receive, ASGI_BUFFER_MAX_BYTES)
+        if not more_body and await _analyze_symptoms(scope, body, send):
+            return
+        await _call_flask(scope, receive, send, received=body, more_body=more_body)
+        return
+
+    if scope['method'] == 'GET' and flask_module.LIVE_EVENTS_PATH.match(scope['path']):
+        if await _stream_live_session(scope, receive, send):
+            return
+
+    await _call_flask(scope, receive, send)
+
+
+async def _lifespan(receive: Receive, send: Send) -> None:
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            executor.shutdown(wait=False)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def _check_knowledge_base() -> None:
+    """Run app.check_knowledge_base on the thread pool when it is due, since it can rebuild the knowledge base"""
+    if flask_module.knowledge_base_check_due():
+        await asyncio.get_running_loop().run_in_executor(executor, flask_module.check_knowledge_base)
+
+
+async def _read_body(receive: Receive, limit: int) -> Tuple[bytes, bool]:
+    """
+    Read the request body while it fits in limit bytes
+
+    Returns:
+        (body read so far, whether more of it is still to be received)
+    """
+    chunks = []
+    size = 0
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return b''.join(chunks), False
+        chunks.append(message.get('body', b''))
+        size += len(chunks[-1])
+        if not message.get('more_body', False):
+            return b''.join(chunks), False
+        if size > limit:
+            return b''.join(chunks), True
+
+
+def _get_header(scope: Dict[str, Any], name: bytes) -> Optional[str]:
+    for header_name, value in scope['headers']:
+        if header_name == name:
+            return value.decode('latin-1')
+    return None
+
+
+def _cors_headers(scope: Dict[str, Any]) -> List[Tuple[bytes, bytes]]:
+    """Access-Control-Allow-Origin as Flask-CORS sets it for /api/* routes"""
+    origin = _get_header(scope, b'origin')
+    if '*' in flask_module.allowed_origins:
+        return [(b'access-control-allow-origin', b'*')] if origin is not None else []
+
+    # The response depends on the Origin header, so caches must not share it between origins
+    headers = [(b'vary', b'Origin')]
+    if origin is not None and origin in flask_module.allowed_origins:
+        headers.append((b'access-control-allow-origin', origin.encode('latin-1')))
+    return headers
+
+
+def _client_id(scope: Dict[str, Any]) -> str:
+    """Same rate limit key as app.get_client_id"""
+    if flask_module.RATE_LIMIT_TRUST_FORWARDED:
+        forwarded = _get_header(scope, b'x-forwarded-for')
+        if forwarded:
+            return forwarded.split(',')[0].strip()
+    return scope['client'][0] if scope.get('client') else ''
+
+
+def _take_rate_limit_token(scope: Dict[str, Any]) -> float:
+    """
+    Charge the client's rate limit for this request
+
+    Marks the scope as charged, so Flask does not charge the request again
+    if it ends up serving it.
+
+    Returns:
+        0.0 if the request is allowed, otherwise seconds until a token is available
+    """
+    if flask_module.rate_limiter is None:
+        return 0.0
+    scope[flask_module.RATE_LIMIT_CHARGED_KEY] = True
+    return flask_module.rate_limiter.acquire(_client_id(scope))
+
+
+async def _send_rate_limited(scope: Dict[str, Any], send: Send, delay: float) -> None:
+    """429 response, as app.rejection_response builds it"""
+    await _send_json(
+        scope, send, 429, serialize_response({'success': False, 'error': flask_module.REJECTION_ERRORS[429]}),
+        [(b'retry-after', str(retry_after_seconds(delay)).encode('ascii'))]
+    )
+
+
+def _parse_analyze_request(scope: Dict[str, Any], body: bytes) -> Optional[str]:
+    """Return the symptom text of a well-formed analyze request, or None"""
+    content_type = (_get_header(scope, b'content-type') or '').split(';')[0].strip().lower()
+    if content_type != 'application/json' and not (
+            content_type.startswith('application/') and content_type.endswith('+json')):
+        return None
+
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        return None
+
+    if not isinstance(payload, dict) or not isinstance(payload.get('symptoms', ''), str):
+        return None
+
+    # Requests that update a patient timeline are served by Flask
+    if 'patient' in payload:
+        return None
+
+    return payload.get('symptoms', '').strip() or None
+
+
+async def _analyze_symptoms(scope: Dict[str, Any], body: bytes, send: Send) -> bool:
+    """
+    Serve POST /api/analyze on the event loop
+
+    Returns:
+        False if the request is not well-formed or has to queue for
+        admission; Flask then answers it, so error responses and queueing
+        behave the same in both serving modes
+    """
+    started = time.perf_counter()
+    await _check_knowledge_base()
+
+    symptoms_text = _parse_analyze_request(scope, body)
+    if symptoms_text is None:
+        return False
+
+    # Rate limits come before admission, as on the Flask path
+    metrics_enabled = flask_module.METRICS_ENABLED
+    extra_headers = []
+    delay = _take_rate_limit_token(scope)
+    if delay:
+        status = 429
+        response_body = serialize_response({'success': False, 'error': flask_module.REJECTION_ERRORS[429]})
+        extra_headers.append((b'retry-after', str(retry_after_seconds(delay)).encode('ascii')))
+    else:
+        # Requests that would have to queue wait in a worker thread on the Flask path
+        controller = flask_module.admission_controller
+        if controller is not None and not controller.try_acquire():
+            return False
+
+        try:
+            if metrics_enabled:
+                flask_module.PARSE_LATENCY.observe(time.perf_counter() - started)
+                flask_module.ANALYSIS_INPUT_SIZE.observe(len(symptoms_text))
+            status, response_body = await _run_analysis(symptoms_text, metrics_enabled)
+        finally:
+            if controller is not None:
+                controller.release()
+
+    headers = [
+        (b'content-type', b'application/json'),
+        (b'content-length', str(len(response_body)).encode('ascii'))
+    ]
+    headers.extend(extra_headers)
+    headers.extend(_cors_headers(scope))
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': response_body})
+
+    if metrics_enabled:
+        flask_module.REQUEST_LATENCY.labels('/api/analyze').observe(time.perf_counter() - started)
+        flask_module.REQUEST_COUNT.labels('/api/analyze', 'POST', status).inc()
+        if body:
+            flask_module.REQUEST_BODY_SIZE.labels('/api/analyze').observe(len(body))
+
+    if flask_module.traffic_capture is not None:
+        flask_module.traffic_capture.record('POST', '/api/analyze', '/api/analyze', {'symptoms': symptoms_text}, status)
+
+    return True
+
+
+async def _run_analysis(symptoms_text: str, metrics_enabled: bool) -> Tuple[int, bytes]:
+    """Analyze inline or on the thread pool; returns (status, body)"""
+    analyzer = flask_module.analyzer
+    try:
+        # A local cache miss goes to the shared tier over a blocking socket, which must stay off the loop
+        if len(symptoms_text) <= ASGI_INLINE_MAX_CHARS and analyzer.cache.shared is None:
+            return 200, analyzer.analyze_symptoms_json(symptoms_text)
+
+        response_body, coalesced = await coalescer.run(
+            symptoms_text, analyzer.analyze_symptoms_json, symptoms_text
+        )
+        if coalesced and metrics_enabled:
+            COALESCED_REQUESTS.inc()
+        return 200, response_body
+
+    except Exception as e:
+        flask_module.app.logger.error(f"Error in analyze_symptoms: {str(e)}")
+        return 500, serialize_response({
+            'success': False,
+            'error': 'An error occurred while analyzing symptoms.',
+            'details': str(e) if flask_module.app.debug else None
+        })
+
+
+async def _send_json(scope: Dict[str, Any], send: Send, status: int, body: bytes,
+                     extra_headers: Optional[List[Tuple[bytes, bytes]]] = None) -> None:
+    headers = [
+        (b'content-type', b'application/json'),
+        (b'content-length', str(len(body)).encode('ascii'))
+    ]
+    headers.extend(extra_headers or [])
+    headers.extend(_cors_headers(scope))
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def _analyze_stream(scope: Dict[str, Any], receive: Receive, send: Send) -> bool:
+    """
+    Serve POST /api/analyze/stream, matching the body as it arrives
+
+    Returns:
+        False if the body is not plain text; Flask then rejects it
+    """
+    started = time.perf_counter()
+    content_type = (_get_header(scope, b'content-type') or '').split(';')[0].strip().lower()
+    if content_type != 'text/plain':
+        return False
+
+    await _check_knowledge_base()
+    content_length = _get_header(scope, b'content-length')
+    if content_length and content_length.isdigit() and int(content_length) > flask_module.STREAM_MAX_BYTES:
+        await _send_json(scope, send, 413, serialize_response(flask_module.STREAM_TOO_LARGE))
+        return True
+
+    delay = _take_rate_limit_token(scope)
+    if delay:
+        await _send_rate_limited(scope, send, delay)
+        return True
+
+    loop = asyncio.get_running_loop()
+    controller = flask_module.admission_controller
+    if controller is not None:
+        try:
+            # Queue for a slot in a worker thread, as the Flask path does
+            await loop.run_in_executor(executor, controller.acquire)
+        except Rejected as e:
+            await _send_json(
+                scope, send, e.status,
+                serialize_response({'success': False, 'error': flask_module.REJECTION_ERRORS[e.status]}),
+                [(b'retry-after', str(e.retry_after).encode('ascii'))]
+            )
+            return True
+
+    analysis = StreamAnalysis(flask_module.analyzer.knowledge_base, max_positions=flask_module.STREAM_MAX_POSITIONS)
+    try:
+        pending = []
+        pending_size = 0
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return True
+            data = message.get('body', b'')
+            more_body = message.get('more_body', False)
+            if analysis.bytes_read + pending_size + len(data) > flask_module.STREAM_MAX_BYTES:
+                status, response_body = 413, serialize_response(flask_module.STREAM_TOO_LARGE)
+                break
+            pending.append(data)
+            pending_size += len(data)
+            # Matching runs on the thread pool, a read size at a time
+            if pending_size >= flask_module.STREAM_READ_SIZE or not more_body:
+                await loop.run_in_executor(executor, analysis.feed, b''.join(pending))
+                pending = []
+                pending_size = 0
+            if not more_body:
+                if analysis.bytes_read:
+                    status = 200
+                    response_body = await loop.run_in_executor(
+                        executor, flask_module.finish_stream_analysis, analysis
+                    )
+                else:
+                    status, response_body = 400, serialize_response(flask_module.STREAM_EMPTY)
+                break
+    except Exception as e:
+        flask_module.app.logger.error(f"Error in analyze_stream: {str(e)}")
+        status, response_body = 500, serialize_response({
+            'success': False,
+            'error': 'An error occurred while analyzing the text.',
+            'details': str(e) if flask_module.app.debug else None
+        })
+    finally:
+        if controller is not None:
+            controller.release()
+
+    await _send_json(scope, send, status, response_body)
+
+    if flask_module.METRICS_ENABLED:
+        flask_module.REQUEST_LATENCY.labels('/api/analyze/stream').observe(time.perf_counter() - started)
+        flask_module.REQUEST_COUNT.labels('/api/analyze/stream', 'POST', status).inc()
+        flask_module.REQUEST_BODY_SIZE.labels('/api/analyze/stream').observe(analysis.bytes_read)
+
+    return True
+
+
+async def _wait_for_disconnect(receive: Receive) -> None:
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def _stream_live_session(scope: Dict[str, Any], receive: Receive, send: Send) -> bool:
+    """
+    Serve a live analysis event stream on the event loop
+
+    Streams stay open for as long as the user types; served here they cost
+    a coroutine rather than a worker thread each.
+
+    Returns:
+        False if the session does not exist; Flask then sends the error response
+    """
+    session = flask_module.live_sessions.get(scope['path'].split('/')[4])
+    if session is None:
+        return False
+    delay = _take_rate_limit_token(scope)
+    if delay:
+        await _send_rate_limited(scope, send, delay)
+        return True
+
+    loop = asyncio.get_running_loop()
+    changed = asyncio.Event()
+    unsubscribe = session.subscribe(lambda: loop.call_soon_threadsafe(changed.set))
+    disconnected = asyncio.ensure_future(_wait_for_disconnect(receive))
+
+    last_event_id = _get_header(scope, b'last-event-id') or ''
+    sent_version = int(last_event_id) if last_event_id.isdigit() else None
+
+    headers = [
+        (b'content-type', b'text/event-stream; charset=utf-8'),
+        (b'cache-control', b'no-cache'),
+        (b'x-accel-buffering', b'no')
+    ]
+    headers.extend(_cors_headers(scope))
+    try:
+        await send({'type': 'http.response.start', 'status': 200, 'headers': headers})
+        while not disconnected.done():
+            changed.clear()
+            message, sent_version = session.next_event(sent_version)
+            if message is not None:
+                await send({'type': 'http.response.body', 'body': message, 'more_body': True})
+                if message is CLOSED_EVENT:
+                    break
+                continue
+
+            waiter = asyncio.ensure_future(changed.wait())
+            done, _ = await asyncio.wait(
+                {waiter, disconnected}, timeout=flask_module.LIVE_HEARTBEAT_INTERVAL,
+                return_when=asyncio.FIRST_COMPLETED
+            )
+            waiter.cancel()
+            if not done:
+                await send({'type': 'http.response.body', 'body': KEEPALIVE, 'more_body': True})
+
+        if not disconnected.done():
+            await send({'type': 'http.response.body', 'body': b''})
+    except OSError:
+        # Client went away while a message was being sent
+        pass
+    finally:
+        unsubscribe()
+        disconnected.cancel()
+
+    if flask_module.METRICS_ENABLED:
+        flask_module.REQUEST_COUNT.labels('/api/analyze/live/<session_id>/events', 'GET', 200).inc()
+
+    return True
+
+
+def _wsgi_environ(scope: Dict[str, Any], wsgi_input: io.BufferedReader) -> Dict[str, Any]:
+    """Build a WSGI environ for an HTTP request whose body is read from wsgi_input"""
+    server_name, server_port = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server_name,
+        'SERVER_PORT': str(server_port),
+        'SERVER_PROTOCOL': f"HTTP/{scope['http_version']}",
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': wsgi_input,
+        # The input ends with the body, so chunked requests without a length can be read too
+        'wsgi.input_terminated': True,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+    if scope.get(flask_module.RATE_LIMIT_CHARGED_KEY):
+        environ[flask_module.RATE_LIMIT_CHARGED_KEY] = True
+
+    for name, value in scope['headers']:
+        name = name.decode('latin-1')
+        value = value.decode('latin-1')
+        if name == 'content-type':
+            environ['CONTENT_TYPE'] = value
+        elif name == 'content-length':
+            environ['CONTENT_LENGTH'] = value
+        else:
+            key = 'HTTP_' + name.upper().replace('-', '_')
+            environ[key] = f'{environ[key]},{value}' if key in environ else value
+
+    return environ
+
+
+def _run_flask(environ: Dict[str, Any], loop: asyncio.AbstractEventLoop, send: Send) -> None:
+    """Run the Flask app in a worker thread, forwarding its response to the event loop"""
+    response_start = {}
+
+    def start_response(status, headers, exc_info=None):
+        response_start['status'] = int(status.split(' ', 1)[0])
+        response_start['headers'] = [
+            (name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers
+        ]
+
+    def forward(message):
+        # Waits for the send, so a slow client pushes back on the generator
+        asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+    result = flask_module.app(environ, start_response)
+    started = False
+    try:
+        # Each chunk is sent as it is produced, so NDJSON lines and events are not held back
+        for chunk in result:
+            if not chunk:
+                continue
+            if not started:
+                forward({'type': 'http.response.start', **response_start})
+                started = True
+            forward({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+
+    if not started:
+        forward({'type': 'http.response.start', **response_start})
+    forward({'type': 'http.response.body', 'body': b''})
+
+
+async def _call_flask(scope: Dict[str, Any], receive: Receive, send: Send, profile_trigger: Optional[str] = None,
+                      received: bytes = b'', more_body: bool = True) -> None:
+    """
+    Serve a request with the Flask app on the thread pool
+
+    Args:
+        received: Start of the body, already read from receive
+        more_body: Whether the rest of the body is still to be received
+    """
+    loop = asyncio.get_running_loop()
+    wsgi_input = io.BufferedReader(RequestBody(receive, loop, received, more_body), REQUEST_READ_SIZE)
+    environ = _wsgi_environ(scope, wsgi_input)
+    if profile_trigger is not None:
+        # The request was already considered for profiling; Flask must not sample it again
+        environ[ENVIRON_KEY] = profile_trigger
+    await loop.run_in_executor(executor, _run_flask, environ, loop, send)
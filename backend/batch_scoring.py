@@ -0,0 +1,288 @@
+"""
+Batch Scoring Module
+NumPy-vectorized severity, category and urgency scoring for many texts at once
+"""
+
+from itertools import repeat
+from typing import Any, Dict, Iterator, List, NamedTuple, Sequence, Tuple
+import re
+
+import numpy as np
+
+from knowledge_base import KnowledgeBase
+from symptom_matcher import WORD_PATTERN
+
+
+# Splits text into alternating words and separators: words[k] = parts[2k]
+SPLIT_PATTERN = re.compile(r'(\W+)')
+
+# Maps every ASCII non-word character to a space, keeping offsets unchanged
+ASCII_NON_WORD_TO_SPACE = str.maketrans({
+    chr(code): ' ' for code in range(128) if not re.match(r'\w', chr(code))
+})
+
+# Joins lowercased texts; uppercase can never survive str.lower(), so this
+# word token cannot occur inside an input and marks the text boundaries
+TEXT_SEPARATOR = ' X '
+BOUNDARY_WORD = 'X'
+
+# Per-word lookup codes; non-negative codes are symptom ids
+_VERIFY = -3
+_BOUNDARY = -2
+_NO_MATCH = -1
+_CANDIDATE = 0
+
+
+class BatchScores(NamedTuple):
+    """
+    Vectorized scoring results for N texts over a vocabulary of V symptoms.
+
+    The text x symptom incidence matrix is stored in CSR form: the symptoms
+    detected in text i are `indices[indptr[i]:indptr[i + 1]]`, sorted in
+    vocabulary order.
+    """
+    indptr: np.ndarray              # (N + 1,) int64
+    indices: np.ndarray             # (nnz,) int32 symptom ids
+    max_priority: np.ndarray        # (N,) int16, 0 when nothing was detected
+    severity_codes: np.ndarray      # (N,) int8 index into severity_names, -1 for unknown
+    urgency_codes: np.ndarray       # (N,) int8 index into urgency_names
+    affected_categories: np.ndarray  # (N, C) bool mask over category_names
+    symptom_names: Tuple[str, ...]
+    severity_names: Tuple[str, ...]
+    urgency_names: Tuple[str, ...]
+    category_names: Tuple[str, ...]
+
+    def __len__(self) -> int:
+        return len(self.max_priority)
+
+    def records(self) -> Iterator[Dict[str, Any]]:
+        """Yield one summary dict per text, in input order"""
+        symptom_names = self.symptom_names
+        category_names = self.category_names
+        indptr = self.indptr.tolist()
+        indices = self.indices.tolist()
+        severities = self.severity_codes.tolist()
+        urgencies = self.urgency_codes.tolist()
+
+        for i in range(len(severities)):
+            detected = indices[indptr[i]:indptr[i + 1]]
+            yield {
+                'detected_symptoms': [symptom_names[s] for s in detected],
+                'severity': self.severity_names[severities[i]] if severities[i] >= 0 else 'unknown',
+                'urgency': self.urgency_names[urgencies[i]],
+                'affected_systems': [category_names[c] for c in np.flatnonzero(self.affected_categories[i])]
+            }
+
+
+class BatchScorer:
+    """
+    Scores many texts per call against one knowledge base snapshot.
+
+    Texts are lowercased and joined into a single corpus that is split into
+    words once, and a dict lookup is mapped over all words. For ASCII input,
+    words that are complete single-word symptoms resolve straight to their
+    symptom id; only words that begin a multi-word term are checked in Python,
+    by comparing the term against the corpus at that word's offset. Other
+    input falls back to walking the matcher's trie from each candidate word.
+    Everything after matching, i.e. de-duplication, per-text max severity,
+    category masks and urgency, is done with array operations.
+
+    With fuzzy matching enabled, each distinct out-of-vocabulary word is
+    replaced by its typo correction before matching, which gives the same
+    symptoms as extract_symptoms.
+    """
+
+    def __init__(self, knowledge_base: KnowledgeBase):
+        self.knowledge_base = knowledge_base
+        self.matcher = knowledge_base.matcher
+        self.symptom_names = self.matcher.terms
+
+        # Terms and synonym phrases grouped by their first word
+        terms_by_first_word: Dict[str, List[Tuple[int, str]]] = {}
+        for phrase, symptom_id in self.matcher.phrases.items():
+            first_word = WORD_PATTERN.match(phrase).group()
+            terms_by_first_word.setdefault(first_word, []).append((symptom_id, phrase))
+
+        # ASCII lookup: a symptom id when the word can only be that symptom,
+        # otherwise a marker that the terms starting with it need checking
+        self._terms_by_first_word = terms_by_first_word
+        self._ascii_word_codes = {
+            word: terms[0][0] if len(terms) == 1 and terms[0][1] == word else _VERIFY
+            for word, terms in terms_by_first_word.items()
+        }
+        self._ascii_word_codes[BOUNDARY_WORD] = _BOUNDARY
+
+        # Unicode lookup: symptom-starting words and the text boundary marker
+        self._word_codes = {word: _CANDIDATE for word in self.matcher.first_words}
+        self._word_codes[BOUNDARY_WORD] = _BOUNDARY
+
+        # Per-symptom priority and category id, in matcher vocabulary order
+        self.category_names = tuple(knowledge_base.category_index.keys())
+        category_ids = {name: i for i, name in enumerate(self.category_names)}
+        records = [knowledge_base.symptoms[name] for name in self.symptom_names]
+        self._symptom_priority = np.array([r.severity_priority for r in records], dtype=np.int16)
+        self._symptom_category = np.array([category_ids[r.category] for r in records], dtype=np.int32)
+
+        # Lookup tables from max priority to severity and urgency codes
+        levels = sorted(knowledge_base.severity_levels.items(), key=lambda item: item[1].priority)
+        self.severity_names = tuple(name for name, _ in levels)
+        self.urgency_names = tuple(dict.fromkeys(['low'] + [level.urgency for _, level in levels]))
+
+        max_priority = levels[-1][1].priority if levels else 0
+        self._severity_by_priority = np.full(max_priority + 1, -1, dtype=np.int8)
+        self._urgency_by_priority = np.zeros(max_priority + 1, dtype=np.int8)
+        for code, (_, level) in enumerate(levels):
+            self._severity_by_priority[level.priority] = code
+            self._urgency_by_priority[level.priority] = self.urgency_names.index(level.urgency)
+
+    def incidence(self, texts: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Build the CSR text x symptom incidence matrix for a batch
+
+        Args:
+            texts: Input strings
+
+        Returns:
+            (indptr, indices) with each row's symptom ids sorted and unique
+        """
+        text_count = len(texts)
+        if text_count == 0:
+            return np.zeros(1, dtype=np.int64), np.zeros(0, dtype=np.int32)
+
+        corpus = TEXT_SEPARATOR.join(map(str.lower, texts))
+        if self.matcher.fuzzy is not None:
+            corpus = self._correct_typos(corpus)
+        if corpus.isascii():
+            text_of_word, hit_words, hit_symptoms = self._match_ascii(corpus)
+        else:
+            text_of_word, hit_words, hit_symptoms = self._match_unicode(corpus)
+
+        vocabulary_size = len(self.symptom_names)
+        keys = np.unique(text_of_word[hit_words] * vocabulary_size + hit_symptoms)
+
+        rows = keys // vocabulary_size
+        indices = (keys % vocabulary_size).astype(np.int32)
+        indptr = np.zeros(text_count + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=text_count), out=indptr[1:])
+
+        return indptr, indices
+
+    def _correct_typos(self, corpus: str) -> str:
+        """Replace misspelt words with their vocabulary word, as matcher.scan does"""
+        if corpus.isascii():
+            words = set(corpus.translate(ASCII_NON_WORD_TO_SPACE).split(' '))
+        else:
+            words = set(WORD_PATTERN.findall(corpus))
+
+        # Vocabulary words are never corrected, and corrections are cached per word
+        fuzzy = self.matcher.fuzzy
+        corrections = {}
+        for word in words - self.matcher.vocabulary_words:
+            if len(word) >= fuzzy.min_length:
+                corrected = fuzzy.correct(word)
+                if corrected is not None:
+                    corrections[word] = corrected
+        if not corrections:
+            return corpus
+
+        parts = SPLIT_PATTERN.split(corpus)
+        parts[0::2] = [corrections.get(word, word) for word in parts[0::2]]
+        return ''.join(parts)
+
+    def _match_ascii(self, corpus: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Find (text, word, symptom) hits in an ASCII corpus"""
+        # One-to-one character mapping, so word offsets in `mapped` match `corpus`
+        mapped = corpus.translate(ASCII_NON_WORD_TO_SPACE)
+        words = mapped.split(' ')
+
+        codes = np.fromiter(
+            map(self._ascii_word_codes.get, words, repeat(_NO_MATCH)),
+            dtype=np.int32,
+            count=len(words)
+        )
+        text_of_word = np.cumsum(codes == _BOUNDARY, dtype=np.int64)
+
+        # Single-word symptoms resolve without any Python-level work
+        direct_words = np.flatnonzero(codes >= 0)
+        hit_words = [direct_words]
+        hit_symptoms = [codes[direct_words].astype(np.int64)]
+
+        verify_words = np.flatnonzero(codes == _VERIFY)
+        if len(verify_words):
+            word_lengths = np.fromiter(map(len, words), dtype=np.int64, count=len(words)) + 1
+            word_starts = np.cumsum(word_lengths) - word_lengths
+
+            corpus_length = len(corpus)
+            verified_words: List[int] = []
+            verified_symptoms: List[int] = []
+            terms_by_first_word = self._terms_by_first_word
+
+            for i, start in zip(verify_words.tolist(), word_starts[verify_words].tolist()):
+                for symptom_id, term in terms_by_first_word[words[i]]:
+                    end = start + len(term)
+                    # Exact text at the word, followed by a word boundary
+                    if corpus.startswith(term, start) and (end == corpus_length or mapped[end] == ' '):
+                        verified_words.append(i)
+                        verified_symptoms.append(symptom_id)
+
+            hit_words.append(np.asarray(verified_words, dtype=np.int64))
+            hit_symptoms.append(np.asarray(verified_symptoms, dtype=np.int64))
+
+        return text_of_word, np.concatenate(hit_words), np.concatenate(hit_symptoms)
+
+    def _match_unicode(self, corpus: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Find (text, word, symptom) hits in a corpus with non-ASCII characters"""
+        parts = SPLIT_PATTERN.split(corpus)
+        words = parts[0::2]
+        separators = parts[1::2]
+
+        codes = np.fromiter(
+            map(self._word_codes.get, words, repeat(_NO_MATCH)),
+            dtype=np.int8,
+            count=len(words)
+        )
+        text_of_word = np.cumsum(codes == _BOUNDARY, dtype=np.int64)
+
+        # Only candidate words go through the trie walk in Python
+        hit_words: List[int] = []
+        hit_symptoms: List[int] = []
+        walk = self.matcher.walk
+        for i in np.flatnonzero(codes == _CANDIDATE).tolist():
+            for symptom_id, _ in walk(words, separators, i):
+                hit_words.append(i)
+                hit_symptoms.append(symptom_id)
+
+        return text_of_word, np.asarray(hit_words, dtype=np.int64), np.asarray(hit_symptoms, dtype=np.int64)
+
+    def score(self, texts: Sequence[str]) -> BatchScores:
+        """
+        Score a batch of texts
+
+        Args:
+            texts: Input strings
+
+        Returns:
+            BatchScores with per-text severity, urgency and category masks
+        """
+        indptr, indices = self.incidence(texts)
+        text_count = len(indptr) - 1
+        rows = np.repeat(np.arange(text_count), np.diff(indptr))
+
+        max_priority = np.zeros(text_count, dtype=np.int16)
+        np.maximum.at(max_priority, rows, self._symptom_priority[indices])
+
+        affected_categories = np.zeros((text_count, len(self.category_names)), dtype=bool)
+        affected_categories[rows, self._symptom_category[indices]] = True
+
+        return BatchScores(
+            indptr=indptr,
+            indices=indices,
+            max_priority=max_priority,
+            severity_codes=self._severity_by_priority[max_priority],
+            urgency_codes=self._urgency_by_priority[max_priority],
+            affected_categories=affected_categories,
+            symptom_names=self.symptom_names,
+            severity_names=self.severity_names,
+            urgency_names=self.urgency_names,
+            category_names=self.category_names
+        )
@@ -0,0 +1,278 @@
+"""
+Benchmark Suite
+Latency benchmarks for the analysis hot path with baseline regression checks
+
+Usage:
+    python benchmark.py run --output bench.json
+    python benchmark.py run --output bench.json --baseline baseline.json --threshold 0.15
+    python benchmark.py compare baseline.json bench.json
+"""
+
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import argparse
+import json
+import os
+import platform
+import random
+import string
+import sys
+import time
+
+from ai_model import HealthAnalyzer
+from knowledge_base import KnowledgeBase, load_knowledge_base
+
+
+FORMAT_VERSION = 1
+
+# Filler vocabulary for synthetic clinical notes
+FILLER_WORDS = (
+    'patient reports since yesterday with mild worse after eating and at night '
+    'denies recent travel no known allergies feels better when resting the a of'
+).split()
+
+
+def measure(func: Callable[[], Any], iterations: int, warmup: int) -> Dict[str, float]:
+    """
+    Time individual calls of func
+
+    Returns:
+        p50/p90/p99/mean latency in microseconds plus calls per second
+    """
+    for _ in range(warmup):
+        func()
+
+    perf_counter_ns = time.perf_counter_ns
+    samples = []
+    started = perf_counter_ns()
+    for _ in range(iterations):
+        call_started = perf_counter_ns()
+        func()
+        samples.append(perf_counter_ns() - call_started)
+    elapsed = perf_counter_ns() - started
+
+    samples.sort()
+
+    def percentile(fraction: float) -> float:
+        return samples[min(int(fraction * len(samples)), len(samples) - 1)] / 1000
+
+    return {
+        'p50_us': percentile(0.50),
+        'p90_us': percentile(0.90),
+        'p99_us': percentile(0.99),
+        'mean_us': sum(samples) / len(samples) / 1000,
+        'ops_per_sec': iterations / (elapsed / 1e9),
+        'iterations': iterations
+    }
+
+
+def synthetic_note(rng: random.Random, word_count: int, symptoms: List[str], symptom_count: int) -> str:
+    """Build a note of about word_count words mentioning symptom_count symptoms"""
+    words = [rng.choice(FILLER_WORDS) for _ in range(max(word_count - symptom_count, 0))]
+    for symptom in rng.sample(symptoms, min(symptom_count, len(symptoms))):
+        words.insert(rng.randrange(len(words) + 1), symptom)
+    return ' '.join(words)
+
+
+def synthetic_knowledge_base(base: KnowledgeBase, vocabulary_size: int, rng: random.Random) -> KnowledgeBase:
+    """Extend the real knowledge base with generated symptoms up to vocabulary_size"""
+    symptoms = {name: dict(info) for name, info in base.symptom_database.items()}
+    template = next(iter(symptoms.values()))
+
+    while len(symptoms) < vocabulary_size:
+        words = [''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(5, 10)))
+                 for _ in range(rng.choice((1, 1, 2, 3)))]
+        symptoms.setdefault(' '.join(words), dict(template, synonyms=[]))
+
+    data = {
+        'severity_levels': {name: level._asdict() for name, level in base.severity_levels.items()},
+        'symptoms': symptoms,
+        'tips': {name: {'title': tips.title, 'tips': list(tips.tips)} for name, tips in base.tips.items()},
+        'matching': {'fuzzy_max_edits': 1 if base.matcher.fuzzy else 0}
+    }
+    return KnowledgeBase(data)
+
+
+def model_cases(quick: bool) -> List[Tuple[str, Callable[[], Any]]]:
+    """Extractor, analyzer and tips cases, with scaling sweeps"""
+    rng = random.Random(42)
+    analyzer = HealthAnalyzer()
+    uncached = HealthAnalyzer(cache_size=0)
+    symptoms = list(analyzer.knowledge_base.symptoms.keys())
+    cases = []
+
+    # Input length
+    for word_count in (10, 100, 1000) if quick else (10, 100, 1000, 10000):
+        note = synthetic_note(rng, word_count, symptoms, 2)
+        cases.append((f'extract/words={word_count}', lambda note=note: analyzer.extract_symptoms(note)))
+
+    # Number of symptoms mentioned
+    for symptom_count in (0, 1, 5, 10):
+        note = synthetic_note(rng, 50, symptoms, symptom_count)
+        cases.append((f'extract/symptoms={symptom_count}', lambda note=note: analyzer.extract_symptoms(note)))
+        cases.append((f'analyze_uncached/symptoms={symptom_count}',
+                      lambda note=note: uncached.analyze_symptoms(note)))
+        cases.append((f'analyze_cached/symptoms={symptom_count}',
+                      lambda note=note: analyzer.analyze_symptoms_json(note)))
+
+    # Vocabulary size
+    base = load_knowledge_base()
+    for vocabulary_size in (10, 1000) if quick else (10, 1000, 5000):
+        scaled = HealthAnalyzer(cache_size=0)
+        scaled.set_knowledge_base(synthetic_knowledge_base(base, vocabulary_size, rng))
+        note = synthetic_note(rng, 100, symptoms, 3)
+        cases.append((f'extract/vocabulary={vocabulary_size}', lambda a=scaled, note=note: a.extract_symptoms(note)))
+
+    for category in ('general', 'respiratory', 'unknown'):
+        cases.append((f'tips/{category}', lambda category=category: analyzer.get_health_tips(category)))
+
+    return cases
+
+
+def route_cases() -> List[Tuple[str, Callable[[], Any]]]:
+    """End-to-end cases through the Flask test client, one per route"""
+    os.environ.setdefault('ADMIN_TOKEN', 'benchmark')
+    from app import app
+
+    client = app.test_client()
+    admin_headers = {'X-Admin-Token': os.environ['ADMIN_TOKEN']}
+    etag = client.get('/api/symptoms').headers.get('ETag')
+    batch = ['I have a headache and fever', 'chest pain', 'no complaints'] * 10
+
+    return [
+        ('route/GET /', lambda: client.get('/')),
+        ('route/GET /api/health', lambda: client.get('/api/health')),
+        ('route/GET /api/symptoms', lambda: client.get('/api/symptoms')),
+        ('route/GET /api/symptoms (304)', lambda: client.get('/api/symptoms', headers={'If-None-Match': etag})),
+        ('route/GET /api/tips', lambda: client.get('/api/tips')),
+        ('route/GET /api/tips/<category>', lambda: client.get('/api/tips/respiratory')),
+        ('route/POST /api/analyze', lambda: client.post('/api/analyze', json={'symptoms': 'I have a headache and fever'})),
+        ('route/POST /api/analyze/batch (30)', lambda: client.post('/api/analyze/batch', json=batch).get_data()),
+        ('route/GET /metrics', lambda: client.get('/metrics')),
+        ('route/POST /api/admin/reload', lambda: client.post('/api/admin/reload', headers=admin_headers)),
+    ]
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    """Run all selected cases and return the results document"""
+    iterations = 300 if args.quick else args.iterations
+    warmup = max(iterations // 10, 10)
+
+    cases = []
+    if args.suite in ('all', 'model'):
+        cases.extend(model_cases(args.quick))
+    if args.suite in ('all', 'routes'):
+        cases.extend(route_cases())
+
+    results = {}
+    for name, func in cases:
+        if args.filter and args.filter not in name:
+            continue
+        results[name] = measure(func, iterations, warmup)
+        stats = results[name]
+        print(f"{name:<45} p50 {stats['p50_us']:>10.1f}us  p99 {stats['p99_us']:>10.1f}us  "
+              f"{stats['ops_per_sec']:>12,.0f} ops/s", file=sys.stderr)
+
+    return {
+        'format_version': FORMAT_VERSION,
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'machine': platform.machine(),
+            'cpu_count': os.cpu_count(),
+            'iterations': iterations
+        },
+        'results': results
+    }
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float,
+            p99_threshold: Optional[float] = None) -> List[str]:
+    """
+    Compare two result documents
+
+    Returns:
+        Descriptions of cases whose p50 or p99 latency regressed past the threshold
+    """
+    p99_threshold = threshold if p99_threshold is None else p99_threshold
+    regressions = []
+
+    for name, stats in current['results'].items():
+        base = baseline['results'].get(name)
+        if base is None:
+            continue
+
+        for metric, limit in (('p50_us', threshold), ('p99_us', p99_threshold)):
+            change = stats[metric] / base[metric] - 1 if base[metric] else 0.0
+            marker = ''
+            if change > limit:
+                marker = '  REGRESSION'
+                regressions.append(f"{name} {metric}: {base[metric]:.1f}us -> {stats[metric]:.1f}us ({change:+.1%})")
+            print(f"{name:<45} {metric} {base[metric]:>10.1f} -> {stats[metric]:>10.1f}us {change:>+8.1%}{marker}",
+                  file=sys.stderr)
+
+    return regressions
+
+
+def _load(path: str) -> Dict[str, Any]:
+    with open(path, 'r', encoding='utf-8') as f:
+        document = json.load(f)
+    if document.get('format_version') != FORMAT_VERSION:
+        raise ValueError(f"'{path}' is not a benchmark results file of version {FORMAT_VERSION}")
+    return document
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description='Benchmark the symptom analysis hot path.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='Run benchmarks and write results')
+    run_parser.add_argument('--output', default='benchmark_results.json', help='Results file to write')
+    run_parser.add_argument('--suite', choices=['all', 'model', 'routes'], default='all')
+    run_parser.add_argument('--filter', help='Only run cases whose name contains this text')
+    run_parser.add_argument('--iterations', type=int, default=2000, help='Timed calls per case')
+    run_parser.add_argument('--quick', action='store_true', help='Fewer iterations and smaller sweeps')
+    run_parser.add_argument('--baseline', help='Compare against this results file after running')
+
+    for sub in (run_parser, commands.add_parser('compare', help='Compare two results files')):
+        sub.add_argument('--threshold', type=float, default=0.10, help='Allowed p50 slowdown, e.g. 0.10 for 10%%')
+        sub.add_argument('--p99-threshold', type=float, help='Allowed p99 slowdown (default: --threshold)')
+
+    compare_parser = commands.choices['compare']
+    compare_parser.add_argument('baseline', help='Stored baseline results')
+    compare_parser.add_argument('current', help='New results')
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+
+    try:
+        if args.command == 'run':
+            current = run(args)
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump(current, f, indent=2)
+            baseline = _load(args.baseline) if args.baseline else None
+        else:
+            baseline = _load(args.baseline)
+            current = _load(args.current)
+    except (OSError, ValueError) as e:
+        print(f"benchmark: {e}", file=sys.stderr)
+        return 2
+
+    if baseline is None:
+        return 0
+
+    regressions = compare(baseline, current, args.threshold, args.p99_threshold)
+    if regressions:
+        print(f"\n{len(regressions)} regression(s):", file=sys.stderr)
+        for regression in regressions:
+            print(f"  {regression}", file=sys.stderr)
+        return 1
+
+    print('\nNo regressions.', file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
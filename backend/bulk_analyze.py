@@ -0,0 +1,423 @@
+"""
+Bulk Analysis CLI
+Streams exported intake archives through HealthAnalyzer on a process pool
+
+Usage:
+    python bulk_analyze.py intake.csv.gz results.jsonl --text-field symptoms --id-field intake_id
+    python bulk_analyze.py intake.jsonl results/ --format parquet --workers 8 --resume
+"""
+
+from collections import deque
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+import argparse
+import csv
+import gzip
+import io
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+from ai_model import HealthAnalyzer
+
+
+CHECKPOINT_VERSION = 2
+
+# Free-text notes can exceed the csv module's default of 131072 characters per field
+CSV_FIELD_SIZE_LIMIT = 64 * 1024 ** 2
+
+# Built once per worker process by _init_worker
+_worker_analyzer: Optional[HealthAnalyzer] = None
+_worker_options: Dict[str, Any] = {}
+
+
+def _open_input(path: str) -> io.BufferedReader:
+    """Open an input file for binary reading, transparently decompressing .gz"""
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    return open(path, 'rb')
+
+
+def _input_format(path: str, explicit: Optional[str]) -> str:
+    """Resolve the input format from the flag or the file extension"""
+    if explicit:
+        return explicit
+
+    name = path[:-3] if path.endswith('.gz') else path
+    if name.endswith('.csv'):
+        return 'csv'
+    if name.endswith(('.jsonl', '.ndjson')):
+        return 'jsonl'
+    raise ValueError(f"Cannot infer input format of '{path}'; pass --input-format")
+
+
+def _counted_lines(stream: io.BufferedReader, position: List[int]) -> Iterator[bytes]:
+    """Iterate over lines, keeping position[0] at the input offset just past the last line returned"""
+    for line in stream:
+        position[0] += len(line)
+        yield line
+
+
+def iter_records(stream: io.BufferedReader, input_format: str, text_field: str,
+                 id_field: Optional[str], offset: int = 0) -> Iterator[Tuple[Any, str, int]]:
+    """
+    Yield (record_id, text, end_offset) triples from a CSV or JSONL byte stream
+
+    Args:
+        stream: Binary input stream, positioned at the start
+        input_format: 'csv' or 'jsonl'
+        text_field: Column or key holding the symptom text
+        id_field: Column or key holding the record id, if any
+        offset: Uncompressed input offset to continue from, as returned in
+            end_offset; the records before it are skipped without being parsed
+
+    Raises:
+        ValueError: For a JSONL line that is not a JSON object, with its line number
+        csv.Error: For malformed CSV, with its line number
+    """
+    position = [0]
+
+    if input_format == 'jsonl':
+        if offset:
+            stream.seek(offset)
+            position[0] = offset
+        for line_number, line in enumerate(_counted_lines(stream, position), start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                raise ValueError(f"JSONL input line {line_number}{_after(offset)}: {e}") from e
+            if not isinstance(record, dict):
+                raise ValueError(
+                    f"JSONL input line {line_number}{_after(offset)}: expected a JSON object, "
+                    f"got {type(record).__name__}"
+                )
+            yield (record.get(id_field) if id_field else None), record.get(text_field) or '', position[0]
+        return
+
+    # Fed from binary lines rather than a text wrapper, so the offset after each record is exact
+    csv.field_size_limit(CSV_FIELD_SIZE_LIMIT)
+    lines = _counted_lines(stream, position)
+    reader = csv.reader(line.decode('utf-8') for line in lines)
+    try:
+        header = next(reader, None) or []
+        if text_field not in header:
+            raise ValueError(f"CSV input has no '{text_field}' column")
+        text_column = header.index(text_field)
+        id_column = header.index(id_field) if id_field in header else None
+
+        if offset > position[0]:
+            stream.seek(offset)
+            position[0] = offset
+
+        for row in reader:
+            if not row:
+                continue
+            text = row[text_column] if text_column < len(row) else ''
+            record_id = row[id_column] if id_column is not None and id_column < len(row) else None
+            yield record_id, text or '', position[0]
+    except csv.Error as e:
+        raise csv.Error(f"CSV input line {reader.line_num}{_after(offset)}: {e}") from e
+
+
+def _after(offset: int) -> str:
+    """Qualifies a line number counted from a resume offset rather than the start of the file"""
+    return f' after byte {offset}' if offset else ''
+
+
+def iter_chunks(records: Iterator[Tuple[Any, str, int]], chunk_size: int) -> Iterator[List[Tuple[Any, str, int]]]:
+    """Group records into lists of at most chunk_size"""
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _init_worker(knowledge_base_path: Optional[str], options: Dict[str, Any]) -> None:
+    """Pool initializer: build the analyzer once per worker process"""
+    global _worker_analyzer, _worker_options
+    _worker_analyzer = HealthAnalyzer(knowledge_base_path=knowledge_base_path)
+    _worker_options = options
+
+
+def _analyze_chunk(chunk: List[Tuple[Any, str]], first_index: int) -> List[Dict[str, Any]]:
+    """Analyze one chunk, returning one result row per record in input order"""
+    texts = [text if isinstance(text, str) else str(text) for _, text in chunk]
+    rows = []
+
+    if _worker_options['mode'] == 'scores':
+        # Vectorized severity/urgency/category summary only
+        for offset, ((record_id, _), summary) in enumerate(zip(chunk, _worker_analyzer.score_batch(texts).records())):
+            rows.append({'index': first_index + offset, 'id': record_id, **summary})
+        return rows
+
+    for offset, ((record_id, _), text) in enumerate(zip(chunk, texts)):
+        result = _worker_analyzer.analyze_symptoms(text.strip())
+        rows.append({'index': first_index + offset, 'id': record_id, **result})
+    return rows
+
+
+def _process_chunk(chunk_number: int, chunk: List[Tuple[Any, str]], first_index: int) -> Tuple[int, int, Any]:
+    """
+    Worker entry point: analyze a chunk and serialize or write it
+
+    Returns:
+        (chunk_number, record_count, payload) where payload is JSONL bytes,
+        or the part file name for Parquet output
+    """
+    rows = _analyze_chunk(chunk, first_index)
+
+    if _worker_options['format'] == 'parquet':
+        part_name = f'part-{chunk_number:06d}.parquet'
+        _write_parquet_part(rows, os.path.join(_worker_options['output'], part_name))
+        return chunk_number, len(rows), part_name
+
+    payload = ''.join(json.dumps(row, ensure_ascii=False) + '\n' for row in rows).encode('utf-8')
+    return chunk_number, len(rows), payload
+
+
+def _write_parquet_part(rows: List[Dict[str, Any]], path: str) -> None:
+    """Write one chunk of results as a Parquet file, atomically"""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise RuntimeError('Parquet output requires pyarrow: pip install pyarrow') from e
+
+    columns = {
+        'index': [row['index'] for row in rows],
+        'id': [None if row['id'] is None else str(row['id']) for row in rows],
+        'severity': [row.get('severity', row.get('analysis', {}).get('severity')) for row in rows],
+        'urgency': [row.get('urgency', row.get('analysis', {}).get('urgency')) for row in rows],
+        'detected_symptoms': [_symptom_names(row) for row in rows],
+        'affected_systems': [
+            row.get('affected_systems', row.get('analysis', {}).get('affected_systems', [])) for row in rows
+        ],
+    }
+    if _worker_options['mode'] == 'full':
+        columns['success'] = [row.get('success', False) for row in rows]
+        columns['summary'] = [row.get('summary') for row in rows]
+        columns['result'] = [json.dumps(row, ensure_ascii=False) for row in rows]
+
+    temp_path = path + '.tmp'
+    pq.write_table(pa.table(columns), temp_path, compression='zstd')
+    os.replace(temp_path, path)
+
+
+def _symptom_names(row: Dict[str, Any]) -> List[str]:
+    """Detected symptom names from a full analysis or a batch score row"""
+    detected = row.get('detected_symptoms') or []
+    return [item['symptom'] if isinstance(item, dict) else item for item in detected]
+
+
+class Checkpoint:
+    """Resume state, rewritten atomically after every chunk is committed to output"""
+
+    def __init__(self, path: str, settings: Dict[str, Any]):
+        self.path = path
+        self.settings = settings
+        self.chunks_done = 0
+        self.records_done = 0
+        self.output_bytes = 0
+        # Uncompressed input offset just past the last committed record
+        self.input_offset = 0
+
+    @classmethod
+    def load(cls, path: str, settings: Dict[str, Any]) -> 'Checkpoint':
+        """Load a checkpoint, refusing one written with different settings"""
+        checkpoint = cls(path, settings)
+        if not os.path.exists(path):
+            return checkpoint
+
+        with open(path, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+
+        if state.get('version') != CHECKPOINT_VERSION or state.get('settings') != settings:
+            raise ValueError(f"Checkpoint '{path}' was written with different settings; remove it to start over")
+
+        checkpoint.chunks_done = state['chunks_done']
+        checkpoint.records_done = state['records_done']
+        checkpoint.output_bytes = state['output_bytes']
+        checkpoint.input_offset = state['input_offset']
+        return checkpoint
+
+    def save(self) -> None:
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'version': CHECKPOINT_VERSION,
+                'settings': self.settings,
+                'chunks_done': self.chunks_done,
+                'records_done': self.records_done,
+                'output_bytes': self.output_bytes,
+                'input_offset': self.input_offset
+            }, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.path)
+
+
+class ProgressReporter:
+    """Periodic throughput and progress lines on stderr"""
+
+    def __init__(self, interval: float, input_size: Optional[int], stream=sys.stderr):
+        self.interval = interval
+        self.input_size = input_size
+        self.stream = stream
+        self.started = time.monotonic()
+        self.next_report = self.started + interval
+        self.records = 0
+
+    def update(self, records: int, bytes_read: Optional[int], force: bool = False) -> None:
+        self.records += records
+        now = time.monotonic()
+        if not force and (self.interval <= 0 or now < self.next_report):
+            return
+        self.next_report = now + self.interval
+
+        elapsed = max(now - self.started, 1e-9)
+        line = f"[bulk_analyze] {self.records:,} records  {self.records / elapsed:,.0f} rec/s  {elapsed:,.1f}s"
+        if bytes_read is not None and self.input_size:
+            fraction = min(bytes_read / self.input_size, 1.0)
+            line += f"  {fraction:.1%} of input  {bytes_read / elapsed / 1e6:,.1f} MB/s"
+            if fraction > 0:
+                line += f"  ETA {elapsed * (1 - fraction) / fraction:,.0f}s"
+        print(line, file=self.stream, flush=True)
+
+
+def _bytes_read(stream: io.BufferedReader) -> Optional[int]:
+    """Compressed or raw bytes consumed from the input file so far"""
+    raw = getattr(stream, 'fileobj', None) or stream
+    try:
+        return raw.tell()
+    except (OSError, ValueError):
+        return None
+
+
+def run(args: argparse.Namespace) -> int:
+    """Run the bulk analysis pipeline; returns the number of records processed by this run"""
+    input_format = _input_format(args.input, args.input_format)
+    settings = {
+        'input': os.path.abspath(args.input),
+        'output': os.path.abspath(args.output),
+        'format': args.format,
+        'mode': args.mode,
+        'chunk_size': args.chunk_size,
+        'text_field': args.text_field,
+        'id_field': args.id_field
+    }
+    checkpoint_path = args.checkpoint or args.output.rstrip(os.sep) + '.checkpoint.json'
+
+    if args.resume:
+        checkpoint = Checkpoint.load(checkpoint_path, settings)
+    else:
+        if os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+        checkpoint = Checkpoint(checkpoint_path, settings)
+    resumed_from = checkpoint.records_done
+
+    # Discard output written after the last checkpoint
+    output_file = None
+    if args.format == 'parquet':
+        os.makedirs(args.output, exist_ok=True)
+    else:
+        output_file = open(args.output, 'r+b' if checkpoint.records_done else 'wb')
+        output_file.truncate(checkpoint.output_bytes)
+        output_file.seek(checkpoint.output_bytes)
+
+    input_stream = _open_input(args.input)
+    input_size = os.path.getsize(args.input)
+    progress = ProgressReporter(args.progress_interval, input_size)
+    options = {'mode': args.mode, 'format': args.format, 'output': args.output}
+
+    records = iter_records(input_stream, input_format, args.text_field, args.id_field, offset=checkpoint.input_offset)
+    chunks = iter_chunks(records, args.chunk_size)
+    chunk_number = checkpoint.chunks_done
+    first_index = checkpoint.records_done
+
+    # At most max_in_flight chunks are read ahead, so memory stays bounded
+    max_in_flight = args.workers * 2
+    pending = deque()
+
+    context = multiprocessing.get_context()
+    with context.Pool(args.workers, initializer=_init_worker, initargs=(args.knowledge_base, options)) as pool:
+        def commit_oldest():
+            number, end_offset, result = pending.popleft()
+            try:
+                _, count, payload = result.get()
+            except Exception as e:
+                raise RuntimeError(f"Chunk {number} (records from {checkpoint.records_done}) failed: {e}") from e
+            if output_file is not None:
+                output_file.write(payload)
+                output_file.flush()
+                checkpoint.output_bytes += len(payload)
+            checkpoint.chunks_done = number + 1
+            checkpoint.records_done += count
+            checkpoint.input_offset = end_offset
+            checkpoint.save()
+            progress.update(count, _bytes_read(input_stream))
+
+        for chunk in chunks:
+            work = [(record_id, text) for record_id, text, _ in chunk]
+            result = pool.apply_async(_process_chunk, (chunk_number, work, first_index))
+            pending.append((chunk_number, chunk[-1][2], result))
+            chunk_number += 1
+            first_index += len(chunk)
+
+            while len(pending) >= max_in_flight:
+                commit_oldest()
+
+        while pending:
+            commit_oldest()
+
+    progress.update(0, _bytes_read(input_stream), force=True)
+    input_stream.close()
+    if output_file is not None:
+        output_file.close()
+
+    return checkpoint.records_done - resumed_from
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description='Re-run symptom triage over an intake archive.')
+    parser.add_argument('input', help='CSV or JSONL input file, optionally .gz compressed')
+    parser.add_argument('output', help='JSONL output file, or output directory for --format parquet')
+    parser.add_argument('--input-format', choices=['csv', 'jsonl'], help='Override format detection')
+    parser.add_argument('--format', choices=['jsonl', 'parquet'], default='jsonl', help='Output format')
+    parser.add_argument('--mode', choices=['full', 'scores'], default='full',
+                        help='full: complete analyze_symptoms output; scores: vectorized severity summary')
+    parser.add_argument('--text-field', default='symptoms', help='Column or key holding symptom text')
+    parser.add_argument('--id-field', help='Column or key holding a record id to carry through')
+    parser.add_argument('--chunk-size', type=int, default=5000, help='Records per work unit')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Worker processes')
+    parser.add_argument('--knowledge-base', help='Knowledge base data file')
+    parser.add_argument('--checkpoint', help='Checkpoint file (default: <output>.checkpoint.json)')
+    parser.add_argument('--resume', action='store_true', help='Continue from the checkpoint')
+    parser.add_argument('--progress-interval', type=float, default=5.0, help='Seconds between progress lines')
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+
+    started = time.monotonic()
+    try:
+        total = run(args)
+    except (OSError, ValueError, RuntimeError, csv.Error) as e:
+        print(f"bulk_analyze: {e}", file=sys.stderr)
+        return 1
+
+    elapsed = time.monotonic() - started
+    print(f"bulk_analyze: {total:,} records in {elapsed:,.1f}s ({total / max(elapsed, 1e-9):,.0f} rec/s)",
+          file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
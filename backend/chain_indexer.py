@@ -0,0 +1,337 @@
+"""
+Chain Indexer
+Tails HealthRecordRegistry events from a JSON-RPC node into the SQLite record store
+
+Usage:
+    python chain_indexer.py --rpc-url http://127.0.0.1:8545 --contract 0x... --db records.db
+"""
+
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+import urllib.request
+
+from record_store import RecordStore
+
+
+# keccak256 of the event signatures and of getRecord(address,uint256)
+RECORD_ADDED_TOPIC = '0xcd05c570ae42062426a6fdc8015f9767dead53abb35d0e04eb51e708c50d5067'
+RECORD_ACCESSED_TOPIC = '0xd165081cf93934bf7162074ed4b10710ce20ceea0d9759027d5612c5ae404edc'
+GET_RECORD_SELECTOR = '0xcdb8acf0'
+
+logger = logging.getLogger('chain_indexer')
+
+
+class RpcError(Exception):
+    """JSON-RPC request failed or returned an error"""
+
+
+class JsonRpcClient:
+    """Minimal Ethereum JSON-RPC client over HTTP with request batching"""
+
+    def __init__(self, url: str, timeout: float = 30.0):
+        self.url = url
+        self.timeout = timeout
+        self._next_id = 0
+
+    def _post(self, payload: Any) -> Any:
+        request = urllib.request.Request(
+            self.url,
+            data=json.dumps(payload).encode('utf-8'),
+            headers={'Content-Type': 'application/json'}
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return json.loads(response.read())
+        except (OSError, ValueError) as e:
+            raise RpcError(f"RPC request to {self.url} failed: {e}") from e
+
+    def call(self, method: str, params: Sequence[Any] = ()) -> Any:
+        """Send one request and return its result"""
+        return self.batch([(method, params)])[0]
+
+    def batch(self, calls: Sequence[Tuple[str, Sequence[Any]]]) -> List[Any]:
+        """Send several requests in one round trip; results keep the call order"""
+        if not calls:
+            return []
+
+        first_id = self._next_id
+        self._next_id += len(calls)
+        payload = [
+            {'jsonrpc': '2.0', 'id': first_id + i, 'method': method, 'params': list(params)}
+            for i, (method, params) in enumerate(calls)
+        ]
+        responses = self._post(payload)
+        if not isinstance(responses, list):
+            raise RpcError(f"Unexpected batch response: {responses}")
+
+        results = {}
+        for response in responses:
+            if response.get('error'):
+                raise RpcError(f"RPC error: {response['error']}")
+            results[response['id']] = response.get('result')
+        return [results[first_id + i] for i in range(len(calls))]
+
+
+def _word(data: bytes, offset: int) -> int:
+    return int.from_bytes(data[offset:offset + 32], 'big')
+
+
+def _decode_string(data: bytes, offset: int) -> str:
+    length = _word(data, offset)
+    return data[offset + 32:offset + 32 + length].decode('utf-8', errors='replace')
+
+
+def _topic_address(topic: str) -> str:
+    return '0x' + topic[-40:].lower()
+
+
+def decode_record_added(log: Dict[str, Any]) -> Dict[str, Any]:
+    """Decode RecordAdded; ipfsHash is an indexed string, so only its hash is in the log"""
+    data = bytes.fromhex(log['data'][2:])
+    return {
+        'patient': _topic_address(log['topics'][1]),
+        'record_index': int(log['topics'][3], 16),
+        'record_type': _decode_string(data, _word(data, 0)),
+        'timestamp': _word(data, 32)
+    }
+
+
+def decode_record_accessed(log: Dict[str, Any]) -> Dict[str, Any]:
+    data = bytes.fromhex(log['data'][2:])
+    return {
+        'patient': _topic_address(log['topics'][1]),
+        'accessor': _topic_address(log['topics'][2]),
+        'record_index': int(log['topics'][3], 16),
+        'timestamp': _word(data, 0)
+    }
+
+
+def encode_get_record(patient: str, record_index: int) -> str:
+    """Call data for getRecord(address,uint256)"""
+    return GET_RECORD_SELECTOR + patient[2:].lower().rjust(64, '0') + format(record_index, '064x')
+
+
+def decode_get_record_ipfs_hash(result: str) -> str:
+    """Extract ipfsHash from the ABI-encoded HealthRecord returned by getRecord"""
+    data = bytes.fromhex(result[2:])
+    record = _word(data, 0)
+    return _decode_string(data, record + _word(data, record))
+
+
+class ChainIndexer:
+    """
+    Incrementally indexes RecordAdded and RecordAccessed events.
+
+    Each sync first checks the hash of the newest indexed block against the
+    chain. On a mismatch it walks back through the stored block hashes to
+    the newest block still on the canonical chain, discards everything
+    indexed after it, and re-indexes from there. Only blocks that had events
+    (and the end of each batch) are stored, which is enough because no
+    other block contributed data. Blocks within `confirmations` of the head
+    are not indexed yet.
+    """
+
+    def __init__(self, rpc: JsonRpcClient, store: RecordStore, contract_address: str,
+                 start_block: int = 0, confirmations: int = 0, batch_blocks: int = 2000,
+                 reorg_depth: int = 128):
+        self.rpc = rpc
+        self.store = store
+        self.contract_address = contract_address.lower()
+        self.start_block = start_block
+        self.confirmations = confirmations
+        self.batch_blocks = batch_blocks
+        self.reorg_depth = reorg_depth
+        self._check_store()
+
+    def _check_store(self) -> None:
+        """Refuse to mix events from a different contract or chain into an existing database"""
+        chain_id = str(int(self.rpc.call('eth_chainId'), 16))
+        for key, value in (('contract_address', self.contract_address), ('chain_id', chain_id)):
+            stored = self.store.get_meta(key)
+            if stored is None:
+                self.store.set_meta(key, value)
+            elif stored != value:
+                raise ValueError(f"Database indexes {key} {stored}, not {value}")
+
+    def _block_hash(self, number: int) -> Optional[str]:
+        block = self.rpc.call('eth_getBlockByNumber', [hex(number), False])
+        return block['hash'] if block else None
+
+    def handle_reorg(self) -> Optional[int]:
+        """
+        Roll back blocks that are no longer canonical
+
+        Returns:
+            The block rolled back to, or None if the index is consistent
+        """
+        last_block = self.store.last_block
+        if last_block is None:
+            return None
+
+        stored = self.store.block_hashes_from(max(last_block - self.reorg_depth, 0))
+        if not stored or stored[0][0] != last_block:
+            return None
+
+        # Common case: the newest indexed block is still canonical
+        if self._block_hash(last_block) == stored[0][1]:
+            return None
+
+        hashes = self.rpc.batch([('eth_getBlockByNumber', [hex(number), False]) for number, _ in stored])
+        for (number, stored_hash), block in zip(stored, hashes):
+            if block is not None and block['hash'] == stored_hash:
+                if number == last_block:
+                    return None
+                logger.warning(f"Chain reorganisation: rolling back from block {last_block} to {number}")
+                self.store.rollback_to(number)
+                return number
+
+        # No stored block in the window is canonical. Blocks without a stored
+        # hash had no events, so re-indexing the whole window is enough
+        fork_point = max(last_block - self.reorg_depth, self.start_block - 1)
+        logger.warning(f"Chain reorganisation: no stored block matches, rolling back to {fork_point}")
+        self.store.rollback_to(fork_point)
+        return fork_point
+
+    def sync_once(self) -> int:
+        """
+        Index up to the current safe head
+
+        Returns:
+            Number of events indexed
+        """
+        self.handle_reorg()
+
+        head = int(self.rpc.call('eth_blockNumber'), 16) - self.confirmations
+        last_block = self.store.last_block
+        from_block = self.start_block if last_block is None else last_block + 1
+        indexed = 0
+
+        while from_block <= head:
+            to_block = min(from_block + self.batch_blocks - 1, head)
+            indexed += self._index_range(from_block, to_block)
+            from_block = to_block + 1
+
+        return indexed
+
+    def _index_range(self, from_block: int, to_block: int) -> int:
+        """Fetch, decode and store the events of one block range"""
+        while True:
+            end_hash = self._block_hash(to_block)
+            logs = self.rpc.call('eth_getLogs', [{
+                'address': self.contract_address,
+                'fromBlock': hex(from_block),
+                'toBlock': hex(to_block),
+                'topics': [[RECORD_ADDED_TOPIC, RECORD_ACCESSED_TOPIC]]
+            }])
+            # A reorg while the logs were fetched would leave them inconsistent with end_hash
+            if self._block_hash(to_block) == end_hash:
+                break
+            logger.warning(f"Block {to_block} changed while indexing; retrying")
+
+        blocks = {to_block: end_hash}
+        added = []
+        records = []
+        accesses = []
+
+        for log in logs:
+            block_number = int(log['blockNumber'], 16)
+            log_index = int(log['logIndex'], 16)
+            blocks[block_number] = log['blockHash']
+
+            if log['topics'][0] == RECORD_ADDED_TOPIC:
+                added.append((log, block_number, log_index, decode_record_added(log)))
+            elif log['topics'][0] == RECORD_ACCESSED_TOPIC:
+                event = decode_record_accessed(log)
+                accesses.append((
+                    block_number, log_index, event['patient'], event['accessor'],
+                    event['record_index'], event['timestamp'], log['transactionHash']
+                ))
+
+        # The CID itself is only available from contract storage. Records are
+        # append-only, so the latest state has them; historical state would
+        # need an archive node once the range is older than the node keeps
+        ipfs_hashes = self.rpc.batch([
+            ('eth_call', [{'to': self.contract_address,
+                           'data': encode_get_record(event['patient'], event['record_index'])},
+                          'latest'])
+            for _, _, _, event in added
+        ])
+        for (log, block_number, log_index, event), result in zip(added, ipfs_hashes):
+            records.append((
+                event['patient'], event['record_index'], decode_get_record_ipfs_hash(result),
+                event['record_type'], event['timestamp'], block_number, log['transactionHash'], log_index
+            ))
+
+        self.store.write_batch(
+            to_block, blocks, records, accesses,
+            keep_blocks_from=to_block - self.reorg_depth
+        )
+        if logs:
+            logger.info(f"Indexed {len(records)} records and {len(accesses)} accesses up to block {to_block}")
+        return len(logs)
+
+    def run(self, poll_interval: float = 2.0, stop: Optional[threading.Event] = None) -> None:
+        """Sync until stopped, retrying after RPC failures"""
+        stop = stop or threading.Event()
+        while not stop.is_set():
+            try:
+                self.sync_once()
+            except RpcError as e:
+                logger.error(f"Sync failed: {e}")
+            stop.wait(poll_interval)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description='Index HealthRecordRegistry events into SQLite.')
+    parser.add_argument('--rpc-url', default=os.getenv('CHAIN_RPC_URL', 'http://127.0.0.1:8545'))
+    parser.add_argument('--contract', default=os.getenv('CONTRACT_ADDRESS'), help='Registry contract address')
+    parser.add_argument('--db', default=os.getenv('RECORD_INDEX_PATH', 'record_index.db'), help='SQLite file')
+    parser.add_argument('--start-block', type=int, default=int(os.getenv('CHAIN_START_BLOCK', 0)),
+                        help='Deployment block of the contract')
+    parser.add_argument('--confirmations', type=int, default=int(os.getenv('CHAIN_CONFIRMATIONS', 0)),
+                        help='Only index blocks this far behind the head')
+    parser.add_argument('--batch-blocks', type=int, default=2000, help='Blocks per eth_getLogs request')
+    parser.add_argument('--reorg-depth', type=int, default=128, help='Blocks of history kept for reorg checks')
+    parser.add_argument('--poll-interval', type=float, default=2.0, help='Seconds between syncs')
+    parser.add_argument('--once', action='store_true', help='Sync to the head once and exit')
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+    if not args.contract:
+        print('chain_indexer: --contract or CONTRACT_ADDRESS is required', file=sys.stderr)
+        return 2
+
+    try:
+        indexer = ChainIndexer(
+            JsonRpcClient(args.rpc_url),
+            RecordStore(args.db),
+            args.contract,
+            start_block=args.start_block,
+            confirmations=args.confirmations,
+            batch_blocks=args.batch_blocks,
+            reorg_depth=args.reorg_depth
+        )
+        if args.once:
+            indexer.sync_once()
+        else:
+            indexer.run(args.poll_interval)
+    except (RpcError, ValueError) as e:
+        print(f"chain_indexer: {e}", file=sys.stderr)
+        return 1
+    except KeyboardInterrupt:
+        pass
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
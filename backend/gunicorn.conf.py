@@ -0,0 +1,40 @@
+"""
+Gunicorn Configuration
+Preloads the app in the master so workers boot by fork and share the analyzer's memory
+
+Gunicorn reads this file automatically when started from the backend directory:
+    gunicorn -w 4 app:app
+"""
+
+import gc
+import os
+import signal
+
+
+# Import app.py, and build the analyzer, knowledge base and static responses, once in the master
+preload_app = os.getenv('GUNICORN_PRELOAD', 'True').lower() == 'true'
+
+if preload_app:
+    # Garbage collection in the master would free objects between the preloaded
+    # ones and leave holes that later allocations fill, dirtying shared pages
+    gc.disable()
+
+
+def pre_fork(server, worker):
+    """Move every preloaded object to the permanent generation before forking"""
+    if preload_app:
+        # Collections in workers then never write to the GC headers of shared
+        # objects, which would copy their pages into each worker
+        gc.freeze()
+
+
+def post_fork(server, worker):
+    if preload_app:
+        gc.enable()
+
+
+def post_worker_init(worker):
+    """Restore the knowledge base reload handler, which gunicorn resets in each worker"""
+    if preload_app and hasattr(signal, 'SIGHUP'):
+        import app
+        signal.signal(signal.SIGHUP, app._reload_knowledge_base_in_background)
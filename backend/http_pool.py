@@ -0,0 +1,92 @@
+"""
+HTTP Connection Pool Module
+Keep-alive connection reuse for upstream HTTP services, using only the standard library
+"""
+
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlsplit
+import http.client
+import queue
+
+
+class UpstreamError(Exception):
+    """Upstream service could not be reached or sent a malformed response"""
+
+
+class HttpConnectionPool:
+    """
+    Pool of persistent connections to one upstream origin.
+
+    Connections are returned to the pool only after their response has been
+    read to the end; anything else is closed. A request on a reused
+    connection that turns out to be stale is retried once on a fresh one.
+    Streamed bodies can only be retried when passed as a callable that
+    produces a fresh body for each attempt.
+    """
+
+    def __init__(self, base_url: str, max_size: int = 8, timeout: float = 30.0):
+        parts = urlsplit(base_url)
+        if parts.scheme not in ('http', 'https') or not parts.hostname:
+            raise ValueError(f"Unsupported upstream URL: '{base_url}'")
+
+        self.base_url = base_url
+        self.scheme = parts.scheme
+        self.host = parts.hostname
+        self.port = parts.port
+        self.base_path = parts.path.rstrip('/')
+        self.timeout = timeout
+        self._idle: 'queue.LifoQueue[http.client.HTTPConnection]' = queue.LifoQueue(maxsize=max_size)
+
+    def _new_connection(self) -> http.client.HTTPConnection:
+        connection_class = http.client.HTTPSConnection if self.scheme == 'https' else http.client.HTTPConnection
+        return connection_class(self.host, self.port, timeout=self.timeout)
+
+    def request(self, method: str, path: str, body=None,
+                headers: Optional[Dict[str, str]] = None) -> Tuple[http.client.HTTPConnection, http.client.HTTPResponse]:
+        """
+        Send a request and return the connection with its response headers read
+
+        The caller must pass both to release() once it is done with the body.
+
+        Raises:
+            UpstreamError: If the upstream cannot be reached
+        """
+        try:
+            connection, reused = self._idle.get_nowait(), True
+        except queue.Empty:
+            connection, reused = self._new_connection(), False
+
+        while True:
+            try:
+                connection.request(
+                    method, self.base_path + path, body=body() if callable(body) else body, headers=headers or {}
+                )
+                return connection, connection.getresponse()
+            except (http.client.HTTPException, OSError) as e:
+                connection.close()
+                # Idle keep-alive connections may have been closed by the server
+                if reused and (body is None or callable(body) or isinstance(body, (bytes, str))):
+                    connection, reused = self._new_connection(), False
+                    continue
+                raise UpstreamError(f"Request to {self.host} failed: {e}") from e
+
+    def release(self, connection: http.client.HTTPConnection, response: http.client.HTTPResponse) -> None:
+        """Return a connection to the pool if its response was fully read"""
+        if response.isclosed() and not response.will_close:
+            try:
+                self._idle.put_nowait(connection)
+                return
+            except queue.Full:
+                pass
+        connection.close()
+
+    def discard(self, connection: http.client.HTTPConnection) -> None:
+        """Close a connection whose response was abandoned part-way"""
+        connection.close()
+
+    def close(self) -> None:
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
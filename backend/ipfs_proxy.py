@@ -0,0 +1,388 @@
+"""
+IPFS Proxy Module
+Gateway fetches through pooled connections with a size-bounded LRU disk cache
+"""
+
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+import base64
+import hashlib
+import os
+import re
+import threading
+import time
+import uuid
+
+from http_pool import HttpConnectionPool
+from ipfs_upload import SHA2_256_PREFIX, CidBuilder
+
+
+# CIDv0 (base58btc multihash) or CIDv1 in the default base32 encoding
+CID_PATTERN = re.compile(r'^(Qm[1-9A-HJ-NP-Za-km-z]{44}|b[a-z2-7]{58,})$')
+
+# Content behind a CID never changes
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+CHUNK_SIZE = 65536
+DEFAULT_CONTENT_TYPE = 'application/octet-stream'
+
+# Multicodec codes of the CIDv1 content types whose bodies can be verified
+DAG_PB_CODEC = 0x70
+RAW_CODEC = 0x55
+
+# Temporary files untouched for this long belong to no running download
+STALE_TEMP_SECONDS = 3600
+
+# Upstream headers passed through to the client on a cache miss
+FORWARDED_HEADERS = ('Content-Type', 'Content-Length', 'Content-Range')
+
+# Anyone can pin content, so it is served from the API origin as inert data
+SANDBOX_HEADERS = {
+    'X-Content-Type-Options': 'nosniff',
+    'Content-Security-Policy': "default-src 'none'; sandbox"
+}
+
+# Types browsers may display inline; anything else, HTML and SVG included, is a download
+INLINE_CONTENT_TYPES = frozenset((
+    'application/json',
+    'application/pdf',
+    'image/gif',
+    'image/jpeg',
+    'image/png',
+    'image/webp',
+    'text/plain'
+))
+
+
+def content_headers(content_type: Optional[str]) -> Dict[str, str]:
+    """Headers that stop user-pinned content from running as part of the API origin"""
+    headers = dict(SANDBOX_HEADERS)
+    media_type = (content_type or '').split(';', 1)[0].strip().lower()
+    if media_type not in INLINE_CONTENT_TYPES:
+        headers['Content-Disposition'] = 'attachment'
+    return headers
+
+
+class CachedContent(NamedTuple):
+    """A cached CID on disk"""
+    path: str
+    content_type: str
+    size: int
+
+
+class _ContentHash:
+    """Checks a body against the hash its CID names, fed as the body streams"""
+
+    def __init__(self, cid: str, codec: int, digest: bytes):
+        self.cid = cid
+        self.digest = digest
+        # dag-pb is rebuilt with the `ipfs add` defaults; raw blocks hash the bytes themselves
+        self._builder = CidBuilder() if codec == DAG_PB_CODEC else None
+        self._sha256 = hashlib.sha256() if codec == RAW_CODEC else None
+
+    def update(self, chunk: bytes) -> None:
+        if self._builder is not None:
+            self._builder.update(chunk)
+        else:
+            self._sha256.update(chunk)
+
+    def matches(self) -> bool:
+        if self._builder is None:
+            return self._sha256.digest() == self.digest
+        if self.cid.startswith('Qm'):
+            return self._builder.cid() == self.cid
+        return self._builder.multihash() == SHA2_256_PREFIX + self.digest
+
+
+def content_hash(cid: str) -> Optional[_ContentHash]:
+    """
+    Hash checker for a CID, or None if its content cannot be verified here
+
+    CIDv0 content matches when it was added with the `ipfs add` defaults
+    (see ipfs_upload.CidBuilder), and CIDv1 dag-pb content when it also fits
+    in one chunk, since larger CIDv1 files link their chunks by CIDv1. Raw
+    blocks always match. Content that does not is served but never cached.
+    """
+    if cid.startswith('Qm'):
+        return _ContentHash(cid, DAG_PB_CODEC, b'')
+
+    try:
+        data = base64.b32decode(cid[1:].upper() + '=' * (-(len(cid) - 1) % 8))
+    except ValueError:
+        return None
+    # <version 1><codec><sha2-256 multihash>, every varint a single byte for these values
+    if len(data) != 4 + 32 or data[0] != 1 or data[1] not in (DAG_PB_CODEC, RAW_CODEC):
+        return None
+    if data[2:4] != SHA2_256_PREFIX:
+        return None
+    return _ContentHash(cid, data[1], data[4:])
+
+
+class _CacheWriter:
+    """Temporary file filled while a response streams; becomes a cache entry on commit"""
+
+    def __init__(self, cache: 'IpfsDiskCache', cid: str, content_type: str, checker: _ContentHash):
+        self.cache = cache
+        self.cid = cid
+        self.content_type = content_type
+        self.checker = checker
+        self.size = 0
+        self.temp_path = os.path.join(cache.temp_directory, uuid.uuid4().hex)
+        self._file = open(self.temp_path, 'wb')
+
+    def write(self, chunk: bytes) -> bool:
+        """Append a chunk; returns False, and gives up, once the entry grows too large"""
+        self.size += len(chunk)
+        if self.size > self.cache.max_entry_bytes:
+            self.abort()
+            return False
+        self._file.write(chunk)
+        self.checker.update(chunk)
+        return True
+
+    def commit(self) -> None:
+        """Store the body if it is the content the CID names, else drop it"""
+        self._file.close()
+        if not self.checker.matches():
+            self.cache._reject()
+            self.abort()
+            return
+        self.cache._add(self.cid, self.content_type, self.temp_path)
+
+    def abort(self) -> None:
+        self._file.close()
+        try:
+            os.remove(self.temp_path)
+        except OSError:
+            pass
+
+
+class IpfsDiskCache:
+    """
+    LRU cache of IPFS content on local disk.
+
+    Each CID is stored as a plain file so hits can be served with sendfile,
+    with its content type in a small sidecar file. The directory itself is
+    the index, so every worker sharing it sees the others' entries: recency
+    is the files' access times, and after each new entry the byte limit is
+    enforced on everything in the directory. Bodies are only stored once
+    they hash to their CID, so a faulty gateway cannot poison the cache.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, max_entry_bytes: Optional[int] = None):
+        self.directory = directory
+        self.temp_directory = os.path.join(directory, 'tmp')
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = min(max_entry_bytes or max_bytes, max_bytes)
+        self._lock = threading.Lock()
+        # Directory totals as of this process's last scan
+        self._entry_count = 0
+        self._total_bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._unverified = 0
+
+        os.makedirs(self.temp_directory, exist_ok=True)
+        with self._lock:
+            self._evict()
+
+        # Leftovers of interrupted downloads; recent ones may belong to a worker that is still running
+        stale_before = time.time() - STALE_TEMP_SECONDS
+        for name in os.listdir(self.temp_directory):
+            path = os.path.join(self.temp_directory, name)
+            try:
+                if os.stat(path).st_mtime < stale_before:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    def _path(self, cid: str) -> str:
+        return os.path.join(self.directory, cid)
+
+    def _scan(self) -> List[Tuple[float, str, int]]:
+        """(access time, CID, size) of every entry on disk, least recently used first"""
+        found = []
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if CID_PATTERN.match(entry.name):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    found.append((stat.st_atime, entry.name, stat.st_size))
+        found.sort()
+        return found
+
+    def _evict(self) -> None:
+        """Remove least recently used entries until the directory fits the byte limit; caller holds _lock"""
+        found = self._scan()
+        total = sum(size for _, _, size in found)
+
+        # The newest entry always stays, even if it alone exceeds the limit
+        while total > self.max_bytes and len(found) > 1:
+            _, old_cid, old_size = found.pop(0)
+            total -= old_size
+            self._evictions += 1
+            for old_path in (self._path(old_cid), self._path(old_cid) + '.type'):
+                try:
+                    os.remove(old_path)
+                except OSError:
+                    pass
+
+        self._entry_count = len(found)
+        self._total_bytes = total
+
+    def get(self, cid: str) -> Optional[CachedContent]:
+        """Return the cached content for a CID, marking it recently used"""
+        path = self._path(cid)
+        try:
+            stat = os.stat(path)
+            # Keep mtime; the access time is the recency that eviction goes by
+            os.utime(path, (time.time(), stat.st_mtime))
+        except FileNotFoundError:
+            with self._lock:
+                self._misses += 1
+            return None
+
+        try:
+            with open(path + '.type', 'r', encoding='ascii') as f:
+                content_type = f.read() or DEFAULT_CONTENT_TYPE
+        except OSError:
+            content_type = DEFAULT_CONTENT_TYPE
+
+        with self._lock:
+            self._hits += 1
+        return CachedContent(path, content_type, stat.st_size)
+
+    def writer(self, cid: str, content_type: Optional[str], content_length: Optional[int]) -> Optional[_CacheWriter]:
+        """Start caching a response, unless it is known to be too large or cannot be verified"""
+        if content_length is not None and content_length > self.max_entry_bytes:
+            return None
+        checker = content_hash(cid)
+        if checker is None:
+            return None
+        return _CacheWriter(self, cid, content_type or DEFAULT_CONTENT_TYPE, checker)
+
+    def _add(self, cid: str, content_type: str, temp_path: str) -> None:
+        """Move a verified download into place and evict down to the byte limit"""
+        path = self._path(cid)
+        with open(path + '.type', 'w', encoding='ascii', errors='replace') as f:
+            f.write(content_type)
+        now = time.time()
+        os.utime(temp_path, (now, now))
+        os.replace(temp_path, path)
+
+        with self._lock:
+            self._evict()
+
+    def _reject(self) -> None:
+        with self._lock:
+            self._unverified += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'entries': self._entry_count,
+                'bytes': self._total_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self._hits,
+                'misses': self._misses,
+                'evictions': self._evictions,
+                'unverified': self._unverified
+            }
+
+
+class IpfsGateway:
+    """Fetches CIDs from an HTTP gateway, filling the disk cache as responses stream"""
+
+    def __init__(self, gateway_url: str, cache: Optional[IpfsDiskCache] = None,
+                 pool_size: int = 8, timeout: float = 30.0):
+        self.pool = HttpConnectionPool(gateway_url, max_size=pool_size, timeout=timeout)
+        self.cache = cache
+
+    def fetch(self, cid: str, range_header: Optional[str] = None) -> Tuple[int, Dict[str, str], Iterator[bytes]]:
+        """
+        Request a CID from the gateway
+
+        Only complete (non-range) 200 responses are cached. A range request
+        on a cache miss is forwarded upstream as is.
+
+        Returns:
+            (status, forwarded headers, body chunks); the body must be consumed or closed
+
+        Raises:
+            UpstreamError: If the gateway cannot be reached
+        """
+        headers = {'Accept-Encoding': 'identity'}
+        if range_header:
+            headers['Range'] = range_header
+
+        connection, response = self.pool.request('GET', f'/ipfs/{cid}', headers=headers)
+        forwarded = {name: response.getheader(name) for name in FORWARDED_HEADERS if response.getheader(name)}
+
+        if response.status not in (200, 206):
+            # Error bodies are small; drain them so the connection can be reused
+            response.read()
+            self.pool.release(connection, response)
+            return response.status, forwarded, _GatewayBody(self.pool, connection, None, None, None)
+
+        content_length = response.getheader('Content-Length')
+        content_length = int(content_length) if content_length and content_length.isdigit() else None
+
+        writer = None
+        if self.cache is not None and response.status == 200 and not range_header:
+            writer = self.cache.writer(cid, forwarded.get('Content-Type'), content_length)
+
+        return response.status, forwarded, _GatewayBody(self.pool, connection, response, writer, content_length)
+
+
+class _GatewayBody:
+    """
+    Iterable over an upstream response body, for use as a WSGI response.
+
+    The connection goes back to the pool and the cache entry is committed
+    only if the body was read to the end. close() is called by the server
+    even when the client disconnects before the first chunk.
+    """
+
+    def __init__(self, pool: HttpConnectionPool, connection, response, writer: Optional[_CacheWriter],
+                 content_length: Optional[int]):
+        self.pool = pool
+        self.connection = connection
+        self.response = response
+        self.writer = writer
+        self.content_length = content_length
+        self._completed = response is None
+        self._closed = response is None
+
+    def __iter__(self) -> Iterator[bytes]:
+        response = self.response
+        while not self._closed:
+            chunk = response.read(CHUNK_SIZE)
+            if not chunk:
+                self._completed = True
+                break
+            if self.writer is not None and not self.writer.write(chunk):
+                self.writer = None
+            yield chunk
+        self.close()
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        writer = self.writer
+
+        if self._completed:
+            self.pool.release(self.connection, self.response)
+            if writer is not None:
+                # A body cut short by the gateway must not become a cache entry
+                if self.content_length is None or writer.size == self.content_length:
+                    writer.commit()
+                else:
+                    writer.abort()
+        else:
+            # Client went away or the gateway failed mid-body
+            self.pool.discard(self.connection)
+            if writer is not None:
+                writer.abort()
@@ -0,0 +1,443 @@
+"""
+IPFS Upload Module
+Local CIDv0 computation, upload spooling and concurrent pinning with deduplication
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+from urllib.parse import quote
+import hashlib
+import json
+import logging
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+
+from http_pool import HttpConnectionPool, UpstreamError
+
+
+# Import settings of `ipfs add` and Pinata's defaults: 256 KiB chunks,
+# balanced DAG of UnixFS file nodes with up to 174 links, CIDv0
+CHUNK_SIZE = 262144
+MAX_LINKS = 174
+UNIXFS_FILE = 2
+SHA2_256_PREFIX = b'\x12\x20'
+
+# Files are sent to the pinning service in pieces of this size
+SEND_CHUNK_SIZE = 65536
+
+# Rows asked for when checking whether a CID is already pinned
+PIN_LIST_PAGE_LIMIT = 10
+
+# Pin responses worth retrying; other errors are the request's fault
+RETRYABLE_STATUSES = (408, 429, 500, 502, 503, 504)
+
+BASE58_ALPHABET = '123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz'
+
+logger = logging.getLogger('ipfs_upload')
+
+
+def _varint(value: int) -> bytes:
+    out = bytearray()
+    while value > 0x7f:
+        out.append(value & 0x7f | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def _bytes_field(number: int, data: bytes) -> bytes:
+    return _varint(number << 3 | 2) + _varint(len(data)) + data
+
+
+def _varint_field(number: int, value: int) -> bytes:
+    return _varint(number << 3) + _varint(value)
+
+
+def _base58(data: bytes) -> str:
+    number = int.from_bytes(data, 'big')
+    encoded = ''
+    while number:
+        number, remainder = divmod(number, 58)
+        encoded = BASE58_ALPHABET[remainder] + encoded
+    return '1' * (len(data) - len(data.lstrip(b'\0'))) + encoded
+
+
+def _dag_node(filesize: int, data: bytes = b'', links: Sequence[Tuple[bytes, int, int]] = ()) -> Tuple[bytes, int, int]:
+    """
+    Encode a dag-pb node holding UnixFS file data
+
+    Args:
+        filesize: Bytes of file content below this node
+        data: File content stored in the node itself (leaves only)
+        links: Children as (multihash, cumulative block size, file size)
+
+    Returns:
+        (multihash, cumulative block size, file size) for linking from a parent
+    """
+    unixfs = _varint_field(1, UNIXFS_FILE)
+    if data:
+        unixfs += _bytes_field(2, data)
+    unixfs += _varint_field(3, filesize)
+    for _, _, child_filesize in links:
+        unixfs += _varint_field(4, child_filesize)
+
+    # Links come before Data in the canonical encoding; the empty name is always written
+    block = b''.join(
+        _bytes_field(2, _bytes_field(1, multihash) + _bytes_field(2, b'') + _varint_field(3, tsize))
+        for multihash, tsize, _ in links
+    ) + _bytes_field(1, unixfs)
+
+    multihash = SHA2_256_PREFIX + hashlib.sha256(block).digest()
+    return multihash, len(block) + sum(tsize for _, tsize, _ in links), filesize
+
+
+class CidBuilder:
+    """
+    Computes the CIDv0 that `ipfs add` would assign to a stream of bytes.
+
+    Content is hashed chunk by chunk as it arrives. Full groups of
+    MAX_LINKS nodes are folded into their parent straight away, so memory
+    stays bounded by one chunk plus one partial group per tree level.
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._levels: List[List[Tuple[bytes, int, int]]] = [[]]
+        self.size = 0
+
+    def update(self, data: bytes) -> None:
+        self.size += len(data)
+        self._buffer += data
+        while len(self._buffer) >= CHUNK_SIZE:
+            self._add_leaf(bytes(self._buffer[:CHUNK_SIZE]))
+            del self._buffer[:CHUNK_SIZE]
+
+    def _add_leaf(self, chunk: bytes) -> None:
+        self._push(0, _dag_node(len(chunk), chunk))
+
+    def _push(self, level: int, node: Tuple[bytes, int, int]) -> None:
+        nodes = self._levels[level]
+        nodes.append(node)
+        if len(nodes) == MAX_LINKS:
+            if level + 1 == len(self._levels):
+                self._levels.append([])
+            self._levels[level] = []
+            self._push(level + 1, _dag_node(sum(size for _, _, size in nodes), links=nodes))
+
+    def cid(self) -> str:
+        """CID of everything written so far; call once, after the last update"""
+        return _base58(self.multihash())
+
+    def multihash(self) -> bytes:
+        """sha2-256 multihash of the root node; call once, after the last update"""
+        if self._buffer or self.size == 0:
+            self._add_leaf(bytes(self._buffer))
+            self._buffer.clear()
+
+        levels = self._levels
+        for level, nodes in enumerate(levels):
+            if any(levels[level + 1:]):
+                # A partial group below a fuller tree still gets its own parent node
+                if nodes:
+                    parent = _dag_node(sum(size for _, _, size in nodes), links=nodes)
+                    levels[level] = []
+                    levels[level + 1].append(parent)
+            elif len(nodes) == 1:
+                return nodes[0][0]
+            else:
+                return _dag_node(sum(size for _, _, size in nodes), links=nodes)[0]
+
+        raise AssertionError('unreachable')
+
+
+class UploadSpool:
+    """
+    Temporary file for one uploaded file, computing its CID as it is written.
+
+    Passed to Werkzeug's form parser as the stream for a file part, so the
+    upload goes to disk in chunks and is hashed in the same pass.
+    """
+
+    def __init__(self, directory: Optional[str] = None):
+        self._file = tempfile.NamedTemporaryFile(dir=directory, prefix='upload-', delete=False)
+        self.path = self._file.name
+        self._builder = CidBuilder()
+        self._cid = None
+
+    def write(self, data: bytes) -> int:
+        self._builder.update(data)
+        return self._file.write(data)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._file, name)
+
+    @property
+    def size(self) -> int:
+        return self._builder.size
+
+    @property
+    def cid(self) -> str:
+        """Local CIDv0 of the content; closes the spool for writing"""
+        if self._cid is None:
+            self._file.close()
+            self._cid = self._builder.cid()
+        return self._cid
+
+    def discard(self) -> None:
+        self._file.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+class PinRegistry:
+    """
+    SQLite record of content this service has pinned.
+
+    Maps the locally computed CID to the CID the pinning service reported,
+    which only differ if the service imports content with other settings.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+
+        # Not kept open, so no connection is inherited when gunicorn forks workers
+        connection = sqlite3.connect(path, timeout=30)
+        try:
+            with connection:
+                connection.execute(
+                    'CREATE TABLE IF NOT EXISTS pins ('
+                    'cid TEXT PRIMARY KEY, pinned_cid TEXT NOT NULL, size INTEGER NOT NULL, pinned_at INTEGER NOT NULL'
+                    ') WITHOUT ROWID'
+                )
+        finally:
+            connection.close()
+
+    def _connection(self) -> sqlite3.Connection:
+        """One connection per thread"""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute('PRAGMA journal_mode=WAL')
+            self._local.connection = connection
+        return connection
+
+    def get(self, cid: str) -> Optional[str]:
+        """Pinned CID for a local CID, or None if it was never pinned"""
+        row = self._connection().execute('SELECT pinned_cid FROM pins WHERE cid = ?', (cid,)).fetchone()
+        return row[0] if row else None
+
+    def add(self, cid: str, pinned_cid: str, size: int) -> None:
+        with self._connection() as connection:
+            connection.execute(
+                'INSERT OR REPLACE INTO pins (cid, pinned_cid, size, pinned_at) VALUES (?, ?, ?, ?)',
+                (cid, pinned_cid, size, int(time.time()))
+            )
+
+
+class PinningError(Exception):
+    """Pinning service rejected a request or kept failing after retries"""
+
+    def __init__(self, message: str, status: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+
+
+class PinningClient:
+    """
+    Client for the Pinata pinning API, or a local service with the same routes.
+
+    Requests go over pooled keep-alive connections. Connection failures and
+    retryable statuses are retried with exponential backoff and full
+    jitter, honouring Retry-After.
+    """
+
+    def __init__(self, api_url: str, jwt: str = '', api_key: str = '', secret_key: str = '',
+                 pool_size: int = 4, timeout: float = 120.0, max_attempts: int = 4,
+                 backoff: float = 0.5, max_backoff: float = 10.0):
+        self.pool = HttpConnectionPool(api_url, max_size=pool_size, timeout=timeout)
+        if jwt:
+            self.auth_headers = {'Authorization': f'Bearer {jwt}'}
+        else:
+            self.auth_headers = {'pinata_api_key': api_key, 'pinata_secret_api_key': secret_key}
+        self.max_attempts = max(max_attempts, 1)
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.retries = 0
+
+    def _request(self, method: str, path: str, body: Optional[Callable[[], Any]] = None,
+                 headers: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+        """Send a request with retries and return the decoded JSON response"""
+        headers = {**self.auth_headers, **(headers or {})}
+        attempt = 0
+        while True:
+            attempt += 1
+            retry_after = None
+            try:
+                connection, response = self.pool.request(method, path, body=body, headers=headers)
+                try:
+                    payload = response.read()
+                finally:
+                    self.pool.release(connection, response)
+                if response.status < 300:
+                    return json.loads(payload or b'{}')
+                error = PinningError(
+                    f'{method} {path} returned status {response.status}: {payload[:200].decode("utf-8", "replace")}',
+                    response.status
+                )
+                if response.status not in RETRYABLE_STATUSES:
+                    raise error
+                retry_after = response.getheader('Retry-After')
+            except (UpstreamError, OSError, ValueError) as e:
+                error = PinningError(f'{method} {path} failed: {e}')
+
+            if attempt >= self.max_attempts:
+                raise error
+
+            delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** (attempt - 1)))
+            if retry_after and retry_after.isdigit():
+                delay = max(delay, min(float(retry_after), self.max_backoff))
+            self.retries += 1
+            logger.warning(f"{error}; retrying in {delay:.2f}s")
+            time.sleep(delay)
+
+    def is_pinned(self, cid: str) -> bool:
+        """Ask the service whether a CID is already pinned"""
+        # hashContains is a substring filter, so only an exact match in the returned rows counts
+        result = self._request(
+            'GET', f'/data/pinList?status=pinned&pageLimit={PIN_LIST_PAGE_LIMIT}&hashContains={quote(cid)}'
+        )
+        return any(row.get('ipfs_pin_hash') == cid for row in result.get('rows') or ())
+
+    def pin_file(self, path: str, filename: str) -> Dict[str, Any]:
+        """
+        Pin a file with pinFileToIPFS, streaming it from disk
+
+        Returns:
+            The service response, with the pinned CID in 'IpfsHash'
+
+        Raises:
+            PinningError: If pinning failed after all retries
+        """
+        boundary = uuid.uuid4().hex
+        safe_name = filename.replace('"', '').replace('\r', '').replace('\n', '')
+        head = (
+            f'--{boundary}\r\n'
+            f'Content-Disposition: form-data; name="file"; filename="{safe_name}"\r\n'
+            'Content-Type: application/octet-stream\r\n\r\n'
+        ).encode('utf-8')
+        tail = (
+            f'\r\n--{boundary}\r\n'
+            'Content-Disposition: form-data; name="pinataMetadata"\r\n\r\n'
+            f'{json.dumps({"name": f"medblocai-{int(time.time() * 1000)}-{safe_name}"})}\r\n'
+            f'--{boundary}\r\n'
+            'Content-Disposition: form-data; name="pinataOptions"\r\n\r\n'
+            f'{json.dumps({"cidVersion": 0})}\r\n'
+            f'--{boundary}--\r\n'
+        ).encode('utf-8')
+
+        def body() -> Iterator[bytes]:
+            yield head
+            with open(path, 'rb') as f:
+                while True:
+                    chunk = f.read(SEND_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    yield chunk
+            yield tail
+
+        return self._request('POST', '/pinning/pinFileToIPFS', body=body, headers={
+            'Content-Type': f'multipart/form-data; boundary={boundary}',
+            'Content-Length': str(len(head) + os.path.getsize(path) + len(tail))
+        })
+
+    def close(self) -> None:
+        self.pool.close()
+
+
+class IpfsUploader:
+    """
+    Pins uploaded files, skipping content that is already pinned.
+
+    Files with the same content are pinned once per batch. Content in the
+    pin registry is never sent again, and with check_remote the service
+    is asked before uploading, which catches pins made elsewhere (such as
+    by the browser). Pins run concurrently on a shared thread pool.
+    """
+
+    def __init__(self, client: PinningClient, registry: PinRegistry, concurrency: int = 4,
+                 check_remote: bool = True):
+        self.client = client
+        self.registry = registry
+        self.check_remote = check_remote
+        self.executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='ipfs-pin')
+        self._lock = threading.Lock()
+        self._counts = {'pinned': 0, 'already_pinned': 0, 'duplicate': 0, 'failed': 0}
+
+    def _pin(self, spool: UploadSpool, filename: str) -> Tuple[str, str]:
+        """Pin one unique file; returns (status, pinned CID)"""
+        cid = spool.cid
+        pinned_cid = self.registry.get(cid)
+        if pinned_cid is not None:
+            return 'already_pinned', pinned_cid
+
+        if self.check_remote:
+            try:
+                if self.client.is_pinned(cid):
+                    self.registry.add(cid, cid, spool.size)
+                    return 'already_pinned', cid
+            except PinningError as e:
+                # Uploading again is harmless, so a failed check is not fatal
+                logger.warning(f"Pin check for {cid} failed: {e}")
+
+        pinned_cid = self.client.pin_file(spool.path, filename)['IpfsHash']
+        if pinned_cid != cid:
+            logger.warning(f"Pinning service stored {filename} as {pinned_cid}, computed {cid} locally")
+        self.registry.add(cid, pinned_cid, spool.size)
+        return 'pinned', pinned_cid
+
+    def upload(self, files: Sequence[Tuple[str, UploadSpool]]) -> List[Dict[str, Any]]:
+        """
+        Pin a batch of spooled files
+
+        Args:
+            files: (filename, spool) pairs in upload order
+
+        Returns:
+            One result per file, in order, with 'ipfs_hash' and a 'status' of
+            pinned, already_pinned, duplicate (same content as an earlier
+            file in the batch) or failed
+        """
+        futures = {}
+        for filename, spool in files:
+            if spool.cid not in futures:
+                futures[spool.cid] = self.executor.submit(self._pin, spool, filename)
+
+        results = []
+        seen = set()
+        for filename, spool in files:
+            result = {'filename': filename, 'size': spool.size, 'cid': spool.cid}
+            try:
+                status, result['ipfs_hash'] = futures[spool.cid].result()
+                result['status'] = 'duplicate' if spool.cid in seen else status
+            except PinningError as e:
+                result['status'] = 'failed'
+                result['error'] = str(e)
+            seen.add(spool.cid)
+            results.append(result)
+
+        with self._lock:
+            for result in results:
+                self._counts[result['status']] += 1
+        return results
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self._counts, 'retries': self.client.retries}
@@ -0,0 +1,181 @@
+"""
+Knowledge Base Module
+Loads the symptom and tips data file and compiles it into an immutable snapshot
+"""
+
+from types import MappingProxyType
+from typing import Any, Dict, Mapping, NamedTuple, Optional, Set, Tuple
+import gzip
+import hashlib
+import json
+import os
+
+from symptom_matcher import SymptomMatcher
+
+
+DEFAULT_KNOWLEDGE_BASE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'knowledge_base.json')
+
+# English word list that typo correction must leave alone, one lowercase word per line
+DEFAULT_DICTIONARY_PATH = os.path.join(os.path.dirname(DEFAULT_KNOWLEDGE_BASE_PATH), 'english_words.txt.gz')
+
+
+class SymptomRecord(NamedTuple):
+    """Compiled symptom entry with its severity priority resolved"""
+    category: str
+    severity: str
+    severity_priority: int
+    common_causes: Tuple[str, ...]
+    recommendations: Tuple[str, ...]
+    red_flags: Tuple[str, ...]
+
+
+class SeverityLevel(NamedTuple):
+    """Priority and precomputed urgency output for a severity name"""
+    priority: int
+    urgency: str
+    message: str
+
+
+class TipsRecord(NamedTuple):
+    """Health tips for one category"""
+    title: str
+    tips: Tuple[str, ...]
+
+
+class KnowledgeBase:
+    """
+    Immutable, indexed snapshot of the clinical content.
+
+    A snapshot is never modified after construction; reloading builds a new
+    one and swaps the reference, so readers that grabbed a snapshot at the
+    start of a request see consistent data until they finish.
+    """
+
+    __slots__ = (
+        'version', 'source', 'symptoms', 'symptom_database', 'severity_levels',
+        'tips', 'category_index', 'matcher'
+    )
+
+    def __init__(self, data: Mapping[str, Any], source: Optional[str] = None):
+        self.source = source
+        self.version = _content_version(data)
+
+        severity_levels = {}
+        for name, level in data['severity_levels'].items():
+            if int(level['priority']) < 1:
+                raise ValueError(f"Severity '{name}' must have a priority of at least 1")
+            severity_levels[name] = SeverityLevel(
+                priority=int(level['priority']),
+                urgency=level['urgency'],
+                message=level['message']
+            )
+
+        symptoms = {}
+        category_index: Dict[str, list] = {}
+        for name, info in data['symptoms'].items():
+            if name != name.lower():
+                raise ValueError(f"Symptom names must be lowercase: '{name}'")
+            if info['severity'] not in severity_levels:
+                raise ValueError(f"Unknown severity '{info['severity']}' for symptom '{name}'")
+
+            symptoms[name] = SymptomRecord(
+                category=info['category'],
+                severity=info['severity'],
+                severity_priority=severity_levels[info['severity']].priority,
+                common_causes=tuple(info['common_causes']),
+                recommendations=tuple(info['recommendations']),
+                red_flags=tuple(info.get('red_flags', ()))
+            )
+            category_index.setdefault(info['category'], []).append(name)
+
+        tips = {
+            category.lower(): TipsRecord(title=entry['title'], tips=tuple(entry['tips']))
+            for category, entry in data['tips'].items()
+        }
+        if 'general' not in tips:
+            raise ValueError("Tips data must include a 'general' category")
+
+        self.severity_levels: Mapping[str, SeverityLevel] = MappingProxyType(severity_levels)
+        self.symptoms: Mapping[str, SymptomRecord] = MappingProxyType(symptoms)
+        self.tips: Mapping[str, TipsRecord] = MappingProxyType(tips)
+        self.category_index: Mapping[str, Tuple[str, ...]] = MappingProxyType(
+            {category: tuple(names) for category, names in category_index.items()}
+        )
+
+        # Read-only view of the raw symptom entries, kept for API compatibility
+        self.symptom_database: Mapping[str, Mapping[str, Any]] = MappingProxyType(
+            {name: MappingProxyType(dict(info)) for name, info in data['symptoms'].items()}
+        )
+
+        # Synonyms and typo tolerance map free-text wording onto the canonical names
+        synonyms = {name: info.get('synonyms', ()) for name, info in data['symptoms'].items()}
+        matching = data.get('matching', {})
+        fuzzy_max_edits = int(matching.get('fuzzy_max_edits', 0))
+        fuzzy_protected: Set[str] = set()
+        fuzzy_dictionary: Tuple[str, ...] = ()
+
+        if fuzzy_max_edits > 0:
+            # A typo alone must not raise one of these severities, so their one-word phrases are never corrected to
+            protected_severities = matching.get('fuzzy_protected_severities')
+            if protected_severities is None:
+                top_priority = max(level.priority for level in severity_levels.values())
+                protected_severities = [name for name, level in severity_levels.items() if level.priority == top_priority]
+            for name, record in symptoms.items():
+                if record.severity in protected_severities:
+                    fuzzy_protected.update(
+                        phrase.lower() for phrase in (name, *synonyms[name]) if ' ' not in phrase
+                    )
+
+            dictionary_path = matching.get('fuzzy_dictionary', DEFAULT_DICTIONARY_PATH)
+            base_dir = os.path.dirname(source) if source else os.path.dirname(DEFAULT_KNOWLEDGE_BASE_PATH)
+            fuzzy_dictionary = _load_word_list(os.path.join(base_dir, dictionary_path))
+
+        self.matcher = SymptomMatcher(
+            symptoms.keys(),
+            synonyms=synonyms,
+            fuzzy_max_edits=fuzzy_max_edits,
+            fuzzy_min_length=int(matching.get('fuzzy_min_length', 6)),
+            fuzzy_exclusions=matching.get('fuzzy_exclusions', ()),
+            fuzzy_protected=fuzzy_protected,
+            fuzzy_dictionary=fuzzy_dictionary
+        )
+
+
+def _load_word_list(path: str) -> Tuple[str, ...]:
+    """Read a word list, gzip-compressed when the name ends in .gz"""
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8') as f:
+        return tuple(line.strip().lower() for line in f if line.strip())
+
+
+def _content_version(data: Mapping[str, Any]) -> str:
+    """Stable short hash identifying the knowledge base content"""
+    canonical = json.dumps(data, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()[:16]
+
+
+def load_knowledge_base(path: Optional[str] = None) -> KnowledgeBase:
+    """
+    Load and compile a knowledge base data file
+
+    Args:
+        path: JSON data file; defaults to data/knowledge_base.json
+
+    Returns:
+        Compiled KnowledgeBase snapshot
+
+    Raises:
+        ValueError: If the file is malformed or inconsistent
+    """
+    path = path or DEFAULT_KNOWLEDGE_BASE_PATH
+
+    with open(path, 'r', encoding='utf-8') as f:
+        try:
+            data = json.load(f)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid knowledge base file '{path}': {e}") from e
+
+    try:
+        return KnowledgeBase(data, source=path)
+    except (KeyError, TypeError) as e:
+        raise ValueError(f"Invalid knowledge base file '{path}': missing or malformed {e}") from e
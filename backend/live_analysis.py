@@ -0,0 +1,344 @@
+"""
+Live Analysis Module
+Per-session incremental symptom matching for as-you-type analysis over Server-Sent Events
+"""
+
+from bisect import bisect_left
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+import secrets
+import threading
+import time
+
+from knowledge_base import KnowledgeBase
+from symptom_matcher import word_end, word_start
+
+
+# Comment line keeping idle event streams open through proxies
+KEEPALIVE = b': keepalive\n\n'
+CLOSED_EVENT = b'event: closed\ndata: {}\n\n'
+
+# Renders the analysis body for a knowledge base and a detected symptom tuple
+Renderer = Callable[[KnowledgeBase, Tuple[str, ...]], bytes]
+
+
+class EditConflict(Exception):
+    """Edit was made against a different version of the session text"""
+
+    def __init__(self, version: int, length: int):
+        super().__init__(f'Session text is at version {version}')
+        self.version = version
+        self.length = length
+
+
+def format_event(event: str, data: bytes, event_id: int) -> bytes:
+    """Encode one Server-Sent Events message; data must not contain newlines"""
+    return f'id: {event_id}\nevent: {event}\ndata: '.encode('ascii') + data + b'\n\n'
+
+
+def _common_prefix_length(a: str, b: str) -> int:
+    # Binary search over slice comparisons, which run in C
+    low, high = 0, min(len(a), len(b))
+    while low < high:
+        middle = (low + high + 1) // 2
+        if a[:middle] == b[:middle]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def _common_suffix_length(a: str, b: str, limit: int) -> int:
+    low, high = 0, limit
+    while low < high:
+        middle = (low + high + 1) // 2
+        if a[len(a) - middle:] == b[len(b) - middle:]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def _scan_text(knowledge_base: KnowledgeBase, text: str) -> List[Tuple[int, int, int]]:
+    """
+    matcher.scan with offsets into text itself rather than its lowercased form
+
+    A few characters lowercase to more than one, e.g. 'İ' to 'i̇', which
+    moves every later offset of scan(). Edits are made against the original
+    text, so those offsets are mapped back.
+    """
+    matches = knowledge_base.matcher.scan(text)
+    lowered_length = len(text.lower())
+    if lowered_length == len(text):
+        return matches
+
+    # Original index of each lowercased character, plus the end of the text
+    origin = []
+    for index, char in enumerate(text):
+        origin.extend([index] * len(char.lower()))
+    origin.append(len(text))
+    return [(term_index, origin[start], origin[end - 1] + 1) for term_index, start, end in matches]
+
+
+class LiveSession:
+    """
+    Symptom matches of one text box, kept up to date edit by edit.
+
+    Matches are independent of each other and depend only on their own
+    characters and the character on either side. An edit can therefore
+    only change matches that touch the edited region, and those are at most
+    max_match_length characters long. Each edit rescans that neighbourhood
+    instead of the whole text.
+
+    Listeners are notified only when the detected symptom set changes; the
+    severity, urgency and the rest of the analysis follow from it.
+    """
+
+    def __init__(self, session_id: str, knowledge_base: KnowledgeBase, render: Renderer, max_chars: int):
+        self.session_id = session_id
+        self.knowledge_base = knowledge_base
+        self.render = render
+        self.max_chars = max_chars
+        self.text = ''
+        self.text_version = 0
+        self.analysis_version = 0
+        self.detected: Tuple[str, ...] = ()
+        self.closed = False
+        self.last_active = time.monotonic()
+        self.scanned_chars = 0
+
+        # (start, end, term_index) ordered by start
+        self._matches: List[Tuple[int, int, int]] = []
+        self._counts: Dict[int, int] = {}
+        self._listeners: List[Callable[[], None]] = []
+        self._lock = threading.RLock()
+
+    def replace(self, start: int, end: int, insert: str, knowledge_base: KnowledgeBase,
+                expected_version: Optional[int] = None) -> bool:
+        """
+        Replace text[start:end] with insert
+
+        Args:
+            start, end: Range of the current text to replace
+            insert: Replacement text
+            knowledge_base: Current snapshot; a newer one triggers a full rescan
+            expected_version: Text version the edit was made against, if the client tracks it
+
+        Returns:
+            True if the detected symptoms changed
+
+        Raises:
+            EditConflict: If expected_version is not the current text version
+            ValueError: If the range is invalid or the text would grow too long
+        """
+        with self._lock:
+            if expected_version is not None and expected_version != self.text_version:
+                raise EditConflict(self.text_version, len(self.text))
+            if not 0 <= start <= end <= len(self.text):
+                raise ValueError(f'Edit range {start}-{end} is outside the text (length {len(self.text)})')
+            if len(self.text) - (end - start) + len(insert) > self.max_chars:
+                raise ValueError(f'Text would exceed {self.max_chars} characters')
+
+            self.text_version += 1
+            self.last_active = time.monotonic()
+            if knowledge_base is not self.knowledge_base:
+                self.knowledge_base = knowledge_base
+                self.text = self.text[:start] + insert + self.text[end:]
+                self._rescan_all()
+            else:
+                self._apply(start, end, insert)
+            changed = self._update_detected()
+
+        if changed:
+            self._notify()
+        return changed
+
+    def set_text(self, text: str, knowledge_base: KnowledgeBase, expected_version: Optional[int] = None) -> bool:
+        """Replace the whole text, rescanning only the part that differs from the current text"""
+        with self._lock:
+            current = self.text
+            prefix = _common_prefix_length(current, text)
+            suffix = _common_suffix_length(current, text, min(len(current), len(text)) - prefix)
+            return self.replace(prefix, len(current) - suffix, text[prefix:len(text) - suffix], knowledge_base,
+                                expected_version)
+
+    def _apply(self, start: int, end: int, insert: str) -> None:
+        text = self.text[:start] + insert + self.text[end:]
+        self.text = text
+        delta = len(insert) - (end - start)
+        new_end = start + len(insert)
+        reach = self.knowledge_base.matcher.max_match_length
+
+        # Matches touching the edit, or the characters on either side of it, start in this slice
+        matches = self._matches
+        first = bisect_left(matches, (start - reach,))
+        last = bisect_left(matches, (end + 1,))
+        middle = []
+        for match in matches[first:last]:
+            if match[1] < start:
+                middle.append(match)
+            else:
+                self._count(match[2], -1)
+
+        low = word_start(text, max(start - reach, 0))
+        high = word_end(text, min(new_end + reach, len(text)))
+        window = text[low:high]
+        if len(window.lower()) != len(window):
+            # Lowercasing changed offsets; fall back to scanning everything
+            self._rescan_all()
+            return
+
+        self.scanned_chars += len(window)
+        for term_index, match_start, match_end in self.knowledge_base.matcher.scan(window):
+            match_start += low
+            match_end += low
+            if match_end >= start and match_start <= new_end:
+                middle.append((match_start, match_end, term_index))
+                self._count(term_index, 1)
+
+        middle.sort()
+        tail = [(match_start + delta, match_end + delta, term_index)
+                for match_start, match_end, term_index in matches[last:]] if delta else matches[last:]
+        self._matches = matches[:first] + middle + tail
+
+    def _rescan_all(self) -> None:
+        self.scanned_chars += len(self.text)
+        self._matches = sorted(
+            (start, end, term_index) for term_index, start, end in _scan_text(self.knowledge_base, self.text)
+        )
+        self._counts = {}
+        for _, _, term_index in self._matches:
+            self._count(term_index, 1)
+
+    def _count(self, term_index: int, change: int) -> None:
+        count = self._counts.get(term_index, 0) + change
+        if count:
+            self._counts[term_index] = count
+        else:
+            del self._counts[term_index]
+
+    def _update_detected(self) -> bool:
+        terms = self.knowledge_base.matcher.terms
+        detected = tuple(terms[term_index] for term_index in sorted(self._counts))
+        if detected == self.detected:
+            return False
+        self.detected = detected
+        self.analysis_version += 1
+        return True
+
+    def next_event(self, sent_version: Optional[int]) -> Tuple[Optional[bytes], Optional[int]]:
+        """
+        The message to send a client that has seen sent_version
+
+        Returns:
+            (message or None if the client is up to date, version it brings the client to)
+        """
+        if self.closed:
+            return CLOSED_EVENT, sent_version
+        with self._lock:
+            version, knowledge_base, detected = self.analysis_version, self.knowledge_base, self.detected
+        if version == sent_version:
+            return None, sent_version
+        return format_event('analysis', self.render(knowledge_base, detected), version), version
+
+    def subscribe(self, callback: Callable[[], None]) -> Callable[[], None]:
+        """Call callback after every change, and on close; returns a function that unsubscribes"""
+        with self._lock:
+            self._listeners.append(callback)
+
+        def unsubscribe():
+            with self._lock:
+                if callback in self._listeners:
+                    self._listeners.remove(callback)
+
+        return unsubscribe
+
+    def _notify(self) -> None:
+        with self._lock:
+            listeners = list(self._listeners)
+        for callback in listeners:
+            callback()
+
+    def close(self) -> None:
+        self.closed = True
+        self._notify()
+
+
+class LiveSessionStore:
+    """
+    Live analysis sessions of one process, expiring after a period without edits.
+
+    At most max_sessions are kept; creating one more closes the least
+    recently edited session.
+    """
+
+    def __init__(self, render: Renderer, max_sessions: int = 1000, idle_timeout: float = 600.0,
+                 max_chars: int = 20000):
+        self.render = render
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.max_chars = max_chars
+        self._sessions: 'OrderedDict[str, LiveSession]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._edits = 0
+        self._updates = 0
+        self._scanned_chars = 0
+
+    def create(self, knowledge_base: KnowledgeBase) -> LiveSession:
+        session = LiveSession(secrets.token_hex(16), knowledge_base, self.render, self.max_chars)
+        with self._lock:
+            closed = self._expire(time.monotonic())
+            while len(self._sessions) >= self.max_sessions:
+                closed.append(self._forget(next(iter(self._sessions))))
+            self._sessions[session.session_id] = session
+        for old in closed:
+            old.close()
+        return session
+
+    def get(self, session_id: str) -> Optional[LiveSession]:
+        with self._lock:
+            closed = self._expire(time.monotonic())
+            session = self._sessions.get(session_id)
+        for old in closed:
+            old.close()
+        return session
+
+    def touch(self, session: LiveSession, changed: bool) -> None:
+        """Record an edit, keeping the least recently edited session first"""
+        with self._lock:
+            self._edits += 1
+            self._updates += changed
+            if session.session_id in self._sessions:
+                self._sessions.move_to_end(session.session_id)
+
+    def close(self, session_id: str) -> bool:
+        with self._lock:
+            session = self._forget(session_id) if session_id in self._sessions else None
+        if session is None:
+            return False
+        session.close()
+        return True
+
+    def _forget(self, session_id: str) -> LiveSession:
+        session = self._sessions.pop(session_id)
+        self._scanned_chars += session.scanned_chars
+        return session
+
+    def _expire(self, now: float) -> List[LiveSession]:
+        """Remove sessions idle for longer than idle_timeout; the caller closes them"""
+        expired = []
+        while self._sessions:
+            session = next(iter(self._sessions.values()))
+            if now - session.last_active < self.idle_timeout:
+                break
+            expired.append(self._forget(session.session_id))
+        return expired
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'sessions': len(self._sessions),
+                'edits': self._edits,
+                'updates': self._updates,
+                'scanned_chars': self._scanned_chars + sum(s.scanned_chars for s in self._sessions.values())
+            }
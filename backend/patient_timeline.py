@@ -0,0 +1,223 @@
+"""
+Patient Timeline Module
+SQLite-backed running aggregates of each patient's symptom analyses, keyed by wallet address
+"""
+
+from typing import Any, Dict, List, Optional, Sequence
+import json
+import sqlite3
+import threading
+import time
+
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS patients (
+    patient TEXT PRIMARY KEY,
+    analyses INTEGER NOT NULL,
+    first_seen INTEGER NOT NULL,
+    last_seen INTEGER NOT NULL,
+    -- JSON array of the latest [timestamp, severity, priority] entries, oldest first
+    recent TEXT NOT NULL
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS patient_symptoms (
+    patient TEXT NOT NULL,
+    symptom TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    first_seen INTEGER NOT NULL,
+    last_seen INTEGER NOT NULL,
+    PRIMARY KEY (patient, symptom)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS patient_severities (
+    patient TEXT NOT NULL,
+    severity TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    first_seen INTEGER NOT NULL,
+    last_seen INTEGER NOT NULL,
+    PRIMARY KEY (patient, severity)
+) WITHOUT ROWID;
+
+-- One row per patient and UTC day with analyses, kept for the window only
+CREATE TABLE IF NOT EXISTS patient_days (
+    patient TEXT NOT NULL,
+    day INTEGER NOT NULL,
+    analyses INTEGER NOT NULL,
+    priority_sum INTEGER NOT NULL,
+    max_priority INTEGER NOT NULL,
+    max_severity TEXT NOT NULL,
+    PRIMARY KEY (patient, day)
+) WITHOUT ROWID;
+'''
+
+SECONDS_PER_DAY = 86400
+
+# Mean severity priority change between the older and newer half of the
+# recent analyses that counts as escalating or improving
+TREND_THRESHOLD = 0.5
+MIN_TREND_ANALYSES = 4
+
+
+class PatientTimelineStore:
+    """
+    Per-patient symptom and severity aggregates, updated as analyses happen.
+
+    Recording an analysis touches one row per table, plus one per detected
+    symptom, whatever the length of the patient's history. Reading a
+    timeline returns at most one row per symptom, severity level and day of
+    the window, so it is just as independent of history length. Day rows
+    older than the window are deleted as new ones are written.
+    """
+
+    def __init__(self, path: str, window_days: int = 30, recent_size: int = 10):
+        self.path = path
+        self.window_days = window_days
+        self.recent_size = recent_size
+        self._local = threading.local()
+
+        # Not kept open, so no connection is inherited when gunicorn forks workers
+        connection = sqlite3.connect(path, timeout=30)
+        try:
+            connection.executescript(SCHEMA)
+        finally:
+            connection.close()
+
+    def _connection(self) -> sqlite3.Connection:
+        """One connection per thread"""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+        return connection
+
+    def record(self, patient: str, symptoms: Sequence[str], severity: str, priority: int,
+               timestamp: Optional[int] = None) -> None:
+        """
+        Add one analysis to a patient's aggregates
+
+        Args:
+            patient: Lowercase wallet address
+            symptoms: Detected symptom names
+            severity: Overall severity of the analysis, 'unknown' if nothing was detected
+            priority: Priority of that severity, 0 for 'unknown'
+            timestamp: Unix time of the analysis, now by default
+        """
+        timestamp = int(time.time()) if timestamp is None else int(timestamp)
+        day = timestamp // SECONDS_PER_DAY
+
+        with self._connection() as connection:
+            # Take the write lock before reading, so concurrent workers cannot drop each other's entries
+            connection.execute('BEGIN IMMEDIATE')
+            row = connection.execute('SELECT recent FROM patients WHERE patient = ?', (patient,)).fetchone()
+            recent = json.loads(row[0]) if row else []
+            recent.append([timestamp, severity, priority])
+            recent = json.dumps(recent[-self.recent_size:])
+
+            connection.execute(
+                'INSERT INTO patients (patient, analyses, first_seen, last_seen, recent) VALUES (?, 1, ?, ?, ?) '
+                'ON CONFLICT (patient) DO UPDATE SET analyses = analyses + 1, '
+                'first_seen = MIN(first_seen, excluded.first_seen), '
+                'last_seen = MAX(last_seen, excluded.last_seen), recent = excluded.recent',
+                (patient, timestamp, timestamp, recent)
+            )
+            connection.executemany(
+                'INSERT INTO patient_symptoms (patient, symptom, count, first_seen, last_seen) VALUES (?, ?, 1, ?, ?) '
+                'ON CONFLICT (patient, symptom) DO UPDATE SET count = count + 1, '
+                'first_seen = MIN(first_seen, excluded.first_seen), last_seen = MAX(last_seen, excluded.last_seen)',
+                [(patient, symptom, timestamp, timestamp) for symptom in symptoms]
+            )
+            connection.execute(
+                'INSERT INTO patient_severities (patient, severity, count, first_seen, last_seen) '
+                'VALUES (?, ?, 1, ?, ?) '
+                'ON CONFLICT (patient, severity) DO UPDATE SET count = count + 1, '
+                'first_seen = MIN(first_seen, excluded.first_seen), last_seen = MAX(last_seen, excluded.last_seen)',
+                (patient, severity, timestamp, timestamp)
+            )
+            connection.execute(
+                'INSERT INTO patient_days (patient, day, analyses, priority_sum, max_priority, max_severity) '
+                'VALUES (?, ?, 1, ?, ?, ?) '
+                'ON CONFLICT (patient, day) DO UPDATE SET analyses = analyses + 1, '
+                'priority_sum = priority_sum + excluded.priority_sum, '
+                'max_severity = CASE WHEN excluded.max_priority > max_priority '
+                'THEN excluded.max_severity ELSE max_severity END, '
+                'max_priority = MAX(max_priority, excluded.max_priority)',
+                (patient, day, priority, priority, severity)
+            )
+            connection.execute(
+                'DELETE FROM patient_days WHERE patient = ? AND day <= ?', (patient, day - self.window_days)
+            )
+
+    def get_timeline(self, patient: str, now: Optional[int] = None) -> Dict[str, Any]:
+        """Aggregates for a patient; all empty if no analysis was recorded for them"""
+        connection = self._connection()
+        row = connection.execute(
+            'SELECT analyses, first_seen, last_seen, recent FROM patients WHERE patient = ?', (patient,)
+        ).fetchone()
+        analyses, first_seen, last_seen, recent = row if row else (0, None, None, '[]')
+        recent = json.loads(recent)
+
+        symptoms = [
+            {'symptom': symptom, 'count': count, 'first_seen': symptom_first_seen, 'last_seen': symptom_last_seen}
+            for symptom, count, symptom_first_seen, symptom_last_seen in connection.execute(
+                'SELECT symptom, count, first_seen, last_seen FROM patient_symptoms WHERE patient = ? '
+                'ORDER BY count DESC, symptom', (patient,)
+            )
+        ]
+        severities = {
+            severity: {'count': count, 'first_seen': severity_first_seen, 'last_seen': severity_last_seen}
+            for severity, count, severity_first_seen, severity_last_seen in connection.execute(
+                'SELECT severity, count, first_seen, last_seen FROM patient_severities WHERE patient = ?', (patient,)
+            )
+        }
+
+        today = (int(time.time()) if now is None else int(now)) // SECONDS_PER_DAY
+        daily = [
+            {
+                'date': time.strftime('%Y-%m-%d', time.gmtime(day * SECONDS_PER_DAY)),
+                'analyses': day_analyses,
+                'max_severity': max_severity,
+                'mean_priority': round(priority_sum / day_analyses, 3)
+            }
+            for day, day_analyses, priority_sum, max_severity in connection.execute(
+                'SELECT day, analyses, priority_sum, max_severity FROM patient_days '
+                'WHERE patient = ? AND day > ? ORDER BY day', (patient, today - self.window_days)
+            )
+        ]
+
+        return {
+            'patient': patient,
+            'analyses': analyses,
+            'first_seen': first_seen,
+            'last_seen': last_seen,
+            'symptoms': symptoms,
+            'severities': severities,
+            'recent': [
+                {'timestamp': timestamp, 'severity': severity} for timestamp, severity, _ in reversed(recent)
+            ],
+            'daily': daily,
+            'window_days': self.window_days,
+            'trend': _severity_trend([priority for _, _, priority in recent if priority > 0])
+        }
+
+
+def _severity_trend(priorities: List[int]) -> str:
+    """
+    Compare the mean severity of the newer half of recent analyses with the older half
+
+    Analyses that detected nothing ('unknown', priority 0) carry no severity
+    and must be left out by the caller, or a symptom-free check-in would
+    read as an improvement.
+    """
+    if len(priorities) < MIN_TREND_ANALYSES:
+        return 'insufficient_data'
+    half = len(priorities) // 2
+    older = priorities[:half]
+    newer = priorities[-half:]
+    change = sum(newer) / len(newer) - sum(older) / len(older)
+    if change >= TREND_THRESHOLD:
+        return 'escalating'
+    if change <= -TREND_THRESHOLD:
+        return 'improving'
+    return 'stable'
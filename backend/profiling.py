@@ -0,0 +1,267 @@
+"""
+Profiling Module
+Opt-in cProfile capture of sampled or requested HTTP requests, with collapsed stacks for flamegraphs
+"""
+
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+import cProfile
+import hmac
+import json
+import logging
+import marshal
+import os
+import random
+import re
+import secrets
+import time
+
+
+# WSGI environ key carrying a profiling decision already made by the ASGI server
+ENVIRON_KEY = 'medblocai.profile'
+
+# Only profiles saved by this module are served back
+PROFILE_ID = re.compile(r'^[0-9a-f]{16}$')
+
+# Collapsed stacks stop at this depth, and skip call paths shorter than a microsecond
+MAX_STACK_DEPTH = 128
+MIN_PATH_SECONDS = 1e-6
+
+# (filename, line, function name), as cProfile identifies functions
+FunctionKey = Tuple[str, int, str]
+
+logger = logging.getLogger('profiling')
+
+
+class RequestProfiler:
+    """
+    Profiles whole requests with cProfile when sampled or asked to.
+
+    A request is profiled with probability sample_rate, or when it carries
+    `X-Profile: 1` and an `X-Admin-Token` matching token. Everything else pays
+    one header lookup and, with sampling on, one random number.
+
+    Profiles are written to a directory shared by all workers, so any worker
+    can serve them, and only the newest max_profiles are kept. Each one is a
+    standard pstats file with a JSON file of request details beside it.
+    """
+
+    def __init__(self, directory: str, sample_rate: float = 0.0, max_profiles: int = 50, token: str = '',
+                 excluded_prefix: str = '/api/admin/profiles'):
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.max_profiles = max(max_profiles, 1)
+        self.token = token
+        self.excluded_prefix = excluded_prefix
+        os.makedirs(directory, exist_ok=True)
+
+    def select(self, path: str, profile_header: Optional[str], token_header: Optional[str]) -> str:
+        """
+        Decide whether to profile a request
+
+        Returns:
+            'header' or 'sampled' if it should be profiled, otherwise ''
+        """
+        if path.startswith(self.excluded_prefix):
+            return ''
+        if profile_header == '1' and self.token and hmac.compare_digest(token_header or '', self.token):
+            return 'header'
+        if self.sample_rate > 0 and random.random() < self.sample_rate:
+            return 'sampled'
+        return ''
+
+    def wrap(self, wsgi_app: Callable) -> Callable:
+        """WSGI middleware profiling the selected requests, streamed bodies included"""
+        def profiled_app(environ, start_response):
+            trigger = environ.get(ENVIRON_KEY)
+            if trigger is None:
+                trigger = self.select(
+                    environ.get('PATH_INFO', ''), environ.get('HTTP_X_PROFILE'), environ.get('HTTP_X_ADMIN_TOKEN')
+                )
+            if not trigger:
+                return wsgi_app(environ, start_response)
+
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError:
+                # Another profiler or debugger already owns this thread
+                return wsgi_app(environ, start_response)
+
+            profile_id = secrets.token_hex(8)
+            details = {
+                'id': profile_id,
+                'method': environ.get('REQUEST_METHOD', ''),
+                'path': environ.get('PATH_INFO', ''),
+                'trigger': trigger,
+                'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+                'status': None
+            }
+
+            def capture_start_response(status, headers, exc_info=None):
+                details['status'] = int(status.split(' ', 1)[0])
+                return start_response(status, list(headers) + [('X-Profile-Id', profile_id)], exc_info)
+
+            started = time.perf_counter()
+            try:
+                body = wsgi_app(environ, capture_start_response)
+            except BaseException:
+                profile.disable()
+                self._save(profile, details, time.perf_counter() - started)
+                raise
+            profile.disable()
+            return _ProfiledBody(body, profile, lambda: self._save(profile, details, time.perf_counter() - started))
+
+        return profiled_app
+
+    def _save(self, profile: cProfile.Profile, details: Dict[str, Any], duration: float) -> None:
+        details['duration_ms'] = round(duration * 1000, 3)
+        profile.create_stats()
+        # Names start with the time so the oldest sort first
+        prefix = os.path.join(self.directory, f'{time.time_ns():020d}-{details["id"]}')
+        try:
+            _write_atomic(prefix + '.prof', marshal.dumps(profile.stats))
+            _write_atomic(prefix + '.json', json.dumps(details).encode('utf-8'))
+            self._prune()
+        except OSError as e:
+            logger.warning(f"Could not save profile {details['id']}: {e}")
+
+    def _prune(self) -> None:
+        names = self._names()
+        for name in names[:-self.max_profiles]:
+            for extension in ('.json', '.prof'):
+                try:
+                    os.remove(os.path.join(self.directory, name + extension))
+                except FileNotFoundError:
+                    pass
+
+    def _names(self) -> List[str]:
+        """Base names of complete profiles, oldest first"""
+        try:
+            entries = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return sorted(entry[:-5] for entry in entries if entry.endswith('.json'))
+
+    def list(self) -> List[Dict[str, Any]]:
+        """Details of the stored profiles, newest first"""
+        profiles = []
+        for name in reversed(self._names()):
+            try:
+                with open(os.path.join(self.directory, name + '.json'), 'rb') as f:
+                    profiles.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return profiles
+
+    def pstats_path(self, profile_id: str) -> Optional[str]:
+        """Path of a stored profile in pstats format, or None if it is gone"""
+        if not PROFILE_ID.match(profile_id):
+            return None
+        for name in self._names():
+            if name.endswith(profile_id):
+                path = os.path.join(self.directory, name + '.prof')
+                return path if os.path.exists(path) else None
+        return None
+
+    def collapsed(self, profile_ids: Iterable[str]) -> str:
+        """Collapsed stacks of the given profiles, merged, with values in microseconds"""
+        totals: Dict[str, float] = {}
+        for profile_id in profile_ids:
+            path = self.pstats_path(profile_id)
+            if path is None:
+                continue
+            try:
+                with open(path, 'rb') as f:
+                    stats = marshal.load(f)
+            except (OSError, ValueError, EOFError):
+                continue
+            collapse_stats(stats, totals)
+        return ''.join(
+            f'{stack} {round(seconds * 1e6)}\n' for stack, seconds in sorted(totals.items())
+            if round(seconds * 1e6) > 0
+        )
+
+
+class _ProfiledBody:
+    """Response iterable that keeps profiling while the body is produced, and saves the profile on close"""
+
+    def __init__(self, body: Iterable[bytes], profile: cProfile.Profile, finish: Callable[[], None]):
+        self.body = body
+        self.profile = profile
+        self.finish = finish
+
+    def __iter__(self) -> Iterator[bytes]:
+        iterator = iter(self.body)
+        while True:
+            self.profile.enable()
+            try:
+                chunk = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self.profile.disable()
+            yield chunk
+
+    def close(self) -> None:
+        try:
+            if hasattr(self.body, 'close'):
+                self.body.close()
+        finally:
+            self.finish()
+
+
+def _write_atomic(path: str, data: bytes) -> None:
+    temporary = path + '.tmp'
+    with open(temporary, 'wb') as f:
+        f.write(data)
+    os.replace(temporary, path)
+
+
+def _label(function: FunctionKey) -> str:
+    filename, line, name = function
+    if filename == '~':
+        # Built-in functions and methods, e.g. "<built-in method builtins.len>"
+        return name.replace(';', ',')
+    return f'{os.path.basename(filename)}:{name}:{line}'.replace(';', ',')
+
+
+def collapse_stats(stats: Dict[FunctionKey, Tuple], totals: Optional[Dict[str, float]] = None) -> Dict[str, float]:
+    """
+    Turn cProfile statistics into collapsed stacks with their self time in seconds
+
+    cProfile records time per caller and callee pair rather than whole
+    stacks. Stacks are rebuilt by walking down from functions without a
+    recorded caller, splitting each function's time between the paths that
+    reach it in proportion to the time its callers spent calling it.
+    Recursive calls are folded into the first occurrence on a path.
+    """
+    totals = {} if totals is None else totals
+    callees: Dict[FunctionKey, List[Tuple[FunctionKey, float]]] = {}
+    roots = []
+    for function, (_, _, _, _, callers) in stats.items():
+        if function[2].endswith("of '_lsprof.Profiler' objects>"):
+            continue
+        if not any(caller in stats for caller in callers):
+            roots.append(function)
+        for caller, edge in callers.items():
+            callees.setdefault(caller, []).append((function, edge[3]))
+
+    def visit(function: FunctionKey, path: Tuple[str, ...], on_path: frozenset, fraction: float) -> None:
+        path = path + (_label(function),)
+        self_time = stats[function][2] * fraction
+        if self_time > 0:
+            stack = ';'.join(path)
+            totals[stack] = totals.get(stack, 0.0) + self_time
+        if len(path) >= MAX_STACK_DEPTH:
+            return
+        on_path = on_path | {function}
+        for callee, edge_time in callees.get(function, ()):
+            callee_time = stats[callee][3]
+            path_time = edge_time * fraction
+            if callee in on_path or callee_time <= 0 or path_time < MIN_PATH_SECONDS:
+                continue
+            visit(callee, path, on_path, min(path_time / callee_time, 1.0))
+
+    for root in roots:
+        visit(root, (), frozenset(), 1.0)
+    return totals
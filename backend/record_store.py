@@ -0,0 +1,209 @@
+"""
+Record Store Module
+SQLite index of HealthRecordRegistry events for paginated per-patient queries
+"""
+
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import sqlite3
+import threading
+
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+
+-- Hashes of indexed blocks, used to detect reorganisations
+CREATE TABLE IF NOT EXISTS blocks (
+    number INTEGER PRIMARY KEY,
+    hash TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS records (
+    patient TEXT NOT NULL,
+    record_index INTEGER NOT NULL,
+    ipfs_hash TEXT NOT NULL,
+    record_type TEXT NOT NULL,
+    timestamp INTEGER NOT NULL,
+    block_number INTEGER NOT NULL,
+    transaction_hash TEXT NOT NULL,
+    log_index INTEGER NOT NULL,
+    PRIMARY KEY (patient, record_index)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS records_block ON records (block_number);
+
+CREATE TABLE IF NOT EXISTS accesses (
+    block_number INTEGER NOT NULL,
+    log_index INTEGER NOT NULL,
+    patient TEXT NOT NULL,
+    accessor TEXT NOT NULL,
+    record_index INTEGER NOT NULL,
+    timestamp INTEGER NOT NULL,
+    transaction_hash TEXT NOT NULL,
+    PRIMARY KEY (block_number, log_index)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS accesses_patient ON accesses (patient, block_number, log_index);
+'''
+
+RECORD_COLUMNS = ('patient', 'record_index', 'ipfs_hash', 'record_type', 'timestamp',
+                  'block_number', 'transaction_hash', 'log_index')
+ACCESS_COLUMNS = ('block_number', 'log_index', 'patient', 'accessor', 'record_index',
+                  'timestamp', 'transaction_hash')
+
+
+class RecordStore:
+    """
+    SQLite-backed index of health record events.
+
+    The indexer is the only writer; API workers open the same file for
+    reading. WAL mode lets readers run while a batch of blocks is written,
+    and each batch is committed atomically together with the new cursor.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+
+        # Not kept open, so no connection is inherited when gunicorn forks workers
+        connection = sqlite3.connect(path, timeout=30)
+        try:
+            connection.executescript(SCHEMA)
+        finally:
+            connection.close()
+
+    def _connection(self) -> sqlite3.Connection:
+        """One connection per thread"""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+        return connection
+
+    def close(self) -> None:
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+    def get_meta(self, key: str) -> Optional[str]:
+        row = self._connection().execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key: str, value: str) -> None:
+        with self._connection() as connection:
+            connection.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, value))
+
+    @property
+    def last_block(self) -> Optional[int]:
+        """Last block whose events are fully indexed, or None before the first batch"""
+        value = self.get_meta('last_block')
+        return int(value) if value is not None else None
+
+    def block_hashes_from(self, number: int) -> List[Tuple[int, str]]:
+        """Stored (number, hash) pairs at or above number, newest first"""
+        return self._connection().execute(
+            'SELECT number, hash FROM blocks WHERE number >= ? ORDER BY number DESC', (number,)
+        ).fetchall()
+
+    def write_batch(self, last_block: int, blocks: Dict[int, str], records: Iterable[Tuple],
+                    accesses: Iterable[Tuple], keep_blocks_from: int) -> None:
+        """
+        Store one range of indexed blocks and advance the cursor, atomically
+
+        Args:
+            last_block: New cursor, the last block number covered by the batch
+            blocks: Hashes of the blocks that had events, plus last_block itself
+            records: Rows in RECORD_COLUMNS order
+            accesses: Rows in ACCESS_COLUMNS order
+            keep_blocks_from: Block hashes below this number are no longer needed
+        """
+        with self._connection() as connection:
+            connection.executemany('INSERT OR REPLACE INTO blocks (number, hash) VALUES (?, ?)', blocks.items())
+            connection.executemany(
+                f"INSERT OR REPLACE INTO records ({', '.join(RECORD_COLUMNS)}) "
+                f"VALUES ({', '.join('?' * len(RECORD_COLUMNS))})",
+                records
+            )
+            connection.executemany(
+                f"INSERT OR REPLACE INTO accesses ({', '.join(ACCESS_COLUMNS)}) "
+                f"VALUES ({', '.join('?' * len(ACCESS_COLUMNS))})",
+                accesses
+            )
+            connection.execute('DELETE FROM blocks WHERE number < ?', (keep_blocks_from,))
+            connection.execute(
+                'INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', ('last_block', str(last_block))
+            )
+
+    def rollback_to(self, block_number: int) -> None:
+        """Discard everything indexed after block_number, which becomes the cursor"""
+        with self._connection() as connection:
+            connection.execute('DELETE FROM records WHERE block_number > ?', (block_number,))
+            connection.execute('DELETE FROM accesses WHERE block_number > ?', (block_number,))
+            connection.execute('DELETE FROM blocks WHERE number > ?', (block_number,))
+            connection.execute(
+                'INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', ('last_block', str(block_number))
+            )
+
+    def count_records(self, patient: str) -> int:
+        """Number of indexed records for a patient"""
+        return self._connection().execute(
+            'SELECT COUNT(*) FROM records WHERE patient = ?', (patient,)
+        ).fetchone()[0]
+
+    def get_records(self, patient: str, offset: int = 0, limit: int = 20,
+                    newest_first: bool = False) -> List[Dict[str, Any]]:
+        """
+        One page of a patient's records
+
+        Record indexes are contiguous per patient, so the page is a range
+        scan of the primary key rather than an OFFSET skip.
+        """
+        if newest_first:
+            total = self.count_records(patient)
+            high = total - 1 - offset
+            rows = self._connection().execute(
+                f"SELECT {', '.join(RECORD_COLUMNS)} FROM records "
+                'WHERE patient = ? AND record_index <= ? AND record_index > ? ORDER BY record_index DESC',
+                (patient, high, high - limit)
+            ).fetchall()
+        else:
+            rows = self._connection().execute(
+                f"SELECT {', '.join(RECORD_COLUMNS)} FROM records "
+                'WHERE patient = ? AND record_index >= ? AND record_index < ? ORDER BY record_index',
+                (patient, offset, offset + limit)
+            ).fetchall()
+        return [dict(zip(RECORD_COLUMNS, row)) for row in rows]
+
+    def get_accesses(self, patient: str, offset: int = 0, limit: int = 20) -> List[Dict[str, Any]]:
+        """One page of access events for a patient's records, newest first"""
+        rows = self._connection().execute(
+            f"SELECT {', '.join(ACCESS_COLUMNS)} FROM accesses WHERE patient = ? "
+            'ORDER BY block_number DESC, log_index DESC LIMIT ? OFFSET ?',
+            (patient, limit, offset)
+        ).fetchall()
+        return [dict(zip(ACCESS_COLUMNS, row)) for row in rows]
+
+    def count_accesses(self, patient: str) -> int:
+        return self._connection().execute(
+            'SELECT COUNT(*) FROM accesses WHERE patient = ?', (patient,)
+        ).fetchone()[0]
+
+    def stats(self) -> Dict[str, Any]:
+        """Index totals and position"""
+        connection = self._connection()
+        records, patients = connection.execute(
+            'SELECT COUNT(*), COUNT(DISTINCT patient) FROM records'
+        ).fetchone()
+        return {
+            'contract_address': self.get_meta('contract_address'),
+            'chain_id': int(self.get_meta('chain_id')) if self.get_meta('chain_id') else None,
+            'last_block': self.last_block,
+            'total_records': records,
+            'patients': patients,
+            'total_accesses': connection.execute('SELECT COUNT(*) FROM accesses').fetchone()[0]
+        }
@@ -0,0 +1,474 @@
+"""
+Traffic Replay
+Replays captured production traffic against an instance and reports per-endpoint throughput and latency
+
+Usage:
+    python replay.py run captures/ --target http://localhost:5000 --rate 200 --duration 60 --output gunicorn-w4.json
+    python replay.py run captures/*.jsonl --concurrency 32 --duration 60 --output uvicorn.json --label uvicorn
+    python replay.py compare gunicorn-w4.json uvicorn.json --threshold 0.10
+"""
+
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+import argparse
+import glob
+import http.client
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import threading
+import time
+
+
+FORMAT_VERSION = 1
+
+# Latency percentiles reported per endpoint
+PERCENTILES = (('p50_ms', 0.50), ('p95_ms', 0.95), ('p99_ms', 0.99))
+
+# Time given to client processes to start before the first request is due
+PROCESS_START_DELAY = 1.0
+
+
+def load_capture(paths: List[str]) -> List[Dict[str, Any]]:
+    """
+    Read capture files written by traffic_capture, merged in time order
+
+    Args:
+        paths: Capture files, or directories holding capture-*.jsonl files
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(glob.glob(os.path.join(path, 'capture-*.jsonl'))))
+        else:
+            files.append(path)
+
+    requests = []
+    for path in files:
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                # A worker killed mid-write leaves a partial last line
+                try:
+                    requests.append(json.loads(line))
+                except ValueError:
+                    continue
+
+    if not requests:
+        raise ValueError(f"No captured requests in {', '.join(paths)}")
+    requests.sort(key=lambda entry: entry['timestamp'])
+    return requests
+
+
+class Target:
+    """Keep-alive connection to the instance under test, one per replay thread"""
+
+    def __init__(self, url: str, timeout: float):
+        parts = urlsplit(url)
+        if parts.scheme not in ('http', 'https') or not parts.hostname:
+            raise ValueError(f"Unsupported target URL: '{url}'")
+        self.connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+        self.host = parts.hostname
+        self.port = parts.port
+        self.base_path = parts.path.rstrip('/')
+        self.timeout = timeout
+        self._connection: Optional[http.client.HTTPConnection] = None
+
+    def request(self, method: str, path: str, body: Optional[bytes],
+                headers: Dict[str, str]) -> http.client.HTTPResponse:
+        """Send a request; returns the response with its body read"""
+        if self._connection is None:
+            self._connection = self.connection_class(self.host, self.port, timeout=self.timeout)
+        try:
+            self._connection.request(method, self.base_path + path, body=body, headers=headers)
+            response = self._connection.getresponse()
+            response.read()
+        except (http.client.HTTPException, OSError):
+            self.close()
+            raise
+        if response.will_close:
+            self.close()
+        return response
+
+    def close(self) -> None:
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+
+class Replay:
+    """
+    Sends captured requests to a target and records their latency.
+
+    With a rate, requests are sent open-loop: request i is due i / rate
+    seconds after the start whatever happened to earlier ones, and latency is
+    measured from when it was due. A server that falls behind therefore shows
+    its queueing delay in the percentiles instead of slowing the load down.
+    Without a rate, each of the concurrency threads sends its next request as
+    soon as the previous one is answered.
+
+    The capture is replayed in order and from the start again when it runs
+    out. Requests sent during the warmup are not counted. One Python process
+    can only send so many requests per second, so a run can be split
+    between processes: each one sends every processes-th request, starting
+    at process_index.
+    """
+
+    def __init__(self, requests: List[Dict[str, Any]], target: str, concurrency: int, rate: Optional[float],
+                 duration: float, warmup: float = 0.0, timeout: float = 30.0, etags: Optional[Dict[str, str]] = None,
+                 process_index: int = 0, processes: int = 1, headers: Optional[Dict[str, str]] = None):
+        # (label, method, path, body, conditional), encoded once so replay threads only send
+        self._prepared = [
+            (
+                f"{entry['method']} {entry['endpoint']}",
+                entry['method'],
+                entry['path'],
+                json.dumps(entry['body']).encode('utf-8') if entry.get('body') is not None else None,
+                bool(entry.get('conditional'))
+            )
+            for entry in requests
+        ]
+        self.target = target
+        self.concurrency = concurrency
+        self.rate = rate
+        self.duration = duration
+        self.warmup = warmup
+        self.timeout = timeout
+        self.etags = etags or {}
+        self.process_index = process_index
+        self.processes = processes
+        self.headers = headers or {}
+        self._next = 0
+        self._lock = threading.Lock()
+        self._latencies: Dict[str, List[float]] = {}
+        self._statuses: Dict[str, Dict[str, int]] = {}
+        self._errors: Dict[str, int] = {}
+        self._last_finished = 0.0
+
+    def _take(self, started: float) -> Optional[Tuple[Tuple, float]]:
+        """Next request and the time it is due, or None once the run is over"""
+        with self._lock:
+            index = self._next * self.processes + self.process_index
+            self._next += 1
+        due = started + index / self.rate if self.rate else time.perf_counter()
+        if due - started >= self.warmup + self.duration:
+            return None
+        return self._prepared[index % len(self._prepared)], due
+
+    def _worker(self, started: float) -> None:
+        target = Target(self.target, self.timeout)
+        try:
+            while True:
+                item = self._take(started)
+                if item is None:
+                    return
+                (label, method, path, body, conditional), due = item
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+
+                headers = dict(self.headers)
+                if body is not None:
+                    headers['Content-Type'] = 'application/json'
+                if conditional and path in self.etags:
+                    headers['If-None-Match'] = self.etags[path]
+
+                try:
+                    outcome = str(target.request(method, path, body, headers).status)
+                except (http.client.HTTPException, OSError):
+                    outcome = 'error'
+                finished = time.perf_counter()
+
+                if due - started >= self.warmup:
+                    self._record(label, outcome, due, finished)
+        finally:
+            target.close()
+
+    def _record(self, endpoint: str, outcome: str, due: float, finished: float) -> None:
+        with self._lock:
+            self._latencies.setdefault(endpoint, []).append(finished - due)
+            self._last_finished = max(self._last_finished, finished)
+            statuses = self._statuses.setdefault(endpoint, {})
+            statuses[outcome] = statuses.get(outcome, 0) + 1
+            if outcome == 'error' or outcome.startswith('5'):
+                self._errors[endpoint] = self._errors.get(endpoint, 0) + 1
+
+    def measure(self, started: float) -> Dict[str, Any]:
+        """Replay from started, a time.perf_counter() value, and return the raw measurements"""
+        delay = started - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        threads = [
+            threading.Thread(target=self._worker, args=(started,), name=f'replay-{i}', daemon=True)
+            for i in range(self.concurrency)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return {
+            'latencies': self._latencies,
+            'statuses': self._statuses,
+            'errors': self._errors,
+            'last_finished': self._last_finished
+        }
+
+
+def fetch_etags(target_url: str, requests: List[Dict[str, Any]], timeout: float) -> Dict[str, str]:
+    """Current ETags of the paths that captured requests fetched conditionally"""
+    etags = {}
+    target = Target(target_url, timeout)
+    try:
+        for path in sorted({entry['path'] for entry in requests if entry.get('conditional')}):
+            etag = target.request('GET', path, None, {}).getheader('ETag')
+            if etag:
+                etags[path] = etag
+    finally:
+        target.close()
+    return etags
+
+
+def _measure_in_process(options: Dict[str, Any], started: float) -> Dict[str, Any]:
+    return Replay(**options).measure(started)
+
+
+def replay_capture(requests: List[Dict[str, Any]], target: str, concurrency: int, rate: Optional[float],
+                   duration: float, warmup: float, timeout: float, processes: int = 1,
+                   headers: Optional[Dict[str, str]] = None) -> Dict[str, Dict[str, Any]]:
+    """
+    Replay for warmup plus duration seconds
+
+    Returns:
+        Results per endpoint, as "METHOD route", plus 'all'
+    """
+    etags = fetch_etags(target, requests, timeout)
+    options = [
+        {
+            'requests': requests,
+            'target': target,
+            # Threads are shared out between the processes
+            'concurrency': concurrency // processes + (index < concurrency % processes),
+            'rate': rate,
+            'duration': duration,
+            'warmup': warmup,
+            'timeout': timeout,
+            'etags': etags,
+            'process_index': index,
+            'processes': processes,
+            'headers': headers
+        }
+        for index in range(processes)
+    ]
+
+    if processes == 1:
+        started = time.perf_counter()
+        measurements = [Replay(**options[0]).measure(started)]
+    else:
+        # time.perf_counter() is system-wide, so every process can use the same start
+        started = time.perf_counter() + PROCESS_START_DELAY
+        with multiprocessing.Pool(processes) as pool:
+            measurements = pool.starmap(_measure_in_process, [(option, started) for option in options])
+
+    latencies: Dict[str, List[float]] = {}
+    statuses: Dict[str, Dict[str, int]] = {}
+    errors: Dict[str, int] = {}
+    for measurement in measurements:
+        for name, endpoint_latencies in measurement['latencies'].items():
+            latencies.setdefault(name, []).extend(endpoint_latencies)
+        for name, endpoint_statuses in measurement['statuses'].items():
+            merged = statuses.setdefault(name, {})
+            for status, count in endpoint_statuses.items():
+                merged[status] = merged.get(status, 0) + count
+        for name, count in measurement['errors'].items():
+            errors[name] = errors.get(name, 0) + count
+
+    # Throughput counts until the last answer, so a server that falls behind the rate shows it
+    elapsed = max(measurement['last_finished'] for measurement in measurements) - started - warmup
+
+    results = {name: summarize(endpoint_latencies, statuses[name], errors.get(name, 0), elapsed)
+               for name, endpoint_latencies in sorted(latencies.items())}
+    everything = [latency for endpoint_latencies in latencies.values() for latency in endpoint_latencies]
+    all_statuses: Dict[str, int] = {}
+    for endpoint_statuses in statuses.values():
+        for status, count in endpoint_statuses.items():
+            all_statuses[status] = all_statuses.get(status, 0) + count
+    if everything:
+        results['all'] = summarize(everything, all_statuses, sum(errors.values()), elapsed)
+    return results
+
+
+def summarize(latencies: List[float], statuses: Dict[str, int], errors: int, elapsed: float) -> Dict[str, Any]:
+    """Throughput, latency percentiles and status counts of one endpoint"""
+    latencies = sorted(latencies)
+    summary = {
+        'requests': len(latencies),
+        'errors': errors,
+        'throughput_rps': len(latencies) / elapsed if elapsed > 0 else 0.0,
+        'mean_ms': sum(latencies) / len(latencies) * 1000
+    }
+    for name, fraction in PERCENTILES:
+        summary[name] = latencies[min(int(fraction * len(latencies)), len(latencies) - 1)] * 1000
+    summary['max_ms'] = latencies[-1] * 1000
+    summary['statuses'] = dict(sorted(statuses.items()))
+    return summary
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    """Replay the capture and return the results document"""
+    requests = load_capture(args.capture)
+    if args.endpoint:
+        requests = [entry for entry in requests if entry['endpoint'] in args.endpoint]
+        if not requests:
+            raise ValueError(f"No captured requests for {', '.join(args.endpoint)}")
+
+    concurrency = max(args.concurrency or (64 if args.rate else 8), args.processes)
+    headers = {'X-Timeline-Token': args.timeline_token} if args.timeline_token else None
+    results = replay_capture(requests, args.target, concurrency, args.rate, args.duration, args.warmup, args.timeout,
+                             args.processes, headers)
+
+    for name, stats in results.items():
+        print(f"{name:<35} {stats['requests']:>8} req {stats['throughput_rps']:>10,.1f} req/s  "
+              f"p50 {stats['p50_ms']:>8.2f}ms  p95 {stats['p95_ms']:>8.2f}ms  p99 {stats['p99_ms']:>8.2f}ms  "
+              f"errors {stats['errors']}", file=sys.stderr)
+
+    return {
+        'format_version': FORMAT_VERSION,
+        'meta': {
+            'label': args.label or '',
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'target': args.target,
+            'mode': 'rate' if args.rate else 'concurrency',
+            'rate': args.rate,
+            'concurrency': concurrency,
+            'processes': args.processes,
+            'duration': args.duration,
+            'warmup': args.warmup,
+            'captured_requests': len(requests),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count()
+        },
+        'results': results
+    }
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float) -> List[str]:
+    """
+    Compare two replay result documents
+
+    Returns:
+        Descriptions of endpoints whose throughput dropped, or whose p50, p95
+        or p99 latency grew, by more than the threshold
+    """
+    regressions = []
+
+    print(f"{baseline['meta']['label'] or 'baseline'} -> {current['meta']['label'] or 'current'}", file=sys.stderr)
+    load = ('mode', 'rate', 'concurrency')
+    if any(baseline['meta'][key] != current['meta'][key] for key in load):
+        # Only runs under the same offered load are comparable
+        print('Warning: the runs used different load settings: '
+              + ', '.join(f"{key} {baseline['meta'][key]} -> {current['meta'][key]}" for key in load),
+              file=sys.stderr)
+
+    for name, stats in current['results'].items():
+        base = baseline['results'].get(name)
+        if base is None:
+            continue
+
+        change = stats['throughput_rps'] / base['throughput_rps'] - 1 if base['throughput_rps'] else 0.0
+        marker = ''
+        if -change > threshold:
+            marker = '  REGRESSION'
+            regressions.append(f"{name} throughput: {base['throughput_rps']:.1f} -> "
+                               f"{stats['throughput_rps']:.1f} req/s ({change:+.1%})")
+        print(f"{name:<35} req/s  {base['throughput_rps']:>10.1f} -> {stats['throughput_rps']:>10.1f}   "
+              f"{change:>+8.1%}{marker}", file=sys.stderr)
+
+        for metric, _ in PERCENTILES:
+            change = stats[metric] / base[metric] - 1 if base[metric] else 0.0
+            marker = ''
+            if change > threshold:
+                marker = '  REGRESSION'
+                regressions.append(f"{name} {metric}: {base[metric]:.2f}ms -> {stats[metric]:.2f}ms ({change:+.1%})")
+            print(f"{name:<35} {metric} {base[metric]:>10.2f} -> {stats[metric]:>10.2f}ms {change:>+8.1%}{marker}",
+                  file=sys.stderr)
+
+        if stats['errors'] > base['errors']:
+            regressions.append(f"{name} errors: {base['errors']} -> {stats['errors']}")
+
+    return regressions
+
+
+def _load(path: str) -> Dict[str, Any]:
+    with open(path, 'r', encoding='utf-8') as f:
+        document = json.load(f)
+    if document.get('format_version') != FORMAT_VERSION:
+        raise ValueError(f"'{path}' is not a replay results file of version {FORMAT_VERSION}")
+    return document
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description='Replay captured traffic against a running instance.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='Replay a capture and write results')
+    run_parser.add_argument('capture', nargs='+', help='Capture files or directories')
+    run_parser.add_argument('--target', default='http://localhost:5000', help='Base URL of the instance under test')
+    run_parser.add_argument('--rate', type=float, help='Requests per second to send (default: closed loop)')
+    run_parser.add_argument('--concurrency', type=int,
+                            help='Client threads (default: 64 with --rate, otherwise 8)')
+    run_parser.add_argument('--processes', type=int, default=1,
+                            help='Client processes sharing the load, for rates one process cannot send')
+    run_parser.add_argument('--duration', type=float, default=30, help='Seconds to measure')
+    run_parser.add_argument('--warmup', type=float, default=5, help='Seconds to replay before measuring')
+    run_parser.add_argument('--timeout', type=float, default=30, help='Request timeout in seconds')
+    run_parser.add_argument('--timeline-token', default=os.getenv('TIMELINE_WRITE_TOKEN'),
+                            help='X-Timeline-Token sent so requests naming a patient are accepted')
+    run_parser.add_argument('--endpoint', action='append', help='Only replay this route, e.g. /api/analyze')
+    run_parser.add_argument('--label', help='Name of the configuration under test, e.g. "gunicorn -w 4"')
+    run_parser.add_argument('--output', default='replay_results.json', help='Results file to write')
+    run_parser.add_argument('--baseline', help='Compare against this results file after running')
+
+    compare_parser = commands.add_parser('compare', help='Compare two results files')
+    compare_parser.add_argument('baseline', help='Results of the reference configuration')
+    compare_parser.add_argument('current', help='Results of the configuration under test')
+
+    for sub in (run_parser, compare_parser):
+        sub.add_argument('--threshold', type=float, default=0.10,
+                         help='Allowed throughput drop or latency growth, e.g. 0.10 for 10%%')
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+
+    try:
+        if args.command == 'run':
+            current = run(args)
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump(current, f, indent=2)
+            baseline = _load(args.baseline) if args.baseline else None
+        else:
+            baseline = _load(args.baseline)
+            current = _load(args.current)
+    except (OSError, ValueError, http.client.HTTPException) as e:
+        print(f"replay: {e}", file=sys.stderr)
+        return 2
+
+    if baseline is None:
+        return 0
+
+    regressions = compare(baseline, current, args.threshold)
+    if regressions:
+        print(f"\n{len(regressions)} regression(s):", file=sys.stderr)
+        for regression in regressions:
+            print(f"  {regression}", file=sys.stderr)
+        return 1
+
+    print('\nNo regressions.', file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
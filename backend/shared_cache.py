@@ -0,0 +1,420 @@
+"""
+Shared Cache Module
+Cross-worker cache tier for serialized analyses, in shared memory or on a Redis-protocol server
+"""
+
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Hashable, Iterator, List, Optional, Tuple
+from urllib.parse import unquote, urlsplit
+import fcntl
+import hashlib
+import logging
+import mmap
+import os
+import socket
+import struct
+import threading
+import time
+import zlib
+
+
+# Shared memory file layout: a header, then fixed-size slots that each hold
+# a sequence number, key digest, expiry time, kind, value length, CRC and value
+FILE_MAGIC = b'MBSC0001'
+FILE_HEADER = struct.Struct('<8sII')
+FILE_HEADER_SIZE = 64
+SLOT_HEADER = struct.Struct('<Q16sdB3xII')
+SEQUENCE = struct.Struct('<Q')
+
+# Consecutive slots a key may occupy, starting at its hash
+PROBE_SLOTS = 8
+
+SLOT_EMPTY = 0
+SLOT_VALUE = 1
+SLOT_BUILDING = 2
+
+EMPTY_DIGEST = bytes(16)
+
+logger = logging.getLogger('shared_cache')
+
+
+class SharedCacheError(Exception):
+    """The shared tier failed or could not be reached"""
+
+
+class SharedMemoryCache:
+    """
+    Fixed-size hash table in a memory-mapped file, shared by every worker on a host.
+
+    A key hashes to a window of PROBE_SLOTS consecutive slots. A store takes
+    the slot already holding the key, else an empty or expired one, else the
+    one closest to expiring, so the file never grows. Values that do not fit
+    in a slot are not shared.
+
+    Writers serialise on a record lock over the file. Readers take no lock:
+    a slot's sequence number is odd while it is being written, and a read
+    that sees it change, or a value that fails its CRC, is a miss.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 64 * 1024 ** 2, max_value_bytes: int = 16384):
+        # Round slots up to cache lines so neighbouring slots do not share one
+        self.slot_size = (SLOT_HEADER.size + max_value_bytes + 63) // 64 * 64
+        self.max_value_bytes = self.slot_size - SLOT_HEADER.size
+        self.slot_count = max((max_bytes - FILE_HEADER_SIZE) // self.slot_size, PROBE_SLOTS)
+        self.path = path
+        size = FILE_HEADER_SIZE + self.slot_count * self.slot_size
+        header = FILE_HEADER.pack(FILE_MAGIC, self.slot_size, self.slot_count)
+
+        # Record locks belong to a process, so threads also need a lock of their own
+        self._thread_lock = threading.Lock()
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        with self._write_lock():
+            # Start over if the file was laid out with different settings
+            if os.fstat(self._fd).st_size != size or os.pread(self._fd, FILE_HEADER.size, 0) != header:
+                os.ftruncate(self._fd, 0)
+                os.ftruncate(self._fd, size)
+                os.pwrite(self._fd, header, 0)
+        self._map = mmap.mmap(self._fd, size)
+        self.evictions = 0
+
+    @contextmanager
+    def _write_lock(self) -> Iterator[None]:
+        with self._thread_lock:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN)
+
+    def _window(self, digest: bytes) -> range:
+        first = int.from_bytes(digest[:8], 'little') % self.slot_count
+        return range(first, first + PROBE_SLOTS)
+
+    def _offset(self, slot: int) -> int:
+        return FILE_HEADER_SIZE + slot % self.slot_count * self.slot_size
+
+    def get(self, digest: bytes) -> Optional[bytes]:
+        now = time.time()
+        view = self._map
+        for slot in self._window(digest):
+            offset = self._offset(slot)
+            sequence, key, expires, kind, length, crc = SLOT_HEADER.unpack_from(view, offset)
+            if key != digest:
+                continue
+            if sequence & 1 or kind != SLOT_VALUE or expires <= now or length > self.max_value_bytes:
+                return None
+            start = offset + SLOT_HEADER.size
+            value = view[start:start + length]
+            if SEQUENCE.unpack_from(view, offset)[0] != sequence or zlib.crc32(value) != crc:
+                return None
+            return value
+        return None
+
+    def set(self, digest: bytes, value: bytes, ttl: float) -> None:
+        with self._write_lock():
+            now = time.time()
+            self._write(self._claim_slot(digest, now), digest, now + ttl, SLOT_VALUE, value)
+
+    def acquire(self, digest: bytes, lease: float) -> bool:
+        with self._write_lock():
+            now = time.time()
+            for slot in self._window(digest):
+                offset = self._offset(slot)
+                _, key, expires, kind, _, _ = SLOT_HEADER.unpack_from(self._map, offset)
+                if key == digest and kind != SLOT_EMPTY and expires > now:
+                    return False
+            self._write(self._claim_slot(digest, now), digest, now + lease, SLOT_BUILDING, b'')
+            return True
+
+    def release(self, digest: bytes) -> None:
+        with self._write_lock():
+            for slot in self._window(digest):
+                offset = self._offset(slot)
+                _, key, _, kind, _, _ = SLOT_HEADER.unpack_from(self._map, offset)
+                if key == digest and kind == SLOT_BUILDING:
+                    self._write(offset, EMPTY_DIGEST, 0.0, SLOT_EMPTY, b'')
+
+    def _claim_slot(self, digest: bytes, now: float) -> int:
+        """Offset of the slot to store digest in; the caller holds the write lock"""
+        free = None
+        oldest = None
+        oldest_expires = float('inf')
+        for slot in self._window(digest):
+            offset = self._offset(slot)
+            _, key, expires, kind, _, _ = SLOT_HEADER.unpack_from(self._map, offset)
+            if key == digest:
+                return offset
+            if kind == SLOT_EMPTY or expires <= now:
+                if free is None:
+                    free = offset
+            elif expires < oldest_expires:
+                oldest, oldest_expires = offset, expires
+        if free is not None:
+            return free
+        self.evictions += 1
+        return oldest
+
+    def _write(self, offset: int, digest: bytes, expires: float, kind: int, value: bytes) -> None:
+        view = self._map
+        sequence = SEQUENCE.unpack_from(view, offset)[0]
+        SEQUENCE.pack_into(view, offset, sequence + 1)
+        start = offset + SLOT_HEADER.size
+        view[start:start + len(value)] = value
+        SLOT_HEADER.pack_into(view, offset, sequence + 1, digest, expires, kind, len(value), zlib.crc32(value))
+        SEQUENCE.pack_into(view, offset, sequence + 2)
+
+    def describe(self) -> str:
+        return f'shared memory file {self.path} ({self.slot_count} slots of {self.slot_size} bytes)'
+
+
+class RedisCache:
+    """
+    Shared tier on a Redis-protocol server (Redis, Valkey, KeyDB, ...).
+
+    Each thread keeps its own connection, opened on first use in the
+    process that uses it, so connections are never shared across a fork.
+    Claims on a key are separate keys set with NX and a lease; size limits
+    and eviction are the server's maxmemory settings.
+    """
+
+    def __init__(self, url: str, timeout: float = 0.05, prefix: str = 'medblocai:analysis:'):
+        parts = urlsplit(url)
+        self.host = parts.hostname or '127.0.0.1'
+        self.port = parts.port or 6379
+        self.username = unquote(parts.username) if parts.username else None
+        self.password = unquote(parts.password) if parts.password else None
+        self.database = int(parts.path.strip('/') or 0)
+        self.timeout = timeout
+        self.prefix = prefix.encode('ascii')
+        self._local = threading.local()
+
+    def _connection(self) -> Tuple[socket.socket, Any]:
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None and connection[0] == os.getpid():
+            return connection[1], connection[2]
+
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        reader = sock.makefile('rb')
+        self._local.connection = (os.getpid(), sock, reader)
+        try:
+            if self.password is not None:
+                credentials = [self.username, self.password] if self.username else [self.password]
+                self._execute([b'AUTH', *credentials])
+            if self.database:
+                self._execute([b'SELECT', self.database])
+        except SharedCacheError:
+            self._disconnect()
+            raise
+        return sock, reader
+
+    def _disconnect(self) -> None:
+        connection = getattr(self._local, 'connection', None)
+        self._local.connection = None
+        if connection is not None:
+            connection[2].close()
+            connection[1].close()
+
+    def _execute(self, *commands: List[Any]) -> List[Any]:
+        """Send commands in one write and return their replies in order"""
+        try:
+            sock, reader = self._connection()
+            sock.sendall(b''.join(_encode_command(command) for command in commands))
+            replies = [_read_reply(reader) for _ in commands]
+        except (OSError, ValueError) as e:
+            self._disconnect()
+            raise SharedCacheError(f'{self.describe()}: {e}') from e
+        for reply in replies:
+            if isinstance(reply, SharedCacheError):
+                raise reply
+        return replies
+
+    def get(self, digest: bytes) -> Optional[bytes]:
+        return self._execute([b'GET', self.prefix + digest.hex().encode('ascii')])[0]
+
+    def set(self, digest: bytes, value: bytes, ttl: float) -> None:
+        key = self.prefix + digest.hex().encode('ascii')
+        self._execute([b'SET', key, value, b'PX', int(ttl * 1000)], [b'DEL', key + b':lock'])
+
+    def acquire(self, digest: bytes, lease: float) -> bool:
+        key = self.prefix + digest.hex().encode('ascii') + b':lock'
+        return self._execute([b'SET', key, b'1', b'NX', b'PX', max(int(lease * 1000), 1)])[0] is not None
+
+    def release(self, digest: bytes) -> None:
+        self._execute([b'DEL', self.prefix + digest.hex().encode('ascii') + b':lock'])
+
+    def describe(self) -> str:
+        return f'redis://{self.host}:{self.port}/{self.database}'
+
+
+def _encode_command(arguments: List[Any]) -> bytes:
+    parts = [b'*%d\r\n' % len(arguments)]
+    for argument in arguments:
+        if isinstance(argument, int):
+            argument = str(argument).encode('ascii')
+        elif isinstance(argument, str):
+            argument = argument.encode('utf-8')
+        parts.append(b'$%d\r\n%s\r\n' % (len(argument), argument))
+    return b''.join(parts)
+
+
+def _read_reply(reader) -> Any:
+    """Read one RESP reply; server errors are returned, not raised, so pipelines stay in step"""
+    line = reader.readline()
+    if not line.endswith(b'\r\n'):
+        raise ValueError('connection closed')
+    kind, payload = line[:1], line[1:-2]
+    if kind == b'+':
+        return payload.decode('utf-8')
+    if kind == b'-':
+        return SharedCacheError(payload.decode('utf-8', 'replace'))
+    if kind == b':':
+        return int(payload)
+    if kind == b'$':
+        length = int(payload)
+        if length < 0:
+            return None
+        data = reader.read(length + 2)
+        if len(data) != length + 2:
+            raise ValueError('connection closed')
+        return data[:-2]
+    if kind == b'*':
+        length = int(payload)
+        return None if length < 0 else [_read_reply(reader) for _ in range(length)]
+    raise ValueError(f'unexpected reply {line[:40]!r}')
+
+
+def open_backend(url: str, max_bytes: int = 64 * 1024 ** 2, max_value_bytes: int = 16384, timeout: float = 0.05):
+    """
+    Open the shared cache backend a URL names
+
+    Args:
+        url: shm:///path/to/file for a shared memory table, or redis://[user:password@]host:port/db
+        max_bytes: Size of a shared memory table
+        max_value_bytes: Largest value a shared memory slot holds
+        timeout: Socket timeout for a Redis server, in seconds
+
+    Raises:
+        ValueError: If the URL scheme is not supported
+        OSError: If the shared memory file cannot be created
+    """
+    scheme = urlsplit(url).scheme
+    if scheme == 'shm':
+        return SharedMemoryCache(unquote(urlsplit(url).path), max_bytes=max_bytes, max_value_bytes=max_value_bytes)
+    if scheme in ('redis', 'tcp'):
+        return RedisCache(url, timeout=timeout)
+    raise ValueError(f"Unsupported shared cache URL scheme: '{scheme}'")
+
+
+class SharedTier:
+    """
+    Shared cache tier in front of local computation.
+
+    On a miss, the first worker to claim the key builds and stores the
+    value while the others poll for it for up to stampede_wait seconds, then
+    build it themselves. Any backend error switches the tier off for
+    retry_interval seconds; meanwhile every lookup builds locally at once.
+    """
+
+    def __init__(self, backend, ttl: float = 300.0, max_value_bytes: int = 16384, lock_timeout: float = 1.0,
+                 stampede_wait: float = 0.05, retry_interval: float = 5.0):
+        self.backend = backend
+        self.ttl = ttl
+        self.max_value_bytes = min(max_value_bytes, getattr(backend, 'max_value_bytes', max_value_bytes))
+        self.lock_timeout = lock_timeout
+        self.stampede_wait = stampede_wait
+        self.retry_interval = retry_interval
+        self._retry_at = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.waits = 0
+        self.stores = 0
+        self.oversized = 0
+        self.errors = 0
+        self.bypasses = 0
+
+    @property
+    def available(self) -> bool:
+        return time.monotonic() >= self._retry_at
+
+    def get_or_build(self, key: Hashable, build: Callable[[], bytes]) -> bytes:
+        """Return the shared value for key, building it locally when the tier misses or fails"""
+        if not self.available:
+            self.bypasses += 1
+            return build()
+
+        digest = hashlib.blake2b(repr(key).encode('utf-8'), digest_size=16).digest()
+        try:
+            value = self.backend.get(digest)
+            if value is not None:
+                self.hits += 1
+                return value
+            self.misses += 1
+            claimed = self.backend.acquire(digest, self.lock_timeout)
+            if not claimed:
+                value = self._wait(digest)
+                if value is not None:
+                    self.waits += 1
+                    return value
+        except SharedCacheError as e:
+            self._fail(e)
+            return build()
+
+        try:
+            value = build()
+        except Exception:
+            if claimed:
+                self._release(digest)
+            raise
+        if claimed:
+            self._store(digest, value)
+        return value
+
+    def _wait(self, digest: bytes) -> Optional[bytes]:
+        """Poll for a value another worker is building, backing off from 1 ms"""
+        deadline = time.monotonic() + self.stampede_wait
+        delay = 0.001
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            time.sleep(min(delay, remaining))
+            delay *= 2
+            value = self.backend.get(digest)
+            if value is not None:
+                return value
+
+    def _store(self, digest: bytes, value: bytes) -> None:
+        if len(value) > self.max_value_bytes:
+            self.oversized += 1
+            self._release(digest)
+            return
+        try:
+            self.backend.set(digest, value, self.ttl)
+            self.stores += 1
+        except SharedCacheError as e:
+            self._fail(e)
+
+    def _release(self, digest: bytes) -> None:
+        try:
+            self.backend.release(digest)
+        except SharedCacheError as e:
+            self._fail(e)
+
+    def _fail(self, error: SharedCacheError) -> None:
+        self.errors += 1
+        if self.available:
+            logger.warning(f"Shared cache unavailable, computing locally for {self.retry_interval:g}s: {error}")
+        self._retry_at = time.monotonic() + self.retry_interval
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'available': int(self.available),
+            'hits': self.hits,
+            'misses': self.misses,
+            'waits': self.waits,
+            'stores': self.stores,
+            'oversized': self.oversized,
+            'errors': self.errors,
+            'bypasses': self.bypasses
+        }
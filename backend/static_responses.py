@@ -0,0 +1,81 @@
+"""
+Static Responses Module
+Pre-serialized, pre-compressed bodies for endpoints that only change on reload
+"""
+
+from typing import Any, Dict, Mapping, NamedTuple
+import gzip
+import hashlib
+
+from analysis_cache import serialize_response
+from knowledge_base import KnowledgeBase
+
+
+# Bodies smaller than this are not worth compressing
+MIN_GZIP_SIZE = 512
+
+
+class StaticResponse(NamedTuple):
+    """Ready-to-send JSON body with its gzip variant and strong ETags"""
+    body: bytes
+    etag: str
+    gzip_body: bytes
+    gzip_etag: str
+
+    @classmethod
+    def from_payload(cls, payload: Mapping[str, Any]) -> 'StaticResponse':
+        body = serialize_response(payload)
+        digest = hashlib.sha256(body).hexdigest()[:32]
+
+        # mtime=0 keeps the compressed bytes, and so the ETag, deterministic
+        gzip_body = gzip.compress(body, compresslevel=9, mtime=0) if len(body) >= MIN_GZIP_SIZE else b''
+
+        return cls(
+            body=body,
+            etag=digest,
+            gzip_body=gzip_body,
+            gzip_etag=f'{digest}-gzip'
+        )
+
+
+class StaticResponses(NamedTuple):
+    """All precomputed responses for one knowledge base version"""
+    version: str
+    home: StaticResponse
+    symptoms: StaticResponse
+    tips: Mapping[str, StaticResponse]
+
+
+def build_static_responses(
+    knowledge_base: KnowledgeBase,
+    home_payload: Mapping[str, Any],
+    tips_payloads: Dict[str, Mapping[str, Any]]
+) -> StaticResponses:
+    """
+    Serialize and compress the static endpoint bodies
+
+    Args:
+        knowledge_base: Snapshot the symptom list is taken from
+        home_payload: Body of the API home endpoint
+        tips_payloads: Tips response body for every known category
+
+    Returns:
+        StaticResponses for the snapshot's version
+    """
+    symptoms = list(knowledge_base.symptoms.keys())
+    symptoms_payload = {
+        'success': True,
+        'symptoms': symptoms,
+        'count': len(symptoms),
+        'categories': list(knowledge_base.category_index.keys())
+    }
+
+    return StaticResponses(
+        version=knowledge_base.version,
+        home=StaticResponse.from_payload(home_payload),
+        symptoms=StaticResponse.from_payload(symptoms_payload),
+        tips={
+            category: StaticResponse.from_payload(payload)
+            for category, payload in tips_payloads.items()
+        }
+    )
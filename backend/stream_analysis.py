@@ -0,0 +1,138 @@
+"""
+Stream Analysis Module
+Bounded-memory symptom matching over text bodies that arrive in chunks
+"""
+
+from typing import Dict, List, Tuple
+import codecs
+
+from knowledge_base import KnowledgeBase
+from symptom_matcher import SymptomMatcher, word_start
+
+
+# Text is scanned once at least this many characters are waiting
+SCAN_CHUNK_CHARS = 65536
+
+
+class StreamScanner:
+    """
+    SymptomMatcher.scan over text that arrives in pieces.
+
+    A match is at most max_match_length characters long and depends only on
+    its own characters and the ones on either side. Once the buffer holds
+    more than that beyond a position, every match starting before it is
+    final. Each scan therefore reports the matches that start before such a
+    cut, moved back to a word boundary, and carries only the text after the
+    cut into the next scan. Memory stays at about one chunk however long the
+    stream is.
+
+    Positions are offsets into the lowercased stream, as with scan().
+    """
+
+    def __init__(self, matcher: SymptomMatcher, chunk_chars: int = SCAN_CHUNK_CHARS):
+        self.matcher = matcher
+        self.chunk_chars = chunk_chars
+        self.reach = matcher.max_match_length
+        self.length = 0
+        self._pending: List[str] = []
+        self._pending_chars = 0
+        self._buffer = ''
+        self._offset = 0
+        # The buffer starts in the middle of a word that outgrew a scan
+        self._inside_word = False
+
+    def feed(self, text: str) -> List[Tuple[int, int, int]]:
+        """Add text; returns the (term_index, start, end) matches that became final"""
+        if not text:
+            return []
+        self._pending.append(text.lower())
+        self._pending_chars += len(text)
+        self.length += len(text)
+        if len(self._buffer) + self._pending_chars < self.chunk_chars + self.reach + 1:
+            return []
+        return self._scan(final=False)
+
+    def finish(self) -> List[Tuple[int, int, int]]:
+        """Matches in the rest of the stream"""
+        return self._scan(final=True)
+
+    def _scan(self, final: bool) -> List[Tuple[int, int, int]]:
+        buffer = self._buffer + ''.join(self._pending)
+        self._pending = []
+        self._pending_chars = 0
+
+        inside_word = False
+        if final:
+            cut = len(buffer)
+        else:
+            limit = len(buffer) - self.reach - 1
+            cut = word_start(buffer, limit)
+            if cut == 0:
+                # A word longer than any term cannot be part of a match; cut through it
+                cut, inside_word = limit, True
+
+        found = []
+        offset = self._offset
+        for term_index, start, end in self.matcher.scan(buffer):
+            if start >= cut:
+                break
+            if start == 0 and self._inside_word:
+                continue
+            found.append((term_index, start + offset, end + offset))
+
+        self._buffer = buffer[cut:]
+        self._offset += cut
+        self._inside_word = inside_word
+        return found
+
+
+class StreamAnalysis:
+    """
+    Symptom occurrences in a UTF-8 byte stream, with per-symptom counts and positions.
+
+    Counts cover every occurrence; at most max_positions (start, end)
+    positions are kept per symptom so memory does not grow with the input.
+    """
+
+    def __init__(self, knowledge_base: KnowledgeBase, max_positions: int = 1000,
+                 chunk_chars: int = SCAN_CHUNK_CHARS):
+        self.knowledge_base = knowledge_base
+        self.max_positions = max_positions
+        self.bytes_read = 0
+        self._scanner = StreamScanner(knowledge_base.matcher, chunk_chars)
+        self._decoder = codecs.getincrementaldecoder('utf-8')('replace')
+        self._counts: Dict[int, int] = {}
+        self._positions: Dict[int, List[List[int]]] = {}
+
+    @property
+    def characters(self) -> int:
+        return self._scanner.length
+
+    def feed(self, data: bytes) -> None:
+        self.bytes_read += len(data)
+        self._record(self._scanner.feed(self._decoder.decode(data)))
+
+    def finish(self) -> Tuple[Tuple[str, ...], Dict[str, Dict[str, object]]]:
+        """
+        End the stream
+
+        Returns:
+            (detected symptoms in database order, {symptom: {'count', 'positions'}})
+        """
+        self._record(self._scanner.feed(self._decoder.decode(b'', final=True)))
+        self._record(self._scanner.finish())
+
+        terms = self.knowledge_base.matcher.terms
+        detected = tuple(terms[term_index] for term_index in sorted(self._counts))
+        occurrences = {
+            terms[term_index]: {'count': self._counts[term_index], 'positions': self._positions[term_index]}
+            for term_index in sorted(self._counts)
+        }
+        return detected, occurrences
+
+    def _record(self, matches: List[Tuple[int, int, int]]) -> None:
+        for term_index, start, end in matches:
+            self._counts[term_index] = self._counts.get(term_index, 0) + 1
+            positions = self._positions.setdefault(term_index, [])
+            if len(positions) < self.max_positions:
+                positions.append([start, end])
@@ -0,0 +1,337 @@
+"""
+Symptom Matcher Module
+Single-pass whole-word phrase matching over the symptom vocabulary
+"""
+
+from functools import lru_cache
+from typing import Dict, FrozenSet, Iterable, Iterator, List, Mapping, NamedTuple, Optional, Sequence, Set, Tuple
+import re
+
+
+# Runs of word characters, using the same definition as the regex `\b`
+WORD_PATTERN = re.compile(r'\w+')
+
+# A single character that is part of a word, as WORD_PATTERN defines words
+WORD_CHAR = re.compile(r'\w')
+
+# Distinct words remembered by the typo corrector
+FUZZY_CACHE_SIZE = 65536
+
+
+class SymptomMatch(NamedTuple):
+    """A single vocabulary term found in the input text"""
+    symptom: str
+    start: int
+    end: int
+
+
+class _TrieNode:
+    """Node of the token trie; children are keyed on (separator, word) pairs"""
+
+    __slots__ = ('children', 'term_index')
+
+    def __init__(self):
+        self.children: Dict[Tuple[str, str], '_TrieNode'] = {}
+        self.term_index: Optional[int] = None
+
+
+class FuzzyWordIndex:
+    """
+    Typo-tolerant lookup of vocabulary words using a deletion index.
+
+    Every vocabulary word is indexed under all strings obtained by deleting
+    up to `max_edits` characters. A misspelt word shares at least one such
+    key with its correction, so a lookup probes about len(word) keys instead
+    of comparing against every vocabulary word. Candidates are then checked
+    with the restricted Damerau-Levenshtein distance.
+
+    Words found in `dictionary` are correctly spelt English and are never
+    corrected, so "tiered" does not become "tired". Only the dictionary words
+    that would otherwise be corrected are kept.
+    """
+
+    def __init__(self, words: Iterable[str], max_edits: int = 1, min_length: int = 6,
+                 exclusions: Iterable[str] = (), dictionary: Iterable[str] = ()):
+        self.max_edits = max_edits
+        self.min_length = min_length
+        self.words: Tuple[str, ...] = tuple(dict.fromkeys(words))
+        self.exclusions: Set[str] = set(exclusions)
+        # Longer words are more than max_edits away from every vocabulary word
+        self.max_length = max((len(word) for word in self.words), default=0) + max_edits
+        deletes: Dict[str, List[int]] = {}
+
+        for word_index, word in enumerate(self.words):
+            # Shorter words are never corrected to, so they need no keys
+            if len(word) + max_edits < min_length:
+                continue
+            for key in _deletions(word, max_edits):
+                deletes.setdefault(key, []).append(word_index)
+
+        # Tuples are smaller than lists and never change, which suits fork-shared memory
+        self._deletes: Dict[str, Tuple[int, ...]] = {key: tuple(indexes) for key, indexes in deletes.items()}
+
+        vocabulary = set(self.words)
+        self.dictionary: FrozenSet[str] = frozenset(
+            word for word in dictionary
+            if self.min_length <= len(word) <= self.max_length and word not in vocabulary
+            and self._closest(word) is not None
+        )
+
+        self.correct = lru_cache(maxsize=FUZZY_CACHE_SIZE)(self._correct)
+
+    def _correct(self, word: str) -> Optional[str]:
+        """Return the closest vocabulary word within max_edits, or None"""
+        if not self.min_length <= len(word) <= self.max_length:
+            return None
+        if word in self.exclusions or word in self.dictionary:
+            return None
+        return self._closest(word)
+
+    def _closest(self, word: str) -> Optional[str]:
+        """Search the deletion index for the nearest vocabulary word"""
+        candidates: Set[int] = set()
+        for key in _deletions(word, self.max_edits):
+            candidates.update(self._deletes.get(key, ()))
+
+        best = None
+        best_distance = self.max_edits + 1
+        for word_index in sorted(candidates):
+            candidate = self.words[word_index]
+            # Typos rarely change the first letter; requiring it avoids most false friends
+            if candidate[0] != word[0]:
+                continue
+            distance = _edit_distance(word, candidate, best_distance)
+            if distance < best_distance:
+                best, best_distance = candidate, distance
+
+        return best
+
+
+class SymptomMatcher:
+    """
+    Whole-word matcher built once for a fixed vocabulary.
+
+    Terms are split into word tokens and the separators between them, and
+    stored in a token trie. Scanning tokenises the input once and walks the
+    trie from every word, so the cost depends on the text length and the
+    longest term rather than on the vocabulary size. A term matches exactly
+    when the regex `\\b<term>\\b` would match it, overlapping and nested terms
+    included.
+
+    Synonym phrases are inserted into the same trie and resolve to their
+    canonical term. With `fuzzy_max_edits` set, words that do not continue
+    a trie path are also looked up in a FuzzyWordIndex of vocabulary words.
+    Words in `fuzzy_protected` are never the target of a correction, which
+    keeps a typo from raising a high-severity symptom on its own.
+    """
+
+    def __init__(self, terms: Iterable[str], synonyms: Optional[Mapping[str, Iterable[str]]] = None,
+                 fuzzy_max_edits: int = 0, fuzzy_min_length: int = 6, fuzzy_exclusions: Iterable[str] = (),
+                 fuzzy_protected: Iterable[str] = (), fuzzy_dictionary: Iterable[str] = ()):
+        self.terms: Tuple[str, ...] = tuple(term.lower() for term in terms)
+        self._index: Dict[str, int] = {}
+        self._phrase_index: Dict[str, int] = {}
+        self._root: Dict[str, _TrieNode] = {}
+
+        for term_index, term in enumerate(self.terms):
+            if term in self._index:
+                raise ValueError(f"Duplicate symptom term: '{term}'")
+            self._index[term] = term_index
+            self._add_phrase(term, term_index)
+
+        for term, phrases in (synonyms or {}).items():
+            term_index = self._index[term.lower()]
+            for phrase in phrases:
+                self._add_phrase(phrase.lower(), term_index)
+
+        self.vocabulary_words: Set[str] = {
+            word for phrase in self._phrase_index for word in WORD_PATTERN.findall(phrase)
+        }
+
+        self.fuzzy: Optional[FuzzyWordIndex] = None
+        if fuzzy_max_edits > 0:
+            self.fuzzy = FuzzyWordIndex(
+                sorted(self.vocabulary_words.difference(fuzzy_protected)),
+                max_edits=fuzzy_max_edits,
+                min_length=fuzzy_min_length,
+                exclusions=fuzzy_exclusions,
+                dictionary=fuzzy_dictionary
+            )
+
+        # Upper bound on the length of any match; a typo may add a character per word
+        self.max_match_length = max(
+            (len(phrase) + len(WORD_PATTERN.findall(phrase)) * fuzzy_max_edits for phrase in self._phrase_index),
+            default=0
+        )
+
+    def _add_phrase(self, phrase: str, term_index: int) -> None:
+        """Register a term or synonym phrase for a canonical term"""
+        existing = self._phrase_index.get(phrase)
+        if existing is not None:
+            if existing != term_index:
+                raise ValueError(
+                    f"Phrase '{phrase}' maps to both '{self.terms[existing]}' and '{self.terms[term_index]}'"
+                )
+            return
+
+        self._phrase_index[phrase] = term_index
+        self._insert(phrase, term_index)
+
+    def _insert(self, term: str, term_index: int) -> None:
+        """Add a term to the token trie"""
+        spans = [match.span() for match in WORD_PATTERN.finditer(term)]
+
+        # Whole-word semantics need a word character at both ends of the term
+        if not spans or spans[0][0] != 0 or spans[-1][1] != len(term):
+            raise ValueError(f"Symptom term must start and end with a word character: '{term}'")
+
+        first_start, first_end = spans[0]
+        node = self._root.setdefault(term[first_start:first_end], _TrieNode())
+
+        for (_, prev_end), (start, end) in zip(spans, spans[1:]):
+            key = (term[prev_end:start], term[start:end])
+            node = node.children.setdefault(key, _TrieNode())
+
+        node.term_index = term_index
+
+    @property
+    def first_words(self) -> Tuple[str, ...]:
+        """Words that can begin a term"""
+        return tuple(self._root.keys())
+
+    @property
+    def phrases(self) -> Mapping[str, int]:
+        """Every matchable phrase, terms and synonyms, mapped to its term index"""
+        return self._phrase_index
+
+    def walk(self, words: Sequence[str], separators: Sequence[str], i: int) -> Iterator[Tuple[int, int]]:
+        """
+        Yield (term_index, last_word) for every term starting at words[i].
+
+        `separators[k]` must hold the exact text between words[k] and
+        words[k + 1], all lowercased, as produced by splitting on `(\\W+)`.
+        Only exact and synonym matches are reported.
+        """
+        node = self._root.get(words[i])
+        j = i
+        word_count = len(words)
+
+        while node is not None:
+            if node.term_index is not None:
+                yield node.term_index, j
+
+            j += 1
+            if j == word_count or not node.children:
+                return
+
+            node = node.children.get((separators[j - 1], words[j]))
+
+    def index_of(self, term: str) -> int:
+        """Return the vocabulary position of a term"""
+        return self._index[term]
+
+    def _correct(self, word: str) -> Optional[str]:
+        """Typo correction for a word outside the vocabulary, if fuzzy matching is on"""
+        if self.fuzzy is None or word in self.vocabulary_words:
+            return None
+        return self.fuzzy.correct(word)
+
+    def scan(self, text: str) -> List[Tuple[int, int, int]]:
+        """
+        Scan text once and return raw (term_index, start, end) triples.
+
+        Positions are offsets into the lowercased text, ordered by start.
+        """
+        if not text:
+            return []
+
+        text_lower = text.lower()
+        spans = [match.span() for match in WORD_PATTERN.finditer(text_lower)]
+        token_count = len(spans)
+        root = self._root
+        correct = self._correct if self.fuzzy is not None else None
+        found = []
+
+        for i, (start, end) in enumerate(spans):
+            word = text_lower[start:end]
+            node = root.get(word)
+            if node is None and correct is not None:
+                node = root.get(correct(word))
+            j = i
+
+            while node is not None:
+                if node.term_index is not None:
+                    found.append((node.term_index, start, spans[j][1]))
+
+                j += 1
+                if j == token_count or not node.children:
+                    break
+
+                prev_end = spans[j - 1][1]
+                next_start, next_end = spans[j]
+                separator = text_lower[prev_end:next_start]
+                word = text_lower[next_start:next_end]
+
+                child = node.children.get((separator, word))
+                if child is None and correct is not None:
+                    corrected = correct(word)
+                    if corrected is not None:
+                        child = node.children.get((separator, corrected))
+                node = child
+
+        return found
+
+    def find_matches(self, text: str) -> List[SymptomMatch]:
+        """Return every term occurrence in text, in order of position"""
+        terms = self.terms
+        return [SymptomMatch(terms[index], start, end) for index, start, end in self.scan(text)]
+
+    def extract(self, text: str) -> List[str]:
+        """Return the distinct terms present in text, in vocabulary order"""
+        terms = self.terms
+        return [terms[index] for index in sorted({index for index, _, _ in self.scan(text)})]
+
+
+def word_start(text: str, position: int) -> int:
+    """Move position back to the start of the word it falls in"""
+    while position > 0 and WORD_CHAR.match(text, position - 1):
+        position -= 1
+    return position
+
+
+def word_end(text: str, position: int) -> int:
+    """Move position forward to the end of the word it falls in"""
+    while position < len(text) and WORD_CHAR.match(text, position):
+        position += 1
+    return position
+
+
+def _deletions(word: str, max_edits: int) -> Set[str]:
+    """All strings obtained by deleting up to max_edits characters from word"""
+    results = {word}
+    frontier = {word}
+    for _ in range(max_edits):
+        frontier = {w[:i] + w[i + 1:] for w in frontier for i in range(len(w))}
+        results |= frontier
+    return results
+
+
+def _edit_distance(a: str, b: str, limit: int) -> int:
+    """Restricted Damerau-Levenshtein distance, or limit once it is reached"""
+    if abs(len(a) - len(b)) >= limit:
+        return limit
+
+    previous_previous = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous_previous[j - 2] + 1)
+        if min(current) >= limit:
+            return limit
+        previous_previous, previous = previous, current
+
+    return min(previous[len(b)], limit)
@@ -0,0 +1,55 @@
+"""
+Test configuration
+Makes the backend modules importable and shares the default knowledge base
+"""
+
+from http.server import ThreadingHTTPServer
+import json
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from knowledge_base import DEFAULT_KNOWLEDGE_BASE_PATH, load_knowledge_base  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def knowledge_base():
+    return load_knowledge_base()
+
+
+@pytest.fixture(scope='session')
+def fuzzy_data_file(tmp_path_factory):
+    """Copy of the default knowledge base with typo tolerance turned on"""
+    with open(DEFAULT_KNOWLEDGE_BASE_PATH, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    data['matching']['fuzzy_max_edits'] = 1
+    path = tmp_path_factory.mktemp('fuzzy') / 'knowledge_base.json'
+    path.write_text(json.dumps(data), encoding='utf-8')
+    return str(path)
+
+
+@pytest.fixture(scope='session')
+def fuzzy_knowledge_base(fuzzy_data_file):
+    return load_knowledge_base(fuzzy_data_file)
+
+
+@pytest.fixture
+def stub_server():
+    """Start a local HTTP server for a BaseHTTPRequestHandler subclass and return its base URL"""
+    servers = []
+
+    def start(handler_class):
+        server = ThreadingHTTPServer(('127.0.0.1', 0), handler_class)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True).start()
+        servers.append(server)
+        return f'http://127.0.0.1:{server.server_port}'
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
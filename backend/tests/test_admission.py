@@ -0,0 +1,139 @@
+"""
+Admission control tests
+Concurrency slots, queueing and shedding, rate limits, and the routes that skip them
+"""
+
+import threading
+import time
+
+import pytest
+
+import app as app_module
+from admission import AdmissionController, Rejected, TokenBucketLimiter
+
+
+def acquire_in_thread(controller: AdmissionController, high_priority: bool = False, timeout: float = 5.0):
+    """Start a queued acquire; returns the thread and a list receiving 'admitted' or the rejection reason"""
+    outcome = []
+
+    def run():
+        try:
+            controller.acquire(high_priority=high_priority, timeout=timeout)
+            outcome.append('admitted')
+        except Rejected as e:
+            outcome.append(e.reason)
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread, outcome
+
+
+def wait_for_queue(controller: AdmissionController, length: int) -> None:
+    deadline = time.monotonic() + 5
+    while controller.stats()['queued'] != length:
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+
+
+def test_queued_request_gets_released_slot():
+    controller = AdmissionController(max_concurrent=1)
+    controller.acquire()
+    thread, outcome = acquire_in_thread(controller)
+    wait_for_queue(controller, 1)
+
+    controller.release()
+    thread.join()
+    assert outcome == ['admitted']
+    assert controller.stats()['active'] == 1 and controller.stats()['queued_total'] == 1
+
+
+def test_full_queue_sheds_requests():
+    controller = AdmissionController(max_concurrent=1, max_queue=0, retry_after=3)
+    controller.acquire()
+    with pytest.raises(Rejected) as rejected:
+        controller.acquire()
+    assert (rejected.value.status, rejected.value.reason, rejected.value.retry_after) == (503, 'queue_full', 3)
+
+
+def test_queue_timeout_sheds_requests():
+    controller = AdmissionController(max_concurrent=1, queue_timeout=0.01)
+    controller.acquire()
+    with pytest.raises(Rejected) as rejected:
+        controller.acquire()
+    assert rejected.value.reason == 'deadline'
+    assert controller.stats()['queued'] == 0
+
+
+def test_high_priority_requests_go_first():
+    controller = AdmissionController(max_concurrent=1)
+    controller.acquire()
+    normal, normal_outcome = acquire_in_thread(controller)
+    wait_for_queue(controller, 1)
+    urgent, urgent_outcome = acquire_in_thread(controller, high_priority=True)
+    wait_for_queue(controller, 2)
+
+    controller.release()
+    urgent.join()
+    assert urgent_outcome == ['admitted'] and normal_outcome == []
+
+    controller.release()
+    normal.join()
+    assert normal_outcome == ['admitted']
+
+
+def test_high_priority_request_displaces_newest_normal_one():
+    controller = AdmissionController(max_concurrent=1, max_queue=1)
+    controller.acquire()
+    normal, normal_outcome = acquire_in_thread(controller)
+    wait_for_queue(controller, 1)
+    urgent, urgent_outcome = acquire_in_thread(controller, high_priority=True)
+
+    normal.join()
+    assert normal_outcome == ['displaced']
+    controller.release()
+    urgent.join()
+    assert urgent_outcome == ['admitted']
+    assert controller.stats()['shed']['displaced'] == 1
+
+
+def test_token_bucket_allows_burst_then_limits():
+    limiter = TokenBucketLimiter(rate=1.0, burst=2)
+    assert limiter.acquire('a') == 0.0
+    assert limiter.acquire('a') == 0.0
+    assert 0.0 < limiter.acquire('a') <= 1.0
+    # Other clients have their own bucket
+    assert limiter.acquire('b') == 0.0
+    assert limiter.stats() == {'clients': 2, 'limited': 1}
+
+
+@pytest.fixture
+def busy_client(monkeypatch):
+    """Test client for an app whose only slot is taken and whose queue is empty"""
+    controller = AdmissionController(max_concurrent=1, max_queue=0, retry_after=2)
+    controller.acquire()
+    monkeypatch.setattr(app_module, 'admission_controller', controller)
+    return app_module.app.test_client()
+
+
+@pytest.mark.parametrize('path', ['/api/health', '/api/admin/profiles', '/api/admin/profiles/abc'])
+def test_exempt_routes_skip_admission(busy_client, path):
+    assert busy_client.get(path).status_code != 503
+
+
+@pytest.mark.parametrize('path', ['/api/tips', '/api/healthz', '/api/health/extra', '/api/admin/profilesx'])
+def test_other_routes_are_shed(busy_client, path):
+    response = busy_client.get(path)
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '2'
+
+
+def test_rate_limit_answers_429(monkeypatch):
+    monkeypatch.setattr(app_module, 'rate_limiter', TokenBucketLimiter(rate=0.5, burst=1))
+    client = app_module.app.test_client()
+    assert client.get('/api/tips').status_code == 200
+
+    response = client.get('/api/tips')
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == '2'
+    # Exempt routes are not rate limited either
+    assert client.get('/api/health').status_code == 200
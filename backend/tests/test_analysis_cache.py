@@ -0,0 +1,98 @@
+"""
+Analysis cache tests
+Checks that cached analyses never outlive the knowledge base they were built from
+"""
+
+import json
+import os
+import shutil
+
+import pytest
+
+from ai_model import HealthAnalyzer
+from knowledge_base import DEFAULT_KNOWLEDGE_BASE_PATH
+
+
+@pytest.fixture
+def data_file(tmp_path):
+    path = str(tmp_path / 'knowledge_base.json')
+    shutil.copyfile(DEFAULT_KNOWLEDGE_BASE_PATH, path)
+    return path
+
+
+def set_cough_severity(path: str, severity: str) -> None:
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    data['symptoms']['cough']['severity'] = severity
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    # Make sure the change is visible even on filesystems with coarse mtimes
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+
+def cough_severity(analyzer: HealthAnalyzer) -> str:
+    return analyzer.analyze_symptoms('I have a cough')['detected_symptoms'][0]['severity']
+
+
+def test_repeated_analysis_is_cached(data_file):
+    analyzer = HealthAnalyzer(data_file)
+    first = analyzer.analyze_symptoms_json('I have a cough')
+    assert analyzer.analyze_symptoms_json('my cough is back') is first
+    assert analyzer.cache.stats()['hits'] == 1
+
+
+@pytest.mark.parametrize('reload', ['reload', 'reload_if_modified'])
+def test_reload_invalidates_cached_analyses(data_file, reload):
+    analyzer = HealthAnalyzer(data_file)
+    assert cough_severity(analyzer) == 'mild'
+    old_version = analyzer.knowledge_base.version
+
+    set_cough_severity(data_file, 'high')
+    assert getattr(analyzer, reload)()
+
+    assert analyzer.knowledge_base.version != old_version
+    assert analyzer.cache.stats()['size'] == 0
+    assert cough_severity(analyzer) == 'high'
+
+
+def test_unchanged_reload_keeps_cache(data_file):
+    analyzer = HealthAnalyzer(data_file)
+    cough_severity(analyzer)
+
+    assert not analyzer.reload()
+    assert not analyzer.reload_if_modified()
+    assert analyzer.cache.stats()['size'] == 1
+
+
+def test_analysis_in_flight_keeps_its_snapshot(data_file):
+    analyzer = HealthAnalyzer(data_file)
+    snapshot = analyzer.knowledge_base
+    detected = tuple(snapshot.matcher.extract('I have a cough'))
+
+    set_cough_severity(data_file, 'high')
+    analyzer.reload()
+
+    # A request that extracted against the old snapshot is answered from it, not from the new entries
+    assert analyzer.analyze_detected(snapshot, detected)['detected_symptoms'][0]['severity'] == 'mild'
+    assert cough_severity(analyzer) == 'high'
+
+
+def test_returned_results_do_not_share_cached_state(data_file):
+    analyzer = HealthAnalyzer(data_file)
+    result = analyzer.analyze_symptoms('I have a cough')
+    result['detected_symptoms'][0]['severity'] = 'changed'
+    result['analysis']['recommendations'].clear()
+
+    again = analyzer.analyze_symptoms('I have a cough')
+    assert again['detected_symptoms'][0]['severity'] == 'mild'
+    assert again['analysis']['recommendations']
+    assert analyzer.cache.stats()['hits'] == 1
+
+
+def test_disabled_cache_counts_misses(data_file):
+    analyzer = HealthAnalyzer(data_file, cache_size=0)
+    for _ in range(3):
+        analyzer.analyze_symptoms_json('I have a cough')
+    assert analyzer.cache.stats()['misses'] == 3
+    assert analyzer.cache.stats()['size'] == 0
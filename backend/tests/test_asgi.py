@@ -0,0 +1,94 @@
+"""
+ASGI entry point tests
+Rate limits, admission and CORS headers on the paths served without Flask
+"""
+
+import asyncio
+import json
+
+import pytest
+
+import app as app_module
+import asgi
+from admission import AdmissionController, TokenBucketLimiter
+
+
+def call(method: str, path: str, body: bytes = b'', headers=()):
+    """Run one request through the ASGI app; returns (status, headers, body)"""
+    scope = {
+        'type': 'http', 'method': method, 'path': path, 'query_string': b'', 'root_path': '',
+        'http_version': '1.1', 'scheme': 'http', 'client': ('10.0.0.1', 1234), 'server': ('test', 80),
+        'headers': [(name.lower().encode(), value.encode()) for name, value in headers]
+    }
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': body, 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(asgi.application(scope, receive, send))
+    start = messages[0]
+    return (start['status'], {name.decode(): value.decode() for name, value in start['headers']},
+            b''.join(message.get('body', b'') for message in messages[1:]))
+
+
+def analyze(headers=()):
+    return call('POST', '/api/analyze', json.dumps({'symptoms': 'fever'}).encode(),
+                [('Content-Type', 'application/json'), *headers])
+
+
+@pytest.fixture
+def limiter(monkeypatch):
+    limiter = TokenBucketLimiter(rate=0.001, burst=2)
+    monkeypatch.setattr(app_module, 'rate_limiter', limiter)
+    return limiter
+
+
+@pytest.fixture
+def busy(monkeypatch):
+    """Admission controller whose only slot is taken and whose queue is empty"""
+    controller = AdmissionController(max_concurrent=1, max_queue=0)
+    controller.acquire()
+    monkeypatch.setattr(app_module, 'admission_controller', controller)
+    return controller
+
+
+def test_fast_path_rate_limits_before_admission(limiter, monkeypatch):
+    controller = AdmissionController(max_concurrent=1)
+    monkeypatch.setattr(app_module, 'admission_controller', controller)
+    assert analyze()[0] == 200
+    assert analyze()[0] == 200
+
+    # Out of tokens: refused without taking a slot
+    status, headers, _ = analyze()
+    assert status == 429 and 'retry-after' in headers
+    assert controller.stats()['admitted'] == 2
+
+
+def test_fallback_to_flask_charges_rate_limit_once(limiter, busy):
+    # Both requests fall back to Flask for admission; each used a single token
+    assert analyze()[0] == 503
+    assert analyze()[0] == 503
+    assert limiter.stats()['limited'] == 0
+    assert analyze()[0] == 429
+
+
+def test_live_events_charge_rate_limit_once(limiter):
+    session = app_module.live_sessions.create(app_module.analyzer.knowledge_base)
+    path = f'/api/analyze/live/{session.session_id}/events'
+    limiter.acquire('10.0.0.1')
+    limiter.acquire('10.0.0.1')
+
+    status, headers, _ = call('GET', path)
+    assert status == 429 and 'retry-after' in headers
+    assert limiter.stats()['limited'] == 1
+
+
+@pytest.mark.parametrize('origin, allowed', [('http://localhost:5173', True), ('http://elsewhere', False)])
+def test_cors_headers_vary_on_origin(origin, allowed):
+    status, headers, _ = analyze([('Origin', origin)])
+    assert status == 200
+    assert headers['vary'] == 'Origin'
+    assert ('access-control-allow-origin' in headers) == allowed
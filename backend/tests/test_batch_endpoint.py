@@ -0,0 +1,73 @@
+"""
+Batch endpoint tests
+JSON and NDJSON input, echoed ids, size limits and malformed lines
+"""
+
+import json
+
+import pytest
+
+import app as app_module
+
+
+@pytest.fixture
+def client():
+    return app_module.app.test_client()
+
+
+def result_lines(response):
+    assert response.status_code == 200
+    assert response.mimetype == app_module.NDJSON_MIMETYPE
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+
+def test_json_inputs_stream_one_line_each(client):
+    inputs = ['I have a headache', {'id': 'a1', 'symptoms': '  fever and cough '}, {'id': 7, 'symptoms': ''}, 42]
+    lines = result_lines(client.post('/api/analyze/batch', json={'inputs': inputs}))
+
+    assert [line['index'] for line in lines] == [0, 1, 2, 3]
+    assert [line.get('id') for line in lines] == [None, 'a1', 7, None]
+    assert [line['success'] for line in lines] == [True, True, False, False]
+
+    # Each line carries the same result as a single analysis of the stripped text
+    expected = app_module.analyzer.analyze_symptoms('fever and cough')
+    assert {key: value for key, value in lines[1].items() if key not in ('index', 'id')} == expected
+
+
+def test_bare_json_array_is_accepted(client):
+    lines = result_lines(client.post('/api/analyze/batch', json=['chest pain']))
+    assert lines[0]['index'] == 0 and lines[0]['success']
+
+
+def test_ndjson_skips_blank_lines(client):
+    body = '"I have a headache"\n\n{"id": "b", "symptoms": "sore throat"}\n'
+    lines = result_lines(client.post('/api/analyze/batch', data=body, content_type=app_module.NDJSON_MIMETYPE))
+    assert [(line['index'], line.get('id'), line['success']) for line in lines] == [(0, None, True), (1, 'b', True)]
+
+
+def test_malformed_ndjson_line_ends_the_stream(client):
+    body = '"I have a headache"\n\n{"symptoms": \n"cough"\n'
+    lines = result_lines(client.post('/api/analyze/batch', data=body, content_type=app_module.NDJSON_MIMETYPE))
+
+    assert len(lines) == 2
+    assert lines[1]['index'] == 1 and not lines[1]['success']
+    assert lines[1]['error'].startswith('Invalid batch input: line 3:')
+
+
+@pytest.mark.parametrize('kwargs', [
+    {'json': {'inputs': 'headache'}},
+    {'json': 'headache'},
+    {'data': 'headache', 'content_type': 'text/plain'},
+])
+def test_non_list_bodies_are_rejected(client, kwargs):
+    response = client.post('/api/analyze/batch', **kwargs)
+    assert response.status_code == 400
+    assert not response.get_json()['success']
+
+
+def test_batch_size_limit(client, monkeypatch):
+    monkeypatch.setattr(app_module, 'MAX_BATCH_SIZE', 2)
+    lines = result_lines(client.post('/api/analyze/batch', json=['cough', 'fever', 'headache', 'nausea']))
+
+    assert [line['index'] for line in lines] == [0, 1, 2]
+    assert lines[2] == {'index': 2, 'success': False, 'error': 'Batch size limit of 2 inputs exceeded.'}
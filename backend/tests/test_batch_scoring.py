@@ -0,0 +1,52 @@
+"""
+Batch scoring tests
+Checks that vectorized scoring detects the same symptoms as extract_symptoms
+"""
+
+import random
+
+import pytest
+
+from ai_model import HealthAnalyzer
+
+
+FILLER = ('i', 'have', 'had', 'a', 'bad', 'day', 'and', 'my', 'since', 'yesterday', 'really')
+
+
+@pytest.fixture(scope='module')
+def analyzer(fuzzy_data_file):
+    return HealthAnalyzer(fuzzy_data_file)
+
+
+def misspell(word: str, rng: random.Random) -> str:
+    if len(word) < 4 or rng.random() < 0.5:
+        return word
+    i = rng.randrange(len(word))
+    return rng.choice((word[:i] + word[i + 1:], word[:i] + 'x' + word[i:], word[:i] + 'x' + word[i + 1:]))
+
+
+def make_texts(analyzer: HealthAnalyzer, ascii_only: bool, seed: int, count: int = 500):
+    rng = random.Random(seed)
+    phrases = [phrase for phrase in analyzer.matcher.phrases if phrase.isascii() or not ascii_only]
+    texts = []
+    for _ in range(count):
+        words = ' '.join(
+            rng.choice(phrases) if rng.random() < 0.3 else rng.choice(FILLER) for _ in range(rng.randrange(1, 12))
+        ).split(' ')
+        text = rng.choice((' ', ', ', '. ')).join(misspell(word, rng) for word in words)
+        texts.append(text.upper() if rng.random() < 0.2 else text)
+    return texts
+
+
+def test_typo_correction_matches_extract(analyzer):
+    records = list(analyzer.score_batch(['feverr and a cough', 'nothing wrong']).records())
+    assert records[0]['detected_symptoms'] == analyzer.extract_symptoms('feverr and a cough') == ['cough', 'fever']
+    assert records[1]['detected_symptoms'] == []
+
+
+@pytest.mark.parametrize('ascii_only', [True, False], ids=['ascii', 'unicode'])
+@pytest.mark.parametrize('seed', range(3))
+def test_random_texts_match_extract(analyzer, ascii_only, seed):
+    texts = make_texts(analyzer, ascii_only, seed)
+    for text, record in zip(texts, analyzer.score_batch(texts).records()):
+        assert record['detected_symptoms'] == analyzer.extract_symptoms(text), text
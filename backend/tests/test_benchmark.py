@@ -0,0 +1,104 @@
+"""
+Benchmark suite tests
+Latency statistics, synthetic inputs, baseline comparison and the CLI exit codes
+"""
+
+import itertools
+import json
+import random
+
+import pytest
+
+import benchmark
+from benchmark import FORMAT_VERSION, compare, measure, synthetic_knowledge_base, synthetic_note
+
+
+def document(**p50_by_case):
+    return {
+        'format_version': FORMAT_VERSION,
+        'meta': {},
+        'results': {name: {'p50_us': p50, 'p99_us': p50 * 2} for name, p50 in p50_by_case.items()}
+    }
+
+
+def write(path, data):
+    path.write_text(json.dumps(data), encoding='utf-8')
+    return str(path)
+
+
+def test_measure_reports_percentiles(monkeypatch):
+    # Call n advances the clock by n microseconds
+    durations = iter(range(1, 101))
+    timeline = [0]
+
+    def perf_counter_ns():
+        return timeline[0]
+
+    def call():
+        timeline[0] += next(durations) * 1000
+
+    monkeypatch.setattr(benchmark.time, 'perf_counter_ns', perf_counter_ns)
+    stats = measure(call, iterations=90, warmup=10)
+
+    # The warmup consumed durations 1-10; timed calls took 11..100 microseconds
+    assert stats['iterations'] == 90
+    assert (stats['p50_us'], stats['p90_us'], stats['p99_us']) == (56, 92, 100)
+    assert stats['mean_us'] == pytest.approx(55.5)
+    assert stats['ops_per_sec'] == pytest.approx(90 / (sum(range(11, 101)) / 1e6))
+
+
+def test_synthetic_note_mentions_symptoms(knowledge_base):
+    symptoms = list(knowledge_base.symptoms)
+    note = synthetic_note(random.Random(1), 40, symptoms, 3)
+    assert len(note.split()) >= 40
+    assert len(knowledge_base.matcher.extract(note)) >= 3
+
+
+def test_synthetic_knowledge_base_keeps_real_symptoms(knowledge_base):
+    scaled = synthetic_knowledge_base(knowledge_base, 200, random.Random(1))
+    assert len(scaled.symptoms) == 200
+    assert set(knowledge_base.symptoms) <= set(scaled.symptoms)
+    assert scaled.matcher.extract('I have a headache') == ['headache']
+
+
+def test_compare_flags_p50_and_p99_regressions():
+    baseline = document(fast=10.0, slow=100.0, removed=5.0)
+    current = document(fast=10.5, slow=120.0, added=1.0)
+    current['results']['fast']['p99_us'] = 40.0
+
+    regressions = compare(baseline, current, threshold=0.10, p99_threshold=0.5)
+    assert regressions == [
+        'fast p99_us: 20.0us -> 40.0us (+100.0%)',
+        'slow p50_us: 100.0us -> 120.0us (+20.0%)',
+    ]
+    assert compare(baseline, current, threshold=1.0) == []
+
+
+def test_compare_command_exit_codes(tmp_path):
+    baseline = write(tmp_path / 'baseline.json', document(case=10.0))
+    assert benchmark.main(['compare', baseline, write(tmp_path / 'same.json', document(case=10.5))]) == 0
+    assert benchmark.main(['compare', baseline, write(tmp_path / 'slower.json', document(case=12.0))]) == 1
+    assert benchmark.main(['compare', '--threshold', '0.5', baseline, str(tmp_path / 'slower.json')]) == 0
+
+    stale = write(tmp_path / 'stale.json', dict(document(case=1.0), format_version=FORMAT_VERSION - 1))
+    assert benchmark.main(['compare', baseline, stale]) == 2
+    assert benchmark.main(['compare', baseline, str(tmp_path / 'missing.json')]) == 2
+
+
+@pytest.mark.parametrize('suite, case_filter, expected', [
+    ('model', 'tips/', ['tips/general', 'tips/respiratory', 'tips/unknown']),
+    ('routes', '/api/health', ['route/GET /api/health']),
+])
+def test_run_writes_results(tmp_path, monkeypatch, suite, case_filter, expected):
+    monkeypatch.setenv('ADMIN_TOKEN', 'benchmark')
+    output = tmp_path / 'bench.json'
+    argv = ['run', '--quick', '--suite', suite, '--filter', case_filter, '--output', str(output)]
+    assert benchmark.main(argv) == 0
+
+    results = json.loads(output.read_text(encoding='utf-8'))
+    assert results['format_version'] == FORMAT_VERSION
+    assert results['meta']['iterations'] == 300
+    assert sorted(results['results']) == expected
+
+    # Comparing a run against itself finds no regressions
+    assert benchmark.main(argv + ['--baseline', str(output), '--threshold', '10']) == 0
@@ -0,0 +1,105 @@
+"""
+Bulk analysis CLI tests
+Input parsing errors, checkpointed resume from an input offset, and worker failures
+"""
+
+import gzip
+import io
+import json
+
+import pytest
+
+import bulk_analyze
+from bulk_analyze import iter_records
+
+
+def records(data: bytes, input_format: str, offset: int = 0, id_field=None):
+    return list(iter_records(io.BytesIO(data), input_format, 'symptoms', id_field, offset=offset))
+
+
+def run(tmp_path, input_path, *extra):
+    output = str(tmp_path / 'results.jsonl')
+    argv = [str(input_path), output, '--workers', '1', '--chunk-size', '2', '--progress-interval', '0', *extra]
+    return bulk_analyze.main(argv), output
+
+
+def read_output(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
+@pytest.mark.parametrize('line, message', [
+    (b'["fever"]', 'line 2: expected a JSON object, got list'),
+    (b'"fever"', 'line 2: expected a JSON object, got str'),
+    (b'{"symptoms": ', 'line 2: Expecting value'),
+])
+def test_jsonl_errors_name_the_line(line, message):
+    with pytest.raises(ValueError, match=message):
+        records(b'{"symptoms": "cough"}\n' + line + b'\n', 'jsonl')
+
+
+def test_offsets_skip_finished_records():
+    data = b'{"symptoms": "cough", "id": 1}\n\n{"symptoms": "fever", "id": 2}\n{"symptoms": "", "id": 3}\n'
+    parsed = records(data, 'jsonl', id_field='id')
+    assert [(record_id, text) for record_id, text, _ in parsed] == [(1, 'cough'), (2, 'fever'), (3, '')]
+
+    # Continuing from a record's end offset yields exactly the records after it
+    assert [record[:2] for record in records(data, 'jsonl', parsed[0][2], 'id')] == [(2, 'fever'), (3, '')]
+    assert records(data, 'jsonl', parsed[-1][2]) == []
+
+
+def test_csv_offsets_span_quoted_newlines():
+    data = b'id,symptoms\r\n1,"cough\r\nand fever"\r\n2,headache\r\n3,\r\n'
+    parsed = records(data, 'csv', id_field='id')
+    assert [record[:2] for record in parsed] == [('1', 'cough\r\nand fever'), ('2', 'headache'), ('3', '')]
+    assert parsed[-1][2] == len(data)
+
+    assert [record[:2] for record in records(data, 'csv', parsed[0][2], 'id')] == [('2', 'headache'), ('3', '')]
+
+
+def test_csv_without_text_column_is_refused():
+    with pytest.raises(ValueError, match="no 'symptoms' column"):
+        records(b'id,notes\n1,cough\n', 'csv')
+
+
+def test_resume_continues_after_checkpointed_offset(tmp_path):
+    input_path = tmp_path / 'intake.jsonl.gz'
+    lines = [json.dumps({'symptoms': text, 'id': i}) + '\n' for i, text in enumerate(['cough', 'fever', 'headache'])]
+    with gzip.open(input_path, 'wt', encoding='utf-8') as f:
+        f.writelines(lines)
+    assert run(tmp_path, input_path, '--id-field', 'id')[0] == 0
+
+    # Records appended later are the only ones a resumed run analyzes
+    appended = json.dumps({'symptoms': 'chest pain', 'id': 3}) + '\n'
+    with gzip.open(input_path, 'at', encoding='utf-8') as f:
+        f.write(appended)
+    status, output = run(tmp_path, input_path, '--id-field', 'id', '--resume')
+    assert status == 0
+
+    rows = read_output(output)
+    assert [(row['index'], row['id']) for row in rows] == [(0, 0), (1, 1), (2, 2), (3, 3)]
+    assert rows[3]['detected_symptoms'][0]['symptom'] == 'chest pain'
+    with open(str(output) + '.checkpoint.json', 'r', encoding='utf-8') as f:
+        assert json.load(f)['input_offset'] == sum(len(line) for line in lines + [appended])
+
+
+def test_invalid_record_stops_the_run(tmp_path, capsys):
+    input_path = tmp_path / 'intake.jsonl'
+    input_path.write_text('{"symptoms": "cough"}\n[1, 2]\n', encoding='utf-8')
+    assert run(tmp_path, input_path)[0] == 1
+    assert 'JSONL input line 2: expected a JSON object' in capsys.readouterr().err
+
+
+def test_worker_failure_is_reported(tmp_path, capsys, monkeypatch):
+    input_path = tmp_path / 'intake.jsonl'
+    input_path.write_text(''.join(json.dumps({'symptoms': f'cough {i}'}) + '\n' for i in range(4)), encoding='utf-8')
+
+    # Forked workers inherit the patched options; Parquet output then fails in the worker
+    monkeypatch.setattr(bulk_analyze, '_write_parquet_part', _fail)
+    status, output = run(tmp_path, input_path, '--format', 'parquet')
+    assert status == 1
+    assert 'Chunk 0 (records from 0) failed: worker failed' in capsys.readouterr().err
+
+
+def _fail(rows, path):
+    raise OSError('worker failed')
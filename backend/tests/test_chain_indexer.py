@@ -0,0 +1,147 @@
+"""
+Chain indexer tests
+Runs ChainIndexer against an in-memory fake of the JSON-RPC node, including reorganisations
+"""
+
+from typing import Any, Dict, List, Sequence, Tuple
+
+import pytest
+
+from chain_indexer import GET_RECORD_SELECTOR, RECORD_ADDED_TOPIC, ChainIndexer
+from record_store import RecordStore
+
+
+CONTRACT = '0x' + '42' * 20
+PATIENT = '0x' + '0a' * 20
+
+
+def _word(value: int) -> str:
+    return format(value, '064x')
+
+
+def _abi_string(value: str) -> str:
+    data = value.encode('utf-8')
+    return _word(len(data)) + data.hex().ljust((len(data) + 31) // 32 * 64, '0')
+
+
+class FakeChain:
+    """Enough of a node for ChainIndexer: blocks, RecordAdded logs and getRecord"""
+
+    def __init__(self, length: int):
+        self.hashes = [self._hash('a', number) for number in range(length)]
+        # (block_number, patient, record_index, cid)
+        self.records: List[Tuple[int, str, int, str]] = []
+
+    @staticmethod
+    def _hash(fork: str, number: int) -> str:
+        return '0x' + fork + format(number, '063x')
+
+    def add_record(self, block_number: int, patient: str, cid: str) -> None:
+        record_index = sum(1 for record in self.records if record[1] == patient)
+        self.records.append((block_number, patient, record_index, cid))
+
+    def reorg(self, from_block: int, fork: str, length: int) -> None:
+        """Replace every block from from_block on, dropping the records they held"""
+        self.hashes = self.hashes[:from_block] + [self._hash(fork, n) for n in range(from_block, length)]
+        self.records = [record for record in self.records if record[0] < from_block]
+
+    def call(self, method: str, params: Sequence[Any] = ()) -> Any:
+        return self.batch([(method, params)])[0]
+
+    def batch(self, calls: Sequence[Tuple[str, Sequence[Any]]]) -> List[Any]:
+        return [getattr(self, method)(*params) for method, params in calls]
+
+    def eth_chainId(self) -> str:
+        return '0x7a69'
+
+    def eth_blockNumber(self) -> str:
+        return hex(len(self.hashes) - 1)
+
+    def eth_getBlockByNumber(self, number: str, full: bool) -> Dict[str, Any]:
+        number = int(number, 16)
+        return {'hash': self.hashes[number]} if number < len(self.hashes) else None
+
+    def eth_getLogs(self, query: Dict[str, Any]) -> List[Dict[str, Any]]:
+        assert query['address'] == CONTRACT
+        from_block, to_block = int(query['fromBlock'], 16), int(query['toBlock'], 16)
+        return [{
+            'blockNumber': hex(block_number),
+            'blockHash': self.hashes[block_number],
+            'logIndex': '0x0',
+            'transactionHash': '0x' + _word(block_number),
+            'topics': [RECORD_ADDED_TOPIC, '0x' + patient[2:].rjust(64, '0'), '0x' + _word(0),
+                       '0x' + _word(record_index)],
+            'data': '0x' + _word(64) + _word(1700000000 + block_number) + _abi_string('lab')
+        } for block_number, patient, record_index, _ in self.records if from_block <= block_number <= to_block]
+
+    def eth_call(self, transaction: Dict[str, Any], block: Any) -> str:
+        data = transaction['data']
+        assert data.startswith(GET_RECORD_SELECTOR)
+        patient = '0x' + data[10:74][-40:]
+        record_index = int(data[74:], 16)
+        cid = next(record[3] for record in self.records if record[1:3] == (patient, record_index))
+        return '0x' + _word(32) + _word(32) + _abi_string(cid)
+
+
+@pytest.fixture
+def chain():
+    chain = FakeChain(21)
+    chain.add_record(3, PATIENT, 'QmFirst')
+    chain.add_record(9, PATIENT, 'QmSecond')
+    chain.add_record(15, PATIENT, 'QmOrphaned')
+    return chain
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = RecordStore(str(tmp_path / 'index.db'))
+    yield store
+    store.close()
+
+
+def indexed(store: RecordStore) -> List[Tuple[int, str, int]]:
+    return [(r['record_index'], r['ipfs_hash'], r['block_number']) for r in store.get_records(PATIENT)]
+
+
+def test_sync_indexes_records(chain, store):
+    indexer = ChainIndexer(chain, store, CONTRACT, batch_blocks=5)
+    assert indexer.sync_once() == 3
+    assert store.last_block == 20
+    assert indexed(store) == [(0, 'QmFirst', 3), (1, 'QmSecond', 9), (2, 'QmOrphaned', 15)]
+    assert indexer.handle_reorg() is None
+
+
+def test_reorg_rolls_back_to_newest_canonical_block(chain, store):
+    indexer = ChainIndexer(chain, store, CONTRACT, batch_blocks=5)
+    indexer.sync_once()
+
+    chain.reorg(12, 'b', 23)
+    chain.add_record(13, PATIENT, 'QmReplacement')
+
+    # Block 9 is the newest stored block still on the chain
+    assert indexer.handle_reorg() == 9
+    assert store.last_block == 9
+    assert indexed(store) == [(0, 'QmFirst', 3), (1, 'QmSecond', 9)]
+
+    indexer.sync_once()
+    assert store.last_block == 22
+    assert indexed(store) == [(0, 'QmFirst', 3), (1, 'QmSecond', 9), (2, 'QmReplacement', 13)]
+
+
+def test_reorg_without_stored_match_rolls_back_whole_window(chain, store):
+    indexer = ChainIndexer(chain, store, CONTRACT, batch_blocks=5, reorg_depth=4)
+    indexer.sync_once()
+
+    # Blocks 19 and 20 are stored and both replaced; 16 to 18 had no events
+    chain.reorg(18, 'c', 21)
+    chain.add_record(19, PATIENT, 'QmLate')
+
+    assert indexer.handle_reorg() == 16
+    indexer.sync_once()
+    assert indexed(store) == [(0, 'QmFirst', 3), (1, 'QmSecond', 9), (2, 'QmOrphaned', 15), (3, 'QmLate', 19)]
+
+
+def test_refuses_other_contract(chain, store):
+    ChainIndexer(chain, store, CONTRACT)
+    with pytest.raises(ValueError):
+        ChainIndexer(chain, store, '0x' + '43' * 20)
@@ -0,0 +1,171 @@
+"""
+IPFS proxy tests
+Disk cache sharing, eviction and CID verification, against a stub gateway
+"""
+
+from http.server import BaseHTTPRequestHandler
+import base64
+import hashlib
+import os
+
+import pytest
+
+from ipfs_proxy import CID_PATTERN, IpfsDiskCache, IpfsGateway, content_hash
+
+
+HELLO_CID_V0 = 'QmT78zSuBmuS4z925WZfrqQ1qHaJ56DQaTfyMUF7F8ff5o'
+HELLO_RAW_CID = 'bafkreifzjut3te2nhyekklss27nh3k72ysco7y32koao5eei66wof36n5e'
+
+
+def raw_cid(data: bytes) -> str:
+    """CIDv1 of a raw block"""
+    return 'b' + base64.b32encode(b'\x01\x55\x12\x20' + hashlib.sha256(data).digest()).decode().lower().rstrip('=')
+
+
+def add_entry(cache: IpfsDiskCache, data: bytes) -> str:
+    cid = raw_cid(data)
+    writer = cache.writer(cid, 'text/plain', len(data))
+    writer.write(data)
+    writer.commit()
+    return cid
+
+
+def cached_cids(directory) -> set:
+    return {name for name in os.listdir(directory) if CID_PATTERN.match(name)}
+
+
+@pytest.fixture
+def gateway_content():
+    return {}
+
+
+@pytest.fixture
+def gateway_url(stub_server, gateway_content):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            body = gateway_content.get(self.path[len('/ipfs/'):])
+            status = 200
+            if body is None:
+                status, body = 404, b'not found'
+            elif self.headers.get('Range'):
+                status, body = 206, body[:1]
+            self.send_response(status)
+            self.send_header('Content-Type', 'text/plain')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    return stub_server(Handler)
+
+
+def fetch(gateway: IpfsGateway, cid: str, range_header=None):
+    status, headers, body = gateway.fetch(cid, range_header)
+    data = b''.join(body)
+    body.close()
+    return status, data
+
+
+@pytest.mark.parametrize('cid, data', [
+    (HELLO_CID_V0, b'hello world\n'),
+    (HELLO_RAW_CID, b'hello world'),
+])
+def test_content_hash_checks_body(cid, data):
+    checker = content_hash(cid)
+    checker.update(data)
+    assert checker.matches()
+
+    checker = content_hash(cid)
+    checker.update(data + b'!')
+    assert not checker.matches()
+
+
+def test_unsupported_codec_is_not_verified():
+    # dag-cbor (0x71) root
+    cid = 'b' + base64.b32encode(b'\x01\x71\x12\x20' + bytes(32)).decode().lower().rstrip('=')
+    assert content_hash(cid) is None
+
+
+def test_miss_is_cached_and_then_served_from_disk(tmp_path, gateway_url, gateway_content):
+    gateway_content[HELLO_CID_V0] = b'hello world\n'
+    cache = IpfsDiskCache(str(tmp_path), max_bytes=1000)
+    gateway = IpfsGateway(gateway_url, cache=cache)
+
+    assert cache.get(HELLO_CID_V0) is None
+    assert fetch(gateway, HELLO_CID_V0) == (200, b'hello world\n')
+
+    cached = cache.get(HELLO_CID_V0)
+    assert cached.content_type == 'text/plain' and cached.size == 12
+    with open(cached.path, 'rb') as f:
+        assert f.read() == b'hello world\n'
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 1
+
+
+def test_body_that_does_not_match_its_cid_is_not_cached(tmp_path, gateway_url, gateway_content):
+    gateway_content[HELLO_CID_V0] = b'something else'
+    cache = IpfsDiskCache(str(tmp_path), max_bytes=1000)
+    gateway = IpfsGateway(gateway_url, cache=cache)
+
+    # Still served, but never stored
+    assert fetch(gateway, HELLO_CID_V0) == (200, b'something else')
+    assert cache.get(HELLO_CID_V0) is None
+    assert cache.stats()['unverified'] == 1
+    assert os.listdir(cache.temp_directory) == []
+
+
+def test_range_and_error_responses_are_not_cached(tmp_path, gateway_url, gateway_content):
+    gateway_content[HELLO_RAW_CID] = b'hello world'
+    cache = IpfsDiskCache(str(tmp_path), max_bytes=1000)
+    gateway = IpfsGateway(gateway_url, cache=cache)
+
+    assert fetch(gateway, HELLO_RAW_CID, 'bytes=0-0') == (206, b'h')
+    assert fetch(gateway, raw_cid(b'missing'))[0] == 404
+    assert cached_cids(tmp_path) == set()
+
+
+def test_workers_share_entries(tmp_path):
+    first = IpfsDiskCache(str(tmp_path), max_bytes=1000)
+    second = IpfsDiskCache(str(tmp_path), max_bytes=1000)
+
+    cid = add_entry(first, b'shared entry')
+    assert second.get(cid).size == len(b'shared entry')
+
+
+def test_byte_limit_holds_across_workers(tmp_path):
+    workers = [IpfsDiskCache(str(tmp_path), max_bytes=250) for _ in range(4)]
+
+    for i in range(20):
+        add_entry(workers[i % 4], bytes([i]) * 100)
+        assert sum(os.path.getsize(tmp_path / cid) for cid in cached_cids(tmp_path)) <= 250
+
+    # The two newest entries survive, whichever worker wrote them
+    assert cached_cids(tmp_path) == {raw_cid(bytes([18]) * 100), raw_cid(bytes([19]) * 100)}
+
+
+def test_least_recently_used_entry_is_evicted(tmp_path):
+    cache = IpfsDiskCache(str(tmp_path), max_bytes=250)
+    old = add_entry(cache, b'a' * 100)
+    newer = add_entry(cache, b'b' * 100)
+
+    # Reading the older entry makes it the most recently used
+    assert cache.get(old) is not None
+    add_entry(cache, b'c' * 100)
+
+    assert cache.get(newer) is None
+    assert cache.get(old) is not None
+    assert cache.stats()['evictions'] == 1
+
+
+def test_oversized_body_is_not_cached(tmp_path):
+    cache = IpfsDiskCache(str(tmp_path), max_bytes=1000, max_entry_bytes=10)
+    data = b'x' * 11
+    assert cache.writer(raw_cid(data), None, len(data)) is None
+
+    # Without a Content-Length the writer gives up once the limit is passed
+    writer = cache.writer(raw_cid(data), None, None)
+    assert not writer.write(data)
+    assert os.listdir(cache.temp_directory) == []
@@ -0,0 +1,251 @@
+"""
+IPFS upload tests
+CidBuilder against CIDs assigned by `ipfs add`, and pinning against a stub pinning service
+"""
+
+from http.server import BaseHTTPRequestHandler
+from io import BytesIO
+from urllib.parse import parse_qs, urlsplit
+import json
+import threading
+
+import pytest
+
+import app as app_module
+from ipfs_upload import (CHUNK_SIZE, MAX_LINKS, CidBuilder, IpfsUploader, PinningClient, PinningError, PinRegistry,
+                         UploadSpool)
+
+
+HELLO_WORLD_CID = 'QmT78zSuBmuS4z925WZfrqQ1qHaJ56DQaTfyMUF7F8ff5o'
+
+
+def chunks(count: int, extra: int = 0) -> bytes:
+    """count distinct full chunks followed by extra bytes"""
+    return b''.join(i.to_bytes(4, 'big') * (CHUNK_SIZE // 4) for i in range(count)) + b'x' * extra
+
+
+def build_cid(data: bytes, piece_size: int) -> str:
+    builder = CidBuilder()
+    for offset in range(0, len(data), piece_size):
+        builder.update(data[offset:offset + piece_size])
+    return builder.cid()
+
+
+@pytest.mark.parametrize('data, expected', [
+    (b'', 'QmbFMke1KXqnYyBBWxB74N4c5SBnJMVAiMNRcGu6x1AwQH'),
+    (b'1234', 'QmTPqcLhVnCtjoYuCZwPzfXcFrUviiPComTepHfEEaGf7g'),
+    (b'hello world\n', HELLO_WORLD_CID),
+    (b'x' * 100, 'QmRsgAm5a86xpvcG3FefnjbZamRSSgsdJKcyvWKxVMZ16d'),
+], ids=['empty', 'four-bytes', 'hello-world', 'hundred-bytes'])
+def test_single_chunk(data, expected):
+    builder = CidBuilder()
+    builder.update(data)
+    assert builder.cid() == expected
+    assert builder.size == len(data)
+
+
+@pytest.mark.parametrize('count, extra, expected', [
+    (2, 0, 'QmdKmHYwAhJ6UDXhYxBPhBWMU8riW1L9A5dDrLVfCjDCyq'),
+    (MAX_LINKS, 0, 'QmXtV1XJg1bzLo5Ei6WkGSkrRxcQozQvwcBbYJJHvkaMGX'),
+    (MAX_LINKS, 1, 'QmcQpfHnhCZqQdkJ69617oE1B6mRGxbHXbC8w6Hz2KZky3'),
+    (MAX_LINKS + 1, 0, 'QmWSGHdnGQkRFfphXZwc7LpxisGDZViQUBbUbwjaUGKDCo'),
+], ids=['two-chunks', 'full-node', 'full-node-plus-one-byte', 'two-levels'])
+def test_multiple_chunks(count, extra, expected):
+    data = chunks(count, extra)
+    # Update boundaries must not matter
+    assert build_cid(data, CHUNK_SIZE) == expected
+    assert build_cid(data, 100003) == expected
+
+
+class PinningService:
+    """State of the stub service: pinned CIDs, queued failure statuses and request log"""
+
+    def __init__(self):
+        self.pins = set()
+        self.failures = []
+        self.uploads = []
+        self.listed = []
+        self.lock = threading.Lock()
+
+    def handler(self):
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def reply(self, status, payload, headers=()):
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                for name, value in headers:
+                    self.send_header(name, value)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                query = parse_qs(urlsplit(self.path).query)
+                fragment = query['hashContains'][0]
+                service.listed.append(fragment)
+                # Substring matching, as the real pinList does
+                rows = [{'ipfs_pin_hash': cid} for cid in sorted(service.pins) if fragment in cid]
+                self.reply(200, {'count': len(rows), 'rows': rows[:int(query['pageLimit'][0])]})
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers['Content-Length']))
+                if self.headers.get('Authorization') != 'Bearer test-jwt':
+                    return self.reply(401, {'error': 'unauthorized'})
+                with service.lock:
+                    failure = service.failures.pop(0) if service.failures else None
+                if failure is not None:
+                    return self.reply(failure[0], {'error': 'failed'}, failure[1:])
+
+                boundary = self.headers['Content-Type'].split('boundary=')[1].encode()
+                part = body.split(b'--' + boundary)[1]
+                content = part.split(b'\r\n\r\n', 1)[1][:-2]
+                builder = CidBuilder()
+                builder.update(content)
+                cid = builder.cid()
+                with service.lock:
+                    service.uploads.append(content)
+                    service.pins.add(cid)
+                self.reply(200, {'IpfsHash': cid, 'PinSize': len(content)})
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+def local_cid(data: bytes) -> str:
+    builder = CidBuilder()
+    builder.update(data)
+    return builder.cid()
+
+
+def spool(tmp_path, data: bytes) -> UploadSpool:
+    upload = UploadSpool(str(tmp_path))
+    upload.write(data)
+    return upload
+
+
+@pytest.fixture
+def service():
+    return PinningService()
+
+
+@pytest.fixture
+def client(stub_server, service):
+    client = PinningClient(stub_server(service.handler()), jwt='test-jwt', backoff=0.001, max_backoff=0.01)
+    yield client
+    client.close()
+
+
+@pytest.fixture
+def uploader(client, tmp_path):
+    uploader = IpfsUploader(client, PinRegistry(str(tmp_path / 'pins.db')))
+    yield uploader
+    uploader.executor.shutdown()
+
+
+def test_retryable_failures_are_retried(client, service, tmp_path, monkeypatch):
+    delays = []
+    monkeypatch.setattr('ipfs_upload.time.sleep', delays.append)
+    service.failures = [(503,), (429, ('Retry-After', '5'))]
+
+    path = tmp_path / 'record.txt'
+    path.write_bytes(b'hello world\n')
+    assert client.pin_file(str(path), 'record.txt')['IpfsHash'] == HELLO_WORLD_CID
+    assert client.retries == 2
+    # Retry-After is honoured up to max_backoff
+    assert delays[1] == 0.01
+
+
+def test_client_errors_are_not_retried(client, service, tmp_path):
+    service.failures = [(400,)]
+    path = tmp_path / 'record.txt'
+    path.write_bytes(b'data')
+    with pytest.raises(PinningError) as error:
+        client.pin_file(str(path), 'record.txt')
+    assert error.value.status == 400
+    assert client.retries == 0
+
+
+def test_retries_give_up_after_max_attempts(client, service, tmp_path, monkeypatch):
+    monkeypatch.setattr('ipfs_upload.time.sleep', lambda delay: None)
+    service.failures = [(502,)] * client.max_attempts
+    path = tmp_path / 'record.txt'
+    path.write_bytes(b'data')
+    with pytest.raises(PinningError) as error:
+        client.pin_file(str(path), 'record.txt')
+    assert error.value.status == 502
+    assert client.retries == client.max_attempts - 1
+
+
+def test_is_pinned_needs_an_exact_match(client, service):
+    cid = local_cid(b'data')
+    service.pins.add(cid + 'extra')
+    assert not client.is_pinned(cid)
+    service.pins.add(cid)
+    assert client.is_pinned(cid)
+
+
+def test_uploader_pins_each_content_once(uploader, service, tmp_path):
+    first = uploader.upload([('a.txt', spool(tmp_path, b'one')), ('b.txt', spool(tmp_path, b'one')),
+                             ('c.txt', spool(tmp_path, b'two'))])
+    assert [result['status'] for result in first] == ['pinned', 'duplicate', 'pinned']
+    assert [result['ipfs_hash'] for result in first] == [local_cid(b'one')] * 2 + [local_cid(b'two')]
+    assert sorted(service.uploads) == [b'one', b'two']
+
+    # Known content is answered from the registry without asking the service
+    listed = len(service.listed)
+    second = uploader.upload([('a.txt', spool(tmp_path, b'one'))])
+    assert second[0]['status'] == 'already_pinned'
+    assert len(service.listed) == listed and len(service.uploads) == 2
+    assert uploader.stats()['pinned'] == 2
+
+
+def test_uploader_skips_content_pinned_elsewhere(uploader, service, tmp_path):
+    service.pins.add(local_cid(b'pinned by the browser'))
+    result = uploader.upload([('a.txt', spool(tmp_path, b'pinned by the browser'))])
+    assert result[0]['status'] == 'already_pinned'
+    assert service.uploads == []
+
+
+def test_uploader_reports_failed_files(uploader, service, tmp_path):
+    service.failures = [(400,)]
+    result = uploader.upload([('a.txt', spool(tmp_path, b'rejected'))])
+    assert result[0]['status'] == 'failed' and 'status 400' in result[0]['error']
+    assert uploader.stats()['failed'] == 1
+
+
+@pytest.fixture
+def upload_client(uploader, monkeypatch, tmp_path):
+    monkeypatch.setattr(app_module, 'ipfs_uploader', uploader)
+    monkeypatch.setattr(app_module, 'UPLOAD_SPOOL_DIR', str(tmp_path))
+    return app_module.app.test_client()
+
+
+def test_upload_route_pins_files(upload_client, service):
+    response = upload_client.post('/api/records/upload', content_type='multipart/form-data', data={
+        'file': [(BytesIO(b'hello world\n'), 'lab.txt'), (BytesIO(b'hello world\n'), 'copy.txt')]
+    })
+    assert response.status_code == 200
+    payload = response.get_json()
+    assert payload['ipfs_hashes'] == [HELLO_WORLD_CID, HELLO_WORLD_CID]
+    assert [result['status'] for result in payload['files']] == ['pinned', 'duplicate']
+    assert service.uploads == [b'hello world\n']
+
+
+def test_upload_route_reports_pinning_failure(upload_client, service):
+    service.failures = [(400,)]
+    response = upload_client.post('/api/records/upload', content_type='multipart/form-data', data={
+        'file': (BytesIO(b'data'), 'lab.txt')
+    })
+    assert response.status_code == 502
+    assert response.get_json()['files'][0]['status'] == 'failed'
+
+
+def test_upload_route_needs_files(upload_client):
+    response = upload_client.post('/api/records/upload', content_type='multipart/form-data', data={'note': 'x'})
+    assert response.status_code == 400
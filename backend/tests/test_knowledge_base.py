@@ -0,0 +1,138 @@
+"""
+Knowledge base tests
+Data file validation, immutable snapshots and hot reload
+"""
+
+import copy
+import json
+import os
+
+import pytest
+
+import app as app_module
+from ai_model import HealthAnalyzer
+from knowledge_base import DEFAULT_KNOWLEDGE_BASE_PATH, KnowledgeBase, load_knowledge_base
+
+
+@pytest.fixture(scope='module')
+def data():
+    with open(DEFAULT_KNOWLEDGE_BASE_PATH, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+@pytest.fixture
+def data_file(tmp_path, data):
+    path = tmp_path / 'knowledge_base.json'
+    write(path, data)
+    return path
+
+
+def write(path, data, mtime_step: int = 0):
+    """Write a data file, moving its mtime forward so a change is visible at coarse timestamp resolution"""
+    previous = os.stat(path).st_mtime_ns if os.path.exists(path) else 0
+    path.write_text(json.dumps(data), encoding='utf-8')
+    if mtime_step:
+        os.utime(path, ns=(previous + mtime_step * 10 ** 9, previous + mtime_step * 10 ** 9))
+
+
+def with_synonym(data, name: str, synonym: str):
+    changed = copy.deepcopy(data)
+    changed['symptoms'][name]['synonyms'].append(synonym)
+    return changed
+
+
+def test_snapshot_is_read_only(knowledge_base):
+    with pytest.raises(TypeError):
+        knowledge_base.symptoms['headache'] = None
+    with pytest.raises(TypeError):
+        knowledge_base.symptom_database['headache']['severity'] = 'severe'
+
+    record = knowledge_base.symptoms['headache']
+    assert record.severity_priority == knowledge_base.severity_levels[record.severity].priority
+    assert 'headache' in knowledge_base.category_index[record.category]
+
+
+def test_version_tracks_content(data):
+    assert KnowledgeBase(data).version == KnowledgeBase(copy.deepcopy(data)).version
+    assert KnowledgeBase(with_synonym(data, 'headache', 'skull ache')).version != KnowledgeBase(data).version
+
+
+@pytest.mark.parametrize('change, message', [
+    (lambda d: d['severity_levels']['mild'].update(priority=0), "'mild' must have a priority of at least 1"),
+    (lambda d: d['symptoms'].update(Headache=d['symptoms']['headache']), "must be lowercase: 'Headache'"),
+    (lambda d: d['symptoms']['cough'].update(severity='dire'), "Unknown severity 'dire'"),
+    (lambda d: d['tips'].pop('general'), "'general' category"),
+    (lambda d: d['symptoms']['cough'].pop('category'), "missing or malformed 'category'"),
+])
+def test_inconsistent_files_are_rejected(tmp_path, data, change, message):
+    broken = copy.deepcopy(data)
+    change(broken)
+    path = tmp_path / 'knowledge_base.json'
+    write(path, broken)
+    with pytest.raises(ValueError, match=message):
+        load_knowledge_base(str(path))
+
+
+def test_reload_swaps_snapshot_and_clears_cache(data_file, data):
+    analyzer = HealthAnalyzer(str(data_file))
+    held = analyzer.knowledge_base
+    assert analyzer.extract_symptoms('my skull aches') == []
+    analyzer.analyze_symptoms('I have a headache')
+    assert analyzer.cache.stats()['size'] == 1
+
+    write(data_file, with_synonym(data, 'headache', 'skull aches'))
+    assert analyzer.reload()
+    assert analyzer.extract_symptoms('my skull aches') == ['headache']
+    assert analyzer.cache.stats()['size'] == 0
+
+    # A request holding the previous snapshot keeps seeing it
+    assert held.matcher.extract('my skull aches') == []
+    assert not analyzer.reload()
+
+
+def test_failed_reload_keeps_current_snapshot(data_file):
+    analyzer = HealthAnalyzer(str(data_file))
+    current = analyzer.knowledge_base
+    data_file.write_text('{"symptoms": ', encoding='utf-8')
+
+    with pytest.raises(ValueError, match='Invalid knowledge base file'):
+        analyzer.reload()
+    assert analyzer.knowledge_base is current
+
+
+def test_reload_if_modified_follows_mtime(data_file, data):
+    analyzer = HealthAnalyzer(str(data_file))
+    assert not analyzer.reload_if_modified()
+
+    write(data_file, with_synonym(data, 'fever', 'burning up'), mtime_step=1)
+    assert analyzer.reload_if_modified()
+    assert analyzer.extract_symptoms('I am burning up') == ['fever']
+    assert not analyzer.reload_if_modified()
+
+
+@pytest.fixture
+def client(monkeypatch, data_file):
+    monkeypatch.setattr(app_module, 'analyzer', HealthAnalyzer(str(data_file)))
+    monkeypatch.setattr(app_module, 'ADMIN_TOKEN', 'admin-token')
+    return app_module.app.test_client()
+
+
+def test_reload_route_needs_admin_token(client):
+    assert client.post('/api/admin/reload').status_code == 401
+    assert client.post('/api/admin/reload', headers={'X-Admin-Token': 'wrong'}).status_code == 401
+
+
+def test_reload_route(client, data_file, data):
+    headers = {'X-Admin-Token': 'admin-token'}
+    body = client.post('/api/admin/reload', headers=headers).get_json()
+    assert body['success'] and not body['reloaded']
+    version = body['version']
+
+    write(data_file, with_synonym(data, 'cough', 'hacking'))
+    body = client.post('/api/admin/reload', headers=headers).get_json()
+    assert body['reloaded'] and body['version'] != version
+
+    data_file.write_text('[]', encoding='utf-8')
+    response = client.post('/api/admin/reload', headers=headers)
+    assert response.status_code == 500
+    assert app_module.analyzer.knowledge_base.version == body['version']
@@ -0,0 +1,156 @@
+"""
+Live analysis tests
+Incremental session matches against a full rescan of the same text, and session expiry and eviction
+"""
+
+import random
+
+import pytest
+
+import live_analysis
+from live_analysis import CLOSED_EVENT, LiveSession, LiveSessionStore, _scan_text
+
+
+def render(knowledge_base, detected):
+    return b''
+
+
+def full_scan(knowledge_base, text):
+    return sorted((start, end, term_index) for term_index, start, end in _scan_text(knowledge_base, text))
+
+
+def random_fragment(rng, terms):
+    pieces = [rng.choice(terms), 'İ', 'i̇', 'ß', 'fever', 'pain', ' ', ', ', '  ', '-', 'x', 'patient', 'İstanbul']
+    return ''.join(rng.choice(pieces) for _ in range(rng.randint(0, 4)))
+
+
+def test_expanding_lowercase_keeps_original_offsets(knowledge_base):
+    session = LiveSession('test', knowledge_base, render, 1000)
+    session.set_text('İ fever', knowledge_base)
+    assert session._matches == full_scan(knowledge_base, 'İ fever')
+    assert session._matches[0][:2] == (2, 7)
+
+    session.replace(0, 1, '', knowledge_base)
+    assert session.text == ' fever'
+    assert session._matches == full_scan(knowledge_base, ' fever') == [(1, 6, session._matches[0][2])]
+
+
+@pytest.mark.parametrize('fuzzy', [False, True], ids=['exact', 'fuzzy'])
+@pytest.mark.parametrize('seed', range(20))
+def test_random_edits_match_full_rescan(request, fuzzy, seed):
+    knowledge_base = request.getfixturevalue('fuzzy_knowledge_base' if fuzzy else 'knowledge_base')
+    rng = random.Random(seed)
+    terms = list(knowledge_base.matcher.terms)
+    session = LiveSession('test', knowledge_base, render, 5000)
+
+    for _ in range(150):
+        text = session.text
+        start = rng.randint(0, len(text))
+        end = rng.randint(start, min(len(text), start + 10))
+        insert = random_fragment(rng, terms)
+        if len(text) - (end - start) + len(insert) > session.max_chars:
+            continue
+        session.replace(start, end, insert, knowledge_base)
+
+        expected = full_scan(knowledge_base, session.text)
+        assert session._matches == expected
+        assert session.detected == tuple(
+            knowledge_base.matcher.terms[term_index] for term_index in sorted({match[2] for match in expected})
+        )
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Manually advanced monotonic clock for session idle times"""
+    now = [1000.0]
+    monkeypatch.setattr(live_analysis.time, 'monotonic', lambda: now[0])
+    return now
+
+
+def closed_flags(*sessions):
+    return [session.closed for session in sessions]
+
+
+def test_idle_sessions_expire(knowledge_base, clock):
+    store = LiveSessionStore(render, idle_timeout=60)
+    idle, edited = store.create(knowledge_base), store.create(knowledge_base)
+    notified = []
+    idle.subscribe(lambda: notified.append(idle.next_event(None)[0]))
+
+    clock[0] += 30
+    edited.set_text('I have a fever', knowledge_base)
+    store.touch(edited, True)
+
+    # Only edits keep a session alive; looking it up does not
+    clock[0] += 45
+    assert store.get(idle.session_id) is None
+    assert store.get(edited.session_id) is edited
+    assert closed_flags(idle, edited) == [True, False]
+    assert notified == [CLOSED_EVENT]
+
+    clock[0] += 15
+    assert store.get(edited.session_id) is None
+    assert store.stats()['sessions'] == 0
+
+
+def test_expired_sessions_are_dropped_on_create(knowledge_base, clock):
+    store = LiveSessionStore(render, idle_timeout=60)
+    old = store.create(knowledge_base)
+    clock[0] += 60
+    new = store.create(knowledge_base)
+    assert closed_flags(old, new) == [True, False]
+    assert store.stats()['sessions'] == 1
+
+
+def test_least_recently_edited_session_is_evicted(knowledge_base, clock):
+    store = LiveSessionStore(render, max_sessions=2)
+    first, second = store.create(knowledge_base), store.create(knowledge_base)
+    clock[0] += 1
+    first.set_text('cough', knowledge_base)
+    store.touch(first, True)
+
+    third = store.create(knowledge_base)
+    assert closed_flags(first, second, third) == [False, True, False]
+    assert store.get(second.session_id) is None
+
+    fourth = store.create(knowledge_base)
+    assert closed_flags(first, third, fourth) == [True, False, False]
+
+
+def test_close_and_stats(knowledge_base, clock):
+    store = LiveSessionStore(render)
+    session = store.create(knowledge_base)
+    store.touch(session, session.set_text('I have a headache', knowledge_base))
+    store.touch(session, session.replace(0, 0, 'Today ', knowledge_base))
+    scanned = session.scanned_chars
+
+    assert store.close(session.session_id)
+    assert not store.close(session.session_id)
+    assert session.closed
+
+    # Closed sessions keep counting towards the scanned total
+    assert store.stats() == {'sessions': 0, 'edits': 2, 'updates': 1, 'scanned_chars': scanned}
+
+
+def test_unsubscribed_listener_is_not_called(knowledge_base):
+    session = LiveSession('test', knowledge_base, render, 1000)
+    calls = []
+    unsubscribe = session.subscribe(lambda: calls.append(session.analysis_version))
+
+    session.set_text('fever', knowledge_base)
+    session.set_text('fever!', knowledge_base)
+    unsubscribe()
+    session.set_text('cough', knowledge_base)
+    assert calls == [1]
+
+
+def test_edits_are_bounded(knowledge_base):
+    session = LiveSession('test', knowledge_base, render, 10)
+    session.set_text('fever', knowledge_base)
+    with pytest.raises(ValueError, match='exceed 10 characters'):
+        session.replace(5, 5, ' and cough', knowledge_base)
+    with pytest.raises(ValueError, match='outside the text'):
+        session.replace(3, 8, '', knowledge_base)
+    with pytest.raises(live_analysis.EditConflict):
+        session.replace(0, 0, 'a', knowledge_base, expected_version=0)
+    assert (session.text, session.text_version) == ('fever', 1)
@@ -0,0 +1,104 @@
+"""
+Metrics tests
+Counter and histogram exposition, label handling and the /metrics endpoint
+"""
+
+import re
+
+import pytest
+
+import app as app_module
+import metrics
+from metrics import Registry, gauge_lines
+
+
+SAMPLE = re.compile(r'^[a-zA-Z_:][a-zA-Z0-9_:]*(\{([a-zA-Z_]+="([^"\\]|\\.)*",?)*\})? (\+Inf|-?[0-9.e+-]+)$')
+
+
+def sample_value(text: str, series: str) -> float:
+    for line in text.splitlines():
+        if line.startswith(series + ' '):
+            return float(line.rsplit(' ', 1)[1])
+    raise AssertionError(f'{series} not exposed')
+
+
+def test_counter_uses_total_suffix():
+    registry = Registry()
+    requests = registry.counter('app_requests', 'Requests', ['method'])
+    requests.labels('GET').inc()
+    requests.labels('GET').inc(2)
+    requests.labels('POST').inc(0.5)
+
+    assert registry.render().decode('utf-8').splitlines() == [
+        '# HELP app_requests_total Requests',
+        '# TYPE app_requests_total counter',
+        'app_requests_total{method="GET"} 3',
+        'app_requests_total{method="POST"} 0.5',
+    ]
+
+
+def test_histogram_buckets_are_cumulative_and_inclusive():
+    registry = Registry()
+    latency = registry.histogram('app_latency_seconds', 'Latency', buckets=(0.5, 0.1, 1.0))
+    for value in (0.1, 0.3, 1.0, 7.0):
+        latency.observe(value)
+
+    # Bounds are sorted, and a value equal to a bound falls in that bucket
+    assert registry.render().decode('utf-8').splitlines()[2:] == [
+        'app_latency_seconds_bucket{le="0.1"} 1',
+        'app_latency_seconds_bucket{le="0.5"} 2',
+        'app_latency_seconds_bucket{le="1"} 3',
+        'app_latency_seconds_bucket{le="+Inf"} 4',
+        'app_latency_seconds_sum 8.4',
+        'app_latency_seconds_count 4',
+    ]
+
+
+def test_labels():
+    counter = metrics.Counter('app_events', 'Events', ['kind', 'status'])
+    assert counter.labels('a', 200) is counter.labels('a', '200')
+    with pytest.raises(ValueError, match='expects labels'):
+        counter.labels('a')
+
+    counter.labels('quote " back \\ new\nline', 200).inc()
+    assert counter.render()[3] == 'app_events_total{kind="quote \\" back \\\\ new\\nline",status="200"} 1'
+
+
+def test_collectors_render_after_metrics():
+    registry = Registry()
+    registry.counter('app_first', 'First').inc()
+    sizes = {(('tier', 'local'),): 3, (('tier', 'shared'),): 1.5}
+    registry.add_collector(lambda: gauge_lines('app_size', 'Size', sizes))
+
+    assert registry.render().decode('utf-8').endswith(
+        '# TYPE app_size gauge\napp_size{tier="local"} 3\napp_size{tier="shared"} 1.5\n'
+    )
+
+
+@pytest.fixture
+def client():
+    return app_module.app.test_client()
+
+
+def test_metrics_endpoint(client):
+    before = client.get('/metrics').get_data(as_text=True)
+    series = 'medblocai_http_requests_total{endpoint="/api/symptoms",method="GET",status="200"}'
+    count = sample_value(before, series) if series in before else 0
+
+    client.get('/api/symptoms')
+    client.post('/api/analyze', json={'symptoms': 'I have a headache'})
+    response = client.get('/metrics')
+
+    assert response.status_code == 200
+    assert response.content_type == metrics.CONTENT_TYPE
+    text = response.get_data(as_text=True)
+    assert sample_value(text, series) == count + 1
+    assert sample_value(text, 'medblocai_analysis_stage_duration_seconds_count{stage="extract"}') >= 1
+
+    for line in text.splitlines():
+        assert line.startswith('# ') or SAMPLE.match(line), line
+
+
+def test_metrics_endpoint_can_be_disabled(client, monkeypatch):
+    monkeypatch.setattr(app_module, 'METRICS_ENABLED', False)
+    assert client.get('/metrics').status_code == 404
@@ -0,0 +1,132 @@
+"""
+Patient timeline tests
+Running aggregates, day-window pruning, the severity trend and who may read a timeline
+"""
+
+import sqlite3
+
+import pytest
+
+import app as app_module
+from patient_timeline import SECONDS_PER_DAY, PatientTimelineStore
+
+
+PATIENT = '0x' + '0a' * 20
+DAY = 20000 * SECONDS_PER_DAY
+
+
+@pytest.fixture
+def store(tmp_path):
+    return PatientTimelineStore(str(tmp_path / 'timeline.db'), window_days=3, recent_size=4)
+
+
+def day_rows(store: PatientTimelineStore):
+    connection = sqlite3.connect(store.path)
+    try:
+        return connection.execute('SELECT day FROM patient_days ORDER BY day').fetchall()
+    finally:
+        connection.close()
+
+
+def test_unknown_patient_is_empty(store):
+    timeline = store.get_timeline(PATIENT, now=DAY)
+    assert timeline['analyses'] == 0
+    assert timeline['symptoms'] == [] and timeline['severities'] == {} and timeline['daily'] == []
+    assert timeline['trend'] == 'insufficient_data'
+
+
+def test_records_update_existing_rows(store):
+    store.record(PATIENT, ['fever', 'cough'], 'moderate', 2, timestamp=DAY + 100)
+    store.record(PATIENT, ['fever'], 'high', 3, timestamp=DAY + 50)
+    store.record(PATIENT, [], 'unknown', 0, timestamp=DAY + 200)
+
+    timeline = store.get_timeline(PATIENT, now=DAY + 300)
+    assert (timeline['analyses'], timeline['first_seen'], timeline['last_seen']) == (3, DAY + 50, DAY + 200)
+    assert timeline['symptoms'] == [
+        {'symptom': 'fever', 'count': 2, 'first_seen': DAY + 50, 'last_seen': DAY + 100},
+        {'symptom': 'cough', 'count': 1, 'first_seen': DAY + 100, 'last_seen': DAY + 100},
+    ]
+    assert timeline['severities']['high'] == {'count': 1, 'first_seen': DAY + 50, 'last_seen': DAY + 50}
+    assert timeline['daily'] == [
+        {'date': '2024-10-04', 'analyses': 3, 'max_severity': 'high', 'mean_priority': 1.667}
+    ]
+    # Newest first, and no other patient is affected
+    assert [entry['severity'] for entry in timeline['recent']] == ['unknown', 'high', 'moderate']
+    assert store.get_timeline('0x' + '0b' * 20, now=DAY)['analyses'] == 0
+
+
+def test_recent_entries_are_capped(store):
+    for i in range(6):
+        store.record(PATIENT, ['cough'], 'mild', 1, timestamp=DAY + i)
+    timeline = store.get_timeline(PATIENT, now=DAY)
+    assert [entry['timestamp'] for entry in timeline['recent']] == [DAY + 5, DAY + 4, DAY + 3, DAY + 2]
+    assert timeline['analyses'] == 6
+
+
+def test_days_outside_the_window_are_pruned(store):
+    for day in range(5):
+        store.record(PATIENT, ['cough'], 'mild', 1, timestamp=DAY + day * SECONDS_PER_DAY)
+    today = DAY // SECONDS_PER_DAY + 4
+
+    # Writing day 4 deleted everything up to day 1 of a three-day window
+    assert day_rows(store) == [(today - 2,), (today - 1,), (today,)]
+    assert [entry['date'] for entry in store.get_timeline(PATIENT, now=today * SECONDS_PER_DAY)['daily']] == [
+        '2024-10-06', '2024-10-07', '2024-10-08'
+    ]
+    # Reads also leave out days that have aged out since the last write
+    assert len(store.get_timeline(PATIENT, now=(today + 2) * SECONDS_PER_DAY)['daily']) == 1
+
+
+@pytest.mark.parametrize('priorities, trend', [
+    ([1, 1, 3, 3], 'escalating'),
+    ([3, 3, 1, 1], 'improving'),
+    ([2, 1, 2, 1], 'stable'),
+    ([1, 3, 1], 'insufficient_data'),
+    # Analyses that detected nothing are not an improvement
+    ([2, 2, 0, 0], 'insufficient_data'),
+    ([1, 0, 1, 0, 3, 3], 'escalating'),
+])
+def test_trend(tmp_path, priorities, trend):
+    store = PatientTimelineStore(str(tmp_path / 'timeline.db'), recent_size=10)
+    for i, priority in enumerate(priorities):
+        severity = {0: 'unknown', 1: 'mild', 2: 'moderate', 3: 'high'}[priority]
+        store.record(PATIENT, [], severity, priority, timestamp=DAY + i)
+    assert store.get_timeline(PATIENT, now=DAY)['trend'] == trend
+
+
+@pytest.fixture
+def client(store, monkeypatch):
+    monkeypatch.setattr(app_module, 'patient_timeline', store)
+    monkeypatch.setattr(app_module, 'TIMELINE_WRITE_TOKEN', 'write-token')
+    monkeypatch.setattr(app_module, 'TIMELINE_READ_TOKEN', 'read-token')
+    return app_module.app.test_client()
+
+
+@pytest.mark.parametrize('headers, status', [
+    ({}, 401),
+    ({'X-Timeline-Token': 'wrong'}, 401),
+    ({'X-Timeline-Token': 'read-token'}, 200),
+    ({'X-Timeline-Token': 'write-token'}, 200),
+])
+def test_reading_a_timeline_needs_a_token(client, headers, status):
+    response = client.get(f'/api/patients/{PATIENT}/timeline', headers=headers)
+    assert response.status_code == status
+
+
+def test_read_token_cannot_record(client, store):
+    response = client.post('/api/analyze', json={'symptoms': 'fever', 'patient': PATIENT},
+                           headers={'X-Timeline-Token': 'read-token'})
+    assert response.status_code == 401
+
+    response = client.post('/api/analyze', json={'symptoms': 'fever', 'patient': PATIENT},
+                           headers={'X-Timeline-Token': 'write-token'})
+    assert response.status_code == 200
+    response = client.get(f'/api/patients/{PATIENT}/timeline', headers={'X-Timeline-Token': 'read-token'})
+    assert response.get_json()['analyses'] == 1
+
+
+def test_reads_are_refused_without_configured_tokens(client, monkeypatch):
+    monkeypatch.setattr(app_module, 'TIMELINE_WRITE_TOKEN', '')
+    monkeypatch.setattr(app_module, 'TIMELINE_READ_TOKEN', '')
+    response = client.get(f'/api/patients/{PATIENT}/timeline', headers={'X-Timeline-Token': ''})
+    assert response.status_code == 401
@@ -0,0 +1,101 @@
+"""
+Preload tests
+Gunicorn fork hooks, and objects built before the fork staying usable in workers
+"""
+
+import gc
+import importlib.util
+import os
+import signal
+
+import pytest
+
+from ai_model import HealthAnalyzer
+from ipfs_upload import PinRegistry
+from record_store import RecordStore
+
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'gunicorn.conf.py')
+
+
+@pytest.fixture
+def load_config(monkeypatch):
+    """Import gunicorn.conf.py with GUNICORN_PRELOAD set, restoring GC and SIGHUP afterwards"""
+    handler = signal.getsignal(signal.SIGHUP)
+
+    def load(preload: str):
+        monkeypatch.setenv('GUNICORN_PRELOAD', preload)
+        spec = importlib.util.spec_from_file_location('gunicorn_conf', CONFIG_PATH)
+        config = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(config)
+        return config
+
+    yield load
+    gc.unfreeze()
+    gc.enable()
+    signal.signal(signal.SIGHUP, handler)
+
+
+def test_preload_hooks(load_config):
+    config = load_config('True')
+    assert config.preload_app and not gc.isenabled()
+
+    config.pre_fork(None, None)
+    assert gc.get_freeze_count() > 0
+    config.post_fork(None, None)
+    assert gc.isenabled()
+
+    import app
+    signal.signal(signal.SIGHUP, signal.SIG_DFL)
+    config.post_worker_init(None)
+    assert signal.getsignal(signal.SIGHUP) == app._reload_knowledge_base_in_background
+
+
+def test_hooks_do_nothing_without_preload(load_config):
+    config = load_config('false')
+    assert not config.preload_app and gc.isenabled()
+
+    config.pre_fork(None, None)
+    assert gc.get_freeze_count() == 0
+    signal.signal(signal.SIGHUP, signal.SIG_DFL)
+    config.post_worker_init(None)
+    assert signal.getsignal(signal.SIGHUP) == signal.SIG_DFL
+
+
+def test_stores_keep_no_connection_open(tmp_path):
+    store = RecordStore(str(tmp_path / 'records.db'))
+    registry = PinRegistry(str(tmp_path / 'pins.db'))
+    assert getattr(store._local, 'connection', None) is None
+    assert getattr(registry._local, 'connection', None) is None
+
+
+def test_fuzzy_index_is_immutable(fuzzy_knowledge_base):
+    index = fuzzy_knowledge_base.matcher.fuzzy
+    assert index._deletes and all(type(indexes) is tuple for indexes in index._deletes.values())
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='needs fork')
+def test_forked_worker_uses_preloaded_objects(tmp_path, load_config, fuzzy_data_file):
+    config = load_config('True')
+    analyzer = HealthAnalyzer(fuzzy_data_file)
+    store = RecordStore(str(tmp_path / 'records.db'))
+    registry = PinRegistry(str(tmp_path / 'pins.db'))
+    expected = analyzer.analyze_symptoms('I have a headeche and a fever')
+    config.pre_fork(None, None)
+
+    pid = os.fork()
+    if pid == 0:
+        status = 1
+        try:
+            config.post_fork(None, None)
+            if analyzer.analyze_symptoms('I have a headeche and a fever') == expected:
+                store.set_meta('worker', 'ok')
+                registry.add('cid', 'pinned', 3)
+                status = 0
+        finally:
+            os._exit(status)
+
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
+    assert store.get_meta('worker') == 'ok'
+    assert registry.get('cid') == 'pinned'
@@ -0,0 +1,178 @@
+"""
+Profiling tests
+Request selection, profile storage and pruning, collapsed stacks and the admin routes
+"""
+
+import marshal
+import pstats
+
+import pytest
+from werkzeug.test import Client
+
+import app as app_module
+import profiling
+from profiling import ENVIRON_KEY, RequestProfiler, collapse_stats
+
+
+TOKEN = 'admin-token'
+
+
+@pytest.fixture
+def profiler(tmp_path):
+    return RequestProfiler(str(tmp_path / 'profiles'), token=TOKEN, max_profiles=3)
+
+
+def hello_app(environ, start_response):
+    start_response('201 Created', [('Content-Type', 'text/plain')])
+
+    def body():
+        yield b'hello '
+        yield ''.join(sorted('world')).encode('ascii')
+
+    return body()
+
+
+def failing_app(environ, start_response):
+    raise RuntimeError('handler failed')
+
+
+def profiled_get(profiler, app=hello_app, path='/api/analyze', **environ):
+    client = Client(profiler.wrap(app))
+    return client.get(path, headers={'X-Profile': '1', 'X-Admin-Token': TOKEN}, environ_overrides=environ,
+                      buffered=True)
+
+
+@pytest.mark.parametrize('path, profile_header, token_header, expected', [
+    ('/api/analyze', '1', TOKEN, 'header'),
+    ('/api/analyze', '1', 'wrong', ''),
+    ('/api/analyze', '1', None, ''),
+    ('/api/analyze', None, TOKEN, ''),
+    ('/api/admin/profiles', '1', TOKEN, ''),
+])
+def test_select_by_header(profiler, path, profile_header, token_header, expected):
+    assert profiler.select(path, profile_header, token_header) == expected
+
+
+def test_header_needs_a_configured_token(tmp_path):
+    assert RequestProfiler(str(tmp_path)).select('/api/analyze', '1', '') == ''
+
+
+def test_select_by_sampling(tmp_path, monkeypatch):
+    profiler = RequestProfiler(str(tmp_path), sample_rate=0.25)
+    monkeypatch.setattr(profiling.random, 'random', lambda: 0.2)
+    assert profiler.select('/api/analyze', None, None) == 'sampled'
+    monkeypatch.setattr(profiling.random, 'random', lambda: 0.25)
+    assert profiler.select('/api/analyze', None, None) == ''
+
+
+def test_profiled_request_is_saved_after_its_body(profiler):
+    response = profiled_get(profiler)
+    assert response.get_data() == b'hello dlorw'
+    profile_id = response.headers['X-Profile-Id']
+
+    [details] = profiler.list()
+    assert details['id'] == profile_id
+    assert (details['method'], details['path'], details['status'], details['trigger']) == \
+        ('GET', '/api/analyze', 201, 'header')
+    assert details['duration_ms'] >= 0
+
+    # A standard pstats file, which includes the time spent producing the streamed body
+    stats = pstats.Stats(profiler.pstats_path(profile_id))
+    assert any(name == 'body' for _, _, name in stats.stats)
+    assert any('test_profiling.py:body:' in line for line in profiler.collapsed([profile_id]).splitlines())
+
+
+def test_unselected_requests_pass_through(profiler):
+    client = Client(profiler.wrap(hello_app))
+    assert 'X-Profile-Id' not in client.get('/api/analyze').headers
+
+    # A decision made by the ASGI server takes precedence over the headers
+    sampled = client.get('/api/analyze', environ_overrides={ENVIRON_KEY: 'sampled'}, buffered=True)
+    assert 'X-Profile-Id' in sampled.headers
+    assert 'X-Profile-Id' not in profiled_get(profiler, **{ENVIRON_KEY: ''}).headers
+    assert [details['trigger'] for details in profiler.list()] == ['sampled']
+
+
+def test_failed_request_is_saved(profiler):
+    with pytest.raises(RuntimeError):
+        profiled_get(profiler, failing_app)
+    [details] = profiler.list()
+    assert details['status'] is None
+
+
+def test_only_newest_profiles_are_kept(profiler):
+    ids = [profiled_get(profiler).headers['X-Profile-Id'] for _ in range(5)]
+    assert [details['id'] for details in profiler.list()] == ids[:1:-1]
+    assert profiler.pstats_path(ids[0]) is None
+    assert profiler.collapsed(ids[:2]) == ''
+
+
+@pytest.mark.parametrize('profile_id', ['../secrets', '0123456789ABCDEF', '0123456789abcdef0'])
+def test_pstats_path_accepts_only_profile_ids(profiler, profile_id):
+    assert profiler.pstats_path(profile_id) is None
+
+
+def test_collapse_splits_shared_callees_by_caller():
+    root, a, b, shared = ('app.py', 1, 'root'), ('app.py', 10, 'a'), ('app.py', 20, 'b'), ('lib.py', 5, 'shared')
+    stats = {
+        root: (1, 1, 0.5, 10.5, {}),
+        a: (1, 1, 1.0, 4.0, {root: (1, 1, 1.0, 4.0)}),
+        b: (1, 1, 2.0, 3.0, {root: (1, 1, 2.0, 3.0)}),
+        shared: (2, 2, 4.0, 4.0, {a: (1, 1, 3.0, 3.0), b: (1, 1, 1.0, 1.0)}),
+        ('~', 0, "<method 'disable' of '_lsprof.Profiler' objects>"): (1, 1, 9.0, 9.0, {}),
+    }
+    totals = collapse_stats(stats)
+    assert totals == pytest.approx({
+        'app.py:root:1': 0.5,
+        'app.py:root:1;app.py:a:10': 1.0,
+        'app.py:root:1;app.py:a:10;lib.py:shared:5': 3.0,
+        'app.py:root:1;app.py:b:20': 2.0,
+        'app.py:root:1;app.py:b:20;lib.py:shared:5': 1.0,
+    })
+
+    # Recursion is folded into the first occurrence, and built-ins keep their own names
+    stats = {
+        root: (1, 1, 1.0, 3.0, {root: (1, 1, 1.0, 1.0)}),
+        ('~', 0, '<built-in method builtins.len>'): (1, 1, 2.0, 2.0, {root: (1, 1, 2.0, 2.0)}),
+    }
+    assert collapse_stats(stats) == {}
+    stats[root] = (1, 1, 1.0, 3.0, {})
+    assert collapse_stats(stats) == {'app.py:root:1': 1.0, 'app.py:root:1;<built-in method builtins.len>': 2.0}
+
+
+@pytest.fixture
+def client(monkeypatch, profiler):
+    monkeypatch.setattr(app_module, 'request_profiler', profiler)
+    monkeypatch.setattr(app_module, 'ADMIN_TOKEN', TOKEN)
+    return Client(profiler.wrap(app_module.app.wsgi_app))
+
+
+def test_profile_routes(client, profiler):
+    headers = {'X-Admin-Token': TOKEN}
+    analyzed = client.post('/api/analyze', json={'symptoms': 'I have a headache'},
+                           headers={'X-Profile': '1', 'X-Admin-Token': TOKEN}, buffered=True)
+    profile_id = analyzed.headers['X-Profile-Id']
+    client.get('/api/symptoms', headers={'X-Profile': '1', 'X-Admin-Token': TOKEN}, buffered=True)
+
+    # Listing and downloading profiles are never profiled themselves
+    listed = client.get('/api/admin/profiles', headers={'X-Profile': '1', 'X-Admin-Token': TOKEN})
+    assert 'X-Profile-Id' not in listed.headers
+    assert [profile['path'] for profile in listed.get_json()['profiles']] == ['/api/symptoms', '/api/analyze']
+
+    filtered = client.get('/api/admin/profiles?format=collapsed&path=/api/analyze', headers=headers)
+    single = client.get(f'/api/admin/profiles/{profile_id}', headers=headers)
+    assert filtered.mimetype == single.mimetype == 'text/plain'
+    assert filtered.get_data() == single.get_data()
+    assert 'ai_model.py:analyze_symptoms_json:' in single.get_data(as_text=True)
+
+    download = client.get(f'/api/admin/profiles/{profile_id}?format=pstats', headers=headers)
+    assert marshal.loads(download.get_data()) == marshal.load(open(profiler.pstats_path(profile_id), 'rb'))
+    assert client.get('/api/admin/profiles/0123456789abcdef', headers=headers).status_code == 404
+
+
+def test_profile_routes_need_admin_token(client, monkeypatch):
+    assert client.get('/api/admin/profiles').status_code == 401
+    assert client.get('/api/admin/profiles/0123456789abcdef').status_code == 401
+
+    monkeypatch.setattr(app_module, 'request_profiler', None)
+    assert client.get('/api/admin/profiles', headers={'X-Admin-Token': TOKEN}).status_code == 404
@@ -0,0 +1,100 @@
+"""
+Static response tests
+Precomputed bodies, strong ETags, conditional requests and gzip variants
+"""
+
+import copy
+import gzip
+import json
+
+import pytest
+
+import app as app_module
+from ai_model import HealthAnalyzer
+from knowledge_base import DEFAULT_KNOWLEDGE_BASE_PATH
+from static_responses import MIN_GZIP_SIZE, StaticResponse
+
+
+@pytest.fixture
+def client():
+    return app_module.app.test_client()
+
+
+def test_small_bodies_are_not_compressed(client):
+    response = StaticResponse.from_payload({'success': True})
+    assert len(response.body) < MIN_GZIP_SIZE and response.gzip_body == b''
+
+    # The symptom list is below the threshold, so it is sent uncompressed even when gzip is accepted
+    response = client.get('/api/symptoms', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in response.headers
+    assert not response.get_etag()[0].endswith('-gzip')
+
+
+def test_compressed_variant_is_deterministic():
+    payload = {'tips': ['Drink water'] * 100}
+    first, second = StaticResponse.from_payload(payload), StaticResponse.from_payload(payload)
+
+    assert first == second
+    assert gzip.decompress(first.gzip_body) == first.body
+    assert first.gzip_etag == f'{first.etag}-gzip'
+
+
+@pytest.mark.parametrize('path', ['/', '/api/symptoms', '/api/tips', '/api/tips/Respiratory'])
+def test_identity_body_and_revalidation(client, path):
+    response = client.get(path, headers={'Accept-Encoding': 'identity'})
+    assert response.status_code == 200
+    assert 'Content-Encoding' not in response.headers
+    assert response.headers['Cache-Control'] == 'no-cache'
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert json.loads(response.get_data())
+
+    etag, _ = response.get_etag()
+    revalidated = client.get(path, headers={'Accept-Encoding': 'identity', 'If-None-Match': f'"{etag}"'})
+    assert revalidated.status_code == 304
+    assert revalidated.get_data() == b'' and revalidated.get_etag() == (etag, False)
+
+
+def test_gzip_variant_has_its_own_etag(client):
+    plain = client.get('/', headers={'Accept-Encoding': 'identity'})
+    compressed = client.get('/', headers={'Accept-Encoding': 'gzip, deflate'})
+
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(compressed.get_data()) == plain.get_data()
+    assert compressed.get_etag()[0] == plain.get_etag()[0] + '-gzip'
+
+    # The identity ETag does not validate the gzip variant, nor the reverse
+    headers = {'Accept-Encoding': 'gzip', 'If-None-Match': f'"{plain.get_etag()[0]}"'}
+    assert client.get('/', headers=headers).status_code == 200
+    headers = {'Accept-Encoding': 'gzip;q=0', 'If-None-Match': f'"{compressed.get_etag()[0]}"'}
+    refused = client.get('/', headers=headers)
+    assert refused.status_code == 200 and 'Content-Encoding' not in refused.headers
+
+
+def test_unknown_tips_category_is_built_per_request(client):
+    response = client.get('/api/tips/astrology')
+    assert response.status_code == 200
+    assert response.get_etag() == (None, None)
+    body = response.get_json()
+    assert body['category'] == 'astrology'
+    assert body['title'] == app_module.analyzer.knowledge_base.tips['general'].title
+
+
+def test_reload_rebuilds_bodies(client, monkeypatch, tmp_path):
+    with open(DEFAULT_KNOWLEDGE_BASE_PATH, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    path = tmp_path / 'knowledge_base.json'
+    path.write_text(json.dumps(data), encoding='utf-8')
+    analyzer = HealthAnalyzer(str(path))
+    monkeypatch.setattr(app_module, 'analyzer', analyzer)
+    monkeypatch.setattr(app_module, '_static_responses', None)
+
+    before = client.get('/api/symptoms')
+    changed = copy.deepcopy(data)
+    changed['symptoms']['hiccups'] = dict(changed['symptoms']['cough'], synonyms=[])
+    path.write_text(json.dumps(changed), encoding='utf-8')
+    assert analyzer.reload()
+
+    headers = {'Accept-Encoding': 'identity', 'If-None-Match': before.headers['ETag']}
+    after = client.get('/api/symptoms', headers=headers)
+    assert after.status_code == 200
+    assert 'hiccups' in after.get_json()['symptoms']
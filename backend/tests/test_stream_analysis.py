@@ -0,0 +1,110 @@
+"""
+Stream analysis tests
+Chunked matching against a whole-text scan, cuts through oversized words, and the streaming route
+"""
+
+import random
+
+import pytest
+
+import app as app_module
+from stream_analysis import StreamAnalysis, StreamScanner
+
+
+FILLER = ('the', 'and', 'Patient', 'reports', 'pain.', 'no', 'ÉTÉ', 'naïve', '—', '\n', 'fevr', 'coughing',
+          'headache,', 'x' * 40)
+
+
+def feed_in_pieces(scanner: StreamScanner, text: str, sizes):
+    found, i = [], 0
+    while i < len(text):
+        size = next(sizes)
+        found += scanner.feed(text[i:i + size])
+        i += size
+    return sorted(found + scanner.finish())
+
+
+def random_text(rng: random.Random, phrases) -> str:
+    parts = []
+    for _ in range(rng.randint(0, 300)):
+        parts.append(rng.choice(phrases) if rng.random() < 0.3 else rng.choice(FILLER))
+        parts.append(rng.choice((' ', '  ', ', ', '-', '\n', '')))
+    if rng.random() < 0.2:
+        parts.append('y' * rng.randint(100, 400))
+    return ''.join(parts)
+
+
+@pytest.mark.parametrize('fuzzy', [False, True], ids=['exact', 'fuzzy'])
+@pytest.mark.parametrize('seed', range(10))
+def test_chunked_scan_matches_whole_text(request, fuzzy, seed):
+    knowledge_base = request.getfixturevalue('fuzzy_knowledge_base' if fuzzy else 'knowledge_base')
+    matcher = knowledge_base.matcher
+    rng = random.Random(seed)
+    for _ in range(20):
+        text = random_text(rng, list(matcher.phrases))
+        scanner = StreamScanner(matcher, chunk_chars=rng.choice((1, 5, 30, 100)))
+        sizes = iter(lambda: rng.randint(1, 60), None)
+        assert feed_in_pieces(scanner, text, sizes) == sorted(matcher.scan(text))
+        assert scanner.length == len(text)
+
+
+def test_match_across_every_cut(knowledge_base):
+    matcher = knowledge_base.matcher
+    text = 'I have chest pain and shortness of breath'
+    expected = sorted(matcher.scan(text))
+    assert len(expected) == 2
+
+    for cut in range(len(text) + 1):
+        scanner = StreamScanner(matcher, chunk_chars=1)
+        assert sorted(scanner.feed(text[:cut]) + scanner.feed(text[cut:]) + scanner.finish()) == expected
+
+
+@pytest.mark.parametrize('text', [
+    'x' * 200 + 'fever and cough',
+    'x' * 200 + '-fever and cough',
+    'fever' + 'x' * 200 + ' cough',
+    'x' * 200 + ' fever' + 'y' * 200 + ' cough',
+])
+def test_oversized_words_are_cut_through(knowledge_base, text):
+    matcher = knowledge_base.matcher
+    scanner = StreamScanner(matcher, chunk_chars=8)
+    assert feed_in_pieces(scanner, text, iter(lambda: 7, None)) == sorted(matcher.scan(text))
+
+    # Memory stays bounded while a single word keeps growing
+    scanner = StreamScanner(matcher, chunk_chars=8)
+    for _ in range(1000):
+        scanner.feed('z' * 10)
+    assert len(scanner._buffer) <= 8 + scanner.reach + 10
+    assert scanner.finish() == []
+
+
+def test_analysis_decodes_split_characters(knowledge_base):
+    text = 'Naïve patient — fever and chest pain. ' * 500
+    data = text.encode('utf-8')
+    analysis = StreamAnalysis(knowledge_base, max_positions=3, chunk_chars=64)
+    for i in range(0, len(data), 7):
+        analysis.feed(data[i:i + 7])
+    detected, occurrences = analysis.finish()
+
+    assert set(detected) == {'fever', 'chest pain'}
+    assert analysis.characters == len(text) and analysis.bytes_read == len(data)
+    fever = occurrences['fever']
+    assert fever['count'] == 500
+    assert [text[start:end] for start, end in fever['positions']] == ['fever'] * 3
+
+
+def test_stream_route(monkeypatch):
+    client = app_module.app.test_client()
+    text = 'Patient reports fever. ' * 2000 + 'Later developed chest pain.'
+    response = client.post('/api/analyze/stream', data=text.encode('utf-8'), content_type='text/plain')
+
+    body = response.get_json()
+    assert response.status_code == 200 and body['success']
+    assert [entry['symptom'] for entry in body['detected_symptoms']] == app_module.analyzer.extract_symptoms(text)
+    assert body['occurrences']['fever']['count'] == 2000
+    assert body['characters'] == len(text)
+
+    assert client.post('/api/analyze/stream', json={'symptoms': 'fever'}).status_code == 415
+    assert client.post('/api/analyze/stream', data=b'', content_type='text/plain').status_code == 400
+    monkeypatch.setattr(app_module, 'STREAM_MAX_BYTES', 10)
+    assert client.post('/api/analyze/stream', data=b'fever and cough', content_type='text/plain').status_code == 413
@@ -0,0 +1,57 @@
+"""
+Symptom matcher tests
+Synonym and typo-tolerant matching, including everyday words that must not become symptoms
+"""
+
+import pytest
+
+from symptom_matcher import FuzzyWordIndex, SymptomMatcher
+
+
+def test_fuzzy_matching_is_off_by_default(knowledge_base):
+    assert knowledge_base.matcher.fuzzy is None
+    assert knowledge_base.matcher.extract('feverr and a couhg') == []
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('feverr and a coughh since monday', ['cough', 'fever']),
+    ('my stomache hurts', ['stomach pain']),
+    ('I feel dizy and nauseuos', ['nausea']),
+    ('sore thraot', ['sore throat']),
+])
+def test_typos_are_corrected(fuzzy_knowledge_base, text, expected):
+    assert fuzzy_knowledge_base.matcher.extract(text) == expected
+
+
+@pytest.mark.parametrize('text', [
+    'she winked at me',
+    'he winged it',
+    'he winced at the noise',
+    'we sat in the tiered seating',
+    'they sell no energy drinks here',
+])
+def test_ordinary_words_are_not_symptoms(fuzzy_knowledge_base, text):
+    assert fuzzy_knowledge_base.matcher.extract(text) == []
+
+
+def test_high_severity_words_are_never_correction_targets(fuzzy_knowledge_base):
+    matcher = fuzzy_knowledge_base.matcher
+    # Exact matches still count; only a misspelling is refused
+    assert matcher.extract('I am winded') == ['shortness of breath']
+    assert matcher.extract('I am windedd and breathlesss') == []
+    assert matcher.fuzzy.correct('windedd') is None
+
+
+def test_dictionary_words_are_never_corrected():
+    index = FuzzyWordIndex(['tired', 'fever'], max_edits=1, min_length=5, dictionary=['tiered', 'fewer', 'table'])
+    assert index.correct('tiered') is None
+    assert index.correct('fewer') is None
+    assert index.correct('tirred') == 'tired'
+    # Only dictionary words near the vocabulary are kept
+    assert index.dictionary == frozenset({'tiered', 'fewer'})
+
+
+def test_synonyms_resolve_to_their_term():
+    matcher = SymptomMatcher(['fatigue'], synonyms={'fatigue': ['worn out', 'have no energy']})
+    assert matcher.extract('I have no energy and feel worn out') == ['fatigue']
+    assert matcher.extract('no energy drinks') == []
@@ -0,0 +1,205 @@
+"""
+Traffic capture and replay tests
+Anonymized capture files, and replaying them against a stub server with baseline comparison
+"""
+
+from http.server import BaseHTTPRequestHandler
+import json
+import re
+
+import pytest
+
+import replay
+from traffic_capture import ADDRESS_PATTERN, TrafficAnonymizer, TrafficCapture
+
+
+PATIENT = '0x' + 'AbC' * 13 + 'd'
+
+
+@pytest.fixture
+def anonymizer(knowledge_base):
+    return TrafficAnonymizer(lambda: knowledge_base, b'capture-key')
+
+
+def read_capture(directory):
+    [path] = directory.glob('capture-*.jsonl')
+    return [json.loads(line) for line in path.read_text(encoding='utf-8').splitlines()]
+
+
+def test_text_keeps_symptoms_and_shape(anonymizer, knowledge_base):
+    text = 'Maria Lopez (DOB 1984) has a HEADACHE, chest pain & fever since Tuesday.'
+    anonymized = anonymizer.text(text)
+
+    assert len(anonymized) == len(text)
+    assert re.sub(r'\w', '.', anonymized) == re.sub(r'\w', '.', text)
+    for identifying in ('maria', 'lopez', '1984', 'tuesday'):
+        assert identifying not in anonymized
+    assert 'headache, chest pain & fever' in anonymized
+    assert knowledge_base.matcher.extract(anonymized) == knowledge_base.matcher.extract(text)
+
+
+def test_typos_survive_anonymization(fuzzy_knowledge_base):
+    anonymizer = TrafficAnonymizer(lambda: fuzzy_knowledge_base, b'capture-key')
+    text = 'Jonathan has had a bad coughh and nausia'
+    anonymized = anonymizer.text(text)
+    assert 'jonathan' not in anonymized and 'coughh' in anonymized and 'nausia' in anonymized
+    assert fuzzy_knowledge_base.matcher.extract(anonymized) == fuzzy_knowledge_base.matcher.extract(text)
+
+
+def test_addresses_are_keyed_pseudonyms(anonymizer, knowledge_base):
+    pseudonym = anonymizer.address(PATIENT)
+    assert ADDRESS_PATTERN.match(pseudonym) and pseudonym != PATIENT.lower()
+    assert anonymizer.address(PATIENT.lower()) == pseudonym
+    assert TrafficAnonymizer(lambda: knowledge_base, b'other-key').address(PATIENT) != pseudonym
+
+
+@pytest.mark.parametrize('payload, body', [
+    ({'symptoms': 'Bob has a fever', 'name': 'Bob'}, {'symptoms': 'xxx xxx a fever'}),
+    ({'symptoms': 42, 'patient': 'not an address'}, {'patient': 'invalid'}),
+    (['fever'], None),
+    (None, None),
+])
+def test_body_keeps_only_known_fields(anonymizer, payload, body):
+    assert anonymizer.body(payload) == body
+
+
+def test_capture_writes_anonymized_entries(tmp_path, anonymizer):
+    capture = TrafficCapture(str(tmp_path), anonymizer)
+    capture.record('POST', '/api/analyze', '/api/analyze', {'symptoms': 'Ann has a cough', 'patient': PATIENT}, 200)
+    capture.record('GET', '/api/tips/<category>', '/api/tips/Respiratory', None, 200)
+    capture.record('GET', '/api/tips/<category>', '/api/tips/ann-smith', None, 200)
+    capture.record('GET', '/api/symptoms', '/api/symptoms', None, 304, conditional=True)
+    capture.record('POST', '/api/admin/reload', '/api/admin/reload', None, 401)
+    capture.close()
+
+    entries = read_capture(tmp_path)
+    assert [entry['path'] for entry in entries] == \
+        ['/api/analyze', '/api/tips/respiratory', '/api/tips/unknown', '/api/symptoms']
+    assert entries[0]['body'] == {'symptoms': 'xxx xxx a cough', 'patient': anonymizer.address(PATIENT)}
+    assert entries[3]['conditional'] and entries[3]['status'] == 304
+    assert 'body' not in entries[1] and 'conditional' not in entries[1]
+    assert capture.stats()['recorded'] == 4
+
+
+def test_capture_limits(tmp_path, anonymizer):
+    capture = TrafficCapture(str(tmp_path / 'full'), anonymizer, max_bytes=1)
+    for _ in range(3):
+        capture.record('GET', '/api/symptoms', '/api/symptoms', None, 200)
+    capture.close()
+    assert len(read_capture(tmp_path / 'full')) == 1
+    assert (capture.stats()['recorded'], capture.stats()['dropped']) == (1, 2)
+
+    unsampled = TrafficCapture(str(tmp_path / 'unsampled'), anonymizer, sample_rate=0)
+    unsampled.record('GET', '/api/symptoms', '/api/symptoms', None, 200)
+    assert list((tmp_path / 'unsampled').iterdir()) == []
+
+
+def test_load_capture_merges_files_in_time_order(tmp_path):
+    (tmp_path / 'capture-a-1.jsonl').write_text(
+        '{"timestamp": 3, "path": "c"}\n{"timestamp": 1, "path": "a"}\n{"timestamp": 4, "pa', encoding='utf-8'
+    )
+    (tmp_path / 'capture-b-2.jsonl').write_text('{"timestamp": 2, "path": "b"}\n', encoding='utf-8')
+    (tmp_path / 'notes.jsonl').write_text('{"timestamp": 0, "path": "ignored"}\n', encoding='utf-8')
+
+    assert [entry['path'] for entry in replay.load_capture([str(tmp_path)])] == ['a', 'b', 'c']
+    (tmp_path / 'capture-c-3.jsonl').write_text('{"timest', encoding='utf-8')
+    with pytest.raises(ValueError, match='No captured requests'):
+        replay.load_capture([str(tmp_path / 'capture-c-3.jsonl')])
+
+
+def test_summarize():
+    summary = replay.summarize([i / 1000 for i in range(100, 0, -1)], {'200': 99, '503': 1}, 1, 2.0)
+    assert summary == {
+        'requests': 100, 'errors': 1, 'throughput_rps': 50.0, 'mean_ms': pytest.approx(50.5),
+        'p50_ms': 51.0, 'p95_ms': 96.0, 'p99_ms': 100.0, 'max_ms': 100.0, 'statuses': {'200': 99, '503': 1}
+    }
+
+
+def results(throughput, p50=1.0, errors=0, label='', rate=100.0):
+    stats = {'throughput_rps': throughput, 'p50_ms': p50, 'p95_ms': 2.0, 'p99_ms': 3.0, 'errors': errors}
+    return {
+        'format_version': replay.FORMAT_VERSION,
+        'meta': {'label': label, 'mode': 'rate', 'rate': rate, 'concurrency': 64},
+        'results': {'GET /api/symptoms': stats}
+    }
+
+
+def test_compare(capsys):
+    assert replay.compare(results(100), results(95, p50=1.05), 0.10) == []
+    assert replay.compare(results(100), results(80, p50=1.5, errors=2), 0.10) == [
+        'GET /api/symptoms throughput: 100.0 -> 80.0 req/s (-20.0%)',
+        'GET /api/symptoms p50_ms: 1.00ms -> 1.50ms (+50.0%)',
+        'GET /api/symptoms errors: 0 -> 2',
+    ]
+    assert 'Warning' not in capsys.readouterr().err
+    replay.compare(results(100, label='gunicorn'), results(100, rate=200.0), 0.10)
+    err = capsys.readouterr().err
+    assert err.startswith('gunicorn -> current')
+    assert 'different load settings: mode rate -> rate, rate 100.0 -> 200.0' in err
+
+
+def test_compare_command(tmp_path):
+    def write(name, data):
+        (tmp_path / name).write_text(json.dumps(data), encoding='utf-8')
+        return str(tmp_path / name)
+
+    baseline = write('baseline.json', results(100))
+    assert replay.main(['compare', baseline, write('same.json', results(100))]) == 0
+    assert replay.main(['compare', baseline, write('slower.json', results(50))]) == 1
+    assert replay.main(['compare', '--threshold', '0.6', baseline, str(tmp_path / 'slower.json')]) == 0
+    assert replay.main(['compare', baseline, write('stale.json', dict(results(100), format_version=0))]) == 2
+
+
+class ApiStub(BaseHTTPRequestHandler):
+    """Answers GET /api/symptoms with an ETag, 304 when it matches, and any POST with 200"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.headers.get('If-None-Match') == '"v1"':
+            self.send_response(304)
+            self.send_header('ETag', '"v1"')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('ETag', '"v1"')
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'{}')
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        status = 200 if json.loads(body).get('symptoms') else 503
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+
+def test_replay_against_stub(tmp_path, stub_server):
+    url = stub_server(ApiStub)
+    entries = [
+        {'timestamp': 1, 'method': 'GET', 'endpoint': '/api/symptoms', 'path': '/api/symptoms', 'conditional': True},
+        {'timestamp': 2, 'method': 'POST', 'endpoint': '/api/analyze', 'path': '/api/analyze',
+         'body': {'symptoms': 'xxx has a fever'}},
+        {'timestamp': 3, 'method': 'POST', 'endpoint': '/api/analyze', 'path': '/api/analyze', 'body': {}},
+    ]
+    capture = tmp_path / 'capture-test.jsonl'
+    capture.write_text(''.join(json.dumps(entry) + '\n' for entry in entries), encoding='utf-8')
+    output = tmp_path / 'results.json'
+
+    argv = ['run', str(capture), '--target', url, '--rate', '300', '--duration', '0.3', '--warmup', '0',
+            '--concurrency', '4', '--output', str(output), '--label', 'stub']
+    assert replay.main(argv) == 0
+
+    document = json.loads(output.read_text(encoding='utf-8'))
+    assert document['meta']['label'] == 'stub' and document['meta']['captured_requests'] == 3
+    symptoms, analyze = document['results']['GET /api/symptoms'], document['results']['POST /api/analyze']
+    assert set(symptoms['statuses']) == {'304'}
+    assert set(analyze['statuses']) == {'200', '503'} and analyze['errors'] == analyze['statuses']['503']
+    assert document['results']['all']['requests'] == symptoms['requests'] + analyze['requests'] == 90
+
+    assert replay.main(['run', str(capture), '--target', 'ftp://host', '--output', str(output)]) == 2
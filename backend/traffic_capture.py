@@ -0,0 +1,225 @@
+"""
+Traffic Capture Module
+Opt-in, anonymized recording of API requests for replay against test instances
+"""
+
+from typing import Any, Callable, Dict, Optional
+import atexit
+import hashlib
+import hmac
+import json
+import logging
+import os
+import queue
+import random
+import re
+import threading
+import time
+
+from knowledge_base import KnowledgeBase
+from symptom_matcher import WORD_PATTERN
+
+
+# Routes whose requests are recorded, keyed on the Flask rule
+CAPTURE_ENDPOINTS = ('/api/analyze', '/api/tips', '/api/tips/<category>', '/api/symptoms')
+
+ADDRESS_PATTERN = re.compile(r'^0x[0-9a-fA-F]{40}$')
+
+logger = logging.getLogger('traffic_capture')
+
+
+class TrafficAnonymizer:
+    """
+    Strips identifying content from captured requests while keeping their cost.
+
+    Symptom text is lowercased, and every word that is neither part of a
+    detected symptom nor a vocabulary word is replaced by as many 'x'
+    characters. Length, word count, punctuation and the symptoms found,
+    typos included, stay the same, so the replayed text takes the same
+    matching work. Patient addresses become keyed pseudonyms: the same
+    patient maps to the same address within a capture, but addresses taken
+    from the chain cannot be hashed to find them without the key.
+    """
+
+    def __init__(self, get_knowledge_base: Callable[[], KnowledgeBase], key: bytes):
+        # Called for every request so knowledge base reloads are followed
+        self.get_knowledge_base = get_knowledge_base
+        self.key = key
+
+    def text(self, text: str) -> str:
+        matcher = self.get_knowledge_base().matcher
+        text = text.lower()
+        kept = [False] * len(text)
+        for _, start, end in matcher.scan(text):
+            kept[start:end] = [True] * (end - start)
+
+        vocabulary = matcher.vocabulary_words
+        parts = []
+        position = 0
+        for match in WORD_PATTERN.finditer(text):
+            start, end = match.span()
+            parts.append(text[position:start])
+            word = match.group()
+            parts.append(word if kept[start] or word in vocabulary else 'x' * len(word))
+            position = end
+        parts.append(text[position:])
+        return ''.join(parts)
+
+    def address(self, address: str) -> str:
+        digest = hmac.new(self.key, address.lower().encode('ascii'), hashlib.sha256).hexdigest()
+        return '0x' + digest[:40]
+
+    def category(self, category: str) -> str:
+        """Known categories are kept; anything else is free text and becomes 'unknown'"""
+        category = category.lower()
+        return category if category in self.get_knowledge_base().tips else 'unknown'
+
+    def body(self, payload: Any) -> Any:
+        """Anonymized copy of an analyze request body; other JSON values are dropped"""
+        if not isinstance(payload, dict):
+            return None
+        body = {}
+        symptoms = payload.get('symptoms')
+        if isinstance(symptoms, str):
+            body['symptoms'] = self.text(symptoms)
+        patient = payload.get('patient')
+        if isinstance(patient, str) and ADDRESS_PATTERN.match(patient):
+            body['patient'] = self.address(patient)
+        elif patient is not None:
+            # Invalid addresses still get their 400 on replay
+            body['patient'] = 'invalid'
+        return body
+
+
+class TrafficCapture:
+    """
+    Appends sampled requests to JSON Lines files for replay.py.
+
+    Requests are only queued on the request path; a background thread per
+    worker anonymizes them and writes them to its own file in directory, so
+    workers never interleave lines. When the queue is full, requests are
+    dropped rather than slowing responses down, and a worker stops writing
+    once its file reaches max_bytes.
+    """
+
+    def __init__(self, directory: str, anonymizer: TrafficAnonymizer, sample_rate: float = 1.0,
+                 max_bytes: int = 100 * 1024 ** 2, queue_size: int = 10000):
+        self.directory = directory
+        self.anonymizer = anonymizer
+        self.sample_rate = sample_rate
+        self.max_bytes = max_bytes
+        self.queue_size = queue_size
+        self.recorded = 0
+        self.dropped = 0
+        self.bytes_written = 0
+        self._pid = None
+        self._queue: Optional[queue.Queue] = None
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        atexit.register(self.close)
+
+    def record(self, method: str, endpoint: str, path: str, payload: Any, status: int,
+               conditional: bool = False) -> None:
+        """
+        Queue one request for capture; cheap enough to call from every request
+
+        Args:
+            method: HTTP method
+            endpoint: Route rule, e.g. '/api/tips/<category>'
+            path: Request path
+            payload: Parsed JSON body, or None
+            status: Response status code
+            conditional: Whether the request carried If-None-Match
+        """
+        if endpoint not in CAPTURE_ENDPOINTS:
+            return
+        if self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return
+
+        request_queue = self._queue if self._pid == os.getpid() else self._start()
+        try:
+            request_queue.put_nowait((time.time(), method, endpoint, path, payload, status, conditional))
+        except queue.Full:
+            self.dropped += 1
+
+    def _start(self) -> queue.Queue:
+        """Start the writer of this process; a forked worker gets its own"""
+        with self._start_lock:
+            if self._pid != os.getpid():
+                self._queue = queue.Queue(maxsize=self.queue_size)
+                self.recorded = self.dropped = self.bytes_written = 0
+                path = os.path.join(
+                    self.directory, f'capture-{time.strftime("%Y%m%dT%H%M%S", time.gmtime())}-{os.getpid()}.jsonl'
+                )
+                self._thread = threading.Thread(
+                    target=self._write, args=(self._queue, path), name='traffic-capture', daemon=True
+                )
+                self._thread.start()
+                self._pid = os.getpid()
+            return self._queue
+
+    def _write(self, request_queue: queue.Queue, path: str) -> None:
+        try:
+            f = open(path, 'a', encoding='utf-8')
+        except OSError as e:
+            logger.warning(f"Traffic capture disabled, cannot open {path}: {e}")
+            return
+
+        with f:
+            while True:
+                item = request_queue.get()
+                while item is not None:
+                    if self.bytes_written < self.max_bytes:
+                        try:
+                            line = json.dumps(self._entry(*item), separators=(',', ':')) + '\n'
+                            f.write(line)
+                            self.bytes_written += len(line)
+                            self.recorded += 1
+                        except (OSError, ValueError) as e:
+                            logger.warning(f"Could not capture request: {e}")
+                            self.dropped += 1
+                    else:
+                        self.dropped += 1
+                    try:
+                        item = request_queue.get_nowait()
+                    except queue.Empty:
+                        break
+                f.flush()
+                if item is None:
+                    return
+
+    def _entry(self, timestamp: float, method: str, endpoint: str, path: str, payload: Any, status: int,
+               conditional: bool) -> Dict[str, Any]:
+        if endpoint == '/api/tips/<category>':
+            path = '/api/tips/' + self.anonymizer.category(path.rsplit('/', 1)[1])
+        entry = {
+            'timestamp': round(timestamp, 6),
+            'method': method,
+            'endpoint': endpoint,
+            'path': path,
+            'status': status
+        }
+        if method == 'POST':
+            entry['body'] = self.anonymizer.body(payload)
+        if conditional:
+            entry['conditional'] = True
+        return entry
+
+    def close(self) -> None:
+        """Write out what is queued; called at exit"""
+        if self._pid != os.getpid() or self._queue is None:
+            return
+        try:
+            self._queue.put(None, timeout=1)
+        except queue.Full:
+            return
+        self._thread.join(timeout=5)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'recorded': self.recorded,
+            'dropped': self.dropped,
+            'bytes': self.bytes_written
+        }
+